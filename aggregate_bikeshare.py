@@ -0,0 +1,383 @@
+import calendar
+import pandas as pd
+import numpy as np
+from sketch_bikeshare import compact, certain_mode
+from duration_bikeshare import duration_buckets, group_sketches
+from cohort_bikeshare import AGE_BANDS, cohort_partials, cohort_table
+
+"""
+Aggregation engine
+
+TripAggregates computes every statistic shown by StatisticsBikeshare in one
+pass over the columns of a (filtered) trips frame: each column is read once
+and each grouping is computed once. The print methods only render the result.
+
+The counts are exact by default. With a capacity, the station and trip counts
+(the only ones whose size grows with the data) are kept as bounded Misra-Gries
+summaries (see sketch_bikeshare) and errors records their error bounds.
+The duration distribution is kept as mergeable log-bucket counts (see
+duration_bikeshare).
+----------------------------------------
+"""
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# counts summarized when a capacity is set
+SKETCHED = ['start_station', 'end_station', 'trip']
+
+
+def value_counts(col):
+    """Counts of the non-missing values of col, sorted by value."""
+    counts = col.value_counts(sort=False, dropna=True)
+    counts = counts[counts > 0]
+    if isinstance(counts.index, pd.CategoricalIndex):
+        counts.index = counts.index.astype(object)
+    counts = counts.sort_index()
+    counts.index.name = col.name
+    return counts.rename(col.name)
+
+
+def encode_stations(start, end):
+    """
+    Dictionary-encodes start and end station names into one shared set of integer ids.
+
+    Returns:
+        (ndarray) start_ids, end_ids    - station id of every row (-1 for missing names),
+
+        (Index) names                   - station name of every id
+    """
+    if isinstance(start.dtype, pd.CategoricalDtype) and isinstance(end.dtype, pd.CategoricalDtype) \
+            and start.cat.categories.equals(end.cat.categories):
+        # cached frames already share one category list for both columns
+        return start.cat.codes.to_numpy(), end.cat.codes.to_numpy(), pd.Index(start.cat.categories.astype(object))
+    ids, names = pd.factorize(pd.concat([start.astype(object), end.astype(object)], ignore_index=True))
+    return ids[:len(start)], ids[len(start):], pd.Index(names)
+
+
+def count_pairs(start_ids, end_ids, n_stations):
+    """
+    Counts (start id, end id) pairs on a packed int64 key.
+
+    Returns the packed keys that occur and their counts; key = start_id * n_stations + end_id.
+    """
+    valid = (start_ids >= 0) & (end_ids >= 0)
+    keys = start_ids[valid].astype('int64') * n_stations + end_ids[valid]
+    if n_stations * n_stations <= 16 * max(len(keys), 1 << 16):
+        # dense 2-D bincount when the station x station table is small enough
+        counts = np.bincount(keys, minlength=n_stations * n_stations)
+        keys = np.flatnonzero(counts)
+        return keys, counts[keys]
+    return np.unique(keys, return_counts=True)
+
+
+def station_counts(ids, names, name):
+    """Counts of the station ids, decoded to a Series indexed by the used station names."""
+    counts = np.bincount(ids[ids >= 0], minlength=len(names))
+    used = np.flatnonzero(counts)
+    return pd.Series(counts[used], index=pd.Index(names[used], name=name), name=name).sort_index()
+
+
+def add_partials(a, b):
+    """Adds two count Series (or sum/count DataFrames), treating a missing side as empty."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    merged = a.add(b, fill_value=0)
+    return merged.astype(np.result_type(a.to_numpy().dtype, b.to_numpy().dtype) if merged.ndim == 1 else a.dtypes.to_dict())
+
+
+def to_builtin(value):
+    """Converts numpy/pandas scalars (and missing values) to plain Python values for JSON."""
+    if value is None or (np.ndim(value) == 0 and pd.isna(value)):
+        return None
+    if isinstance(value, tuple):
+        return [to_builtin(v) for v in value]
+    return value.item() if hasattr(value, 'item') else value
+
+
+def series_records(series):
+    """Converts a Series into a list of {index level: value, ..., series name: value} records."""
+    if series is None:
+        return None
+    return [{k: to_builtin(v) for k, v in record.items()} for record in series.reset_index().to_dict('records')]
+
+
+def frame_records(df):
+    """Converts a DataFrame into a list of {column: value} records."""
+    if df is None:
+        return None
+    return [{k: to_builtin(v) for k, v in record.items()} for record in df.to_dict('records')]
+
+
+def mode(counts):
+    """Most common value of a counts Series (the smallest one on ties, like Series.mode()[0])."""
+    if counts is None or not counts.any():
+        return None
+    counts = counts.sort_index()
+    return counts.index[np.argmax(counts.to_numpy())]
+
+
+class TripAggregates:
+    """
+    Counts, sums and group partials of a trips frame.
+
+    Attributes (None when the frame lacks the needed columns):
+        (int) rows                          - number of trips,
+
+        (Series) hour, month, weekday       - trip counts by start hour, month number and day name,
+
+        (Series) start_station, end_station - trip counts by station,
+
+        (Series) trip                       - trip counts by (Start Station, End Station),
+
+        (float) duration_sum                - total trip duration in seconds,
+
+        (int) duration_count                - number of trips with a duration,
+
+        (Series) user_type, gender          - trip counts by user type and gender,
+
+        (Series) birth_year                 - trip counts by birth year,
+
+        (DataFrame) age_month               - duration 'sum' and 'count' by (Age, Month),
+
+        (DataFrame) gender_month            - duration 'sum' and 'count' by (Gender, Month),
+
+        (DataFrame) cohorts                 - duration 'sum' and 'count' by (Age, Month, Gender, Bucket), see cohort_bikeshare,
+
+        (Series) durations                  - trip counts by (Group, Value, duration Bucket), see duration_bikeshare,
+
+        (int) capacity                      - values kept per SKETCHED count (None when the counts are exact),
+
+        (dict) errors                       - SKETCHED name -> bound of the error of its counts
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.hour = self.month = self.weekday = None
+        self.start_station = self.end_station = self.trip = None
+        self.duration_sum = self.duration_count = None
+        self.user_type = self.gender = self.birth_year = None
+        self.age_month = self.gender_month = None
+        self.cohorts = None
+        self.durations = None
+        self.capacity = None
+        self.errors = {}
+
+    @classmethod
+    def from_frame(cls, df, capacity=None, city=None):
+        """
+        Aggregates a trips frame (as built by StatisticsBikeshare.load_city), summarizing the SKETCHED counts if capacity is set.
+
+        With city, the frame holds the trips of that city, which the duration distribution is broken down by.
+        """
+        agg = cls()
+        agg.rows = len(df)
+        columns = set(df.columns)
+
+        if 'Start Time' in columns:
+            start_time = df['Start Time']
+            agg.hour = pd.Series(np.bincount(start_time.dt.hour.to_numpy(), minlength=24), name='Hour').rename_axis('Hour')
+            month = df['Month'] if 'Month' in columns else start_time.dt.month
+            agg.month = pd.Series(np.bincount(np.asarray(month, dtype='int64'), minlength=13)[1:], index=range(1, 13), name='Month').rename_axis('Month')
+        if 'Day of week' in columns:
+            agg.weekday = value_counts(df['Day of week']).reindex(WEEKDAYS, fill_value=0)
+
+        if 'Start Station' in columns and 'End Station' in columns:
+            # stations are encoded to integer ids once; names are decoded only for the counted values
+            start_ids, end_ids, names = encode_stations(df['Start Station'], df['End Station'])
+            agg.start_station = station_counts(start_ids, names, 'Start Station')
+            agg.end_station = station_counts(end_ids, names, 'End Station')
+            keys, counts = count_pairs(start_ids, end_ids, len(names))
+            index = pd.MultiIndex.from_arrays([names[keys // len(names)], names[keys % len(names)]], names=['Start Station', 'End Station'])
+            agg.trip = pd.Series(counts, index=index, name='Trip').sort_index()
+        elif 'Start Station' in columns:
+            agg.start_station = value_counts(df['Start Station'])
+        elif 'End Station' in columns:
+            agg.end_station = value_counts(df['End Station'])
+
+        if 'Trip Duration' in columns:
+            # durations may be stored as float32; they are summed in float64
+            duration = df['Trip Duration'].astype('float64')
+            agg.duration_sum = float(duration.sum())
+            agg.duration_count = int(duration.count())
+            agg.durations = duration_buckets(df, city=city)
+
+        if 'User Type' in columns:
+            agg.user_type = value_counts(df['User Type'])
+        if 'Gender' in columns:
+            agg.gender = value_counts(df['Gender'])
+        if 'Birth Year' in columns:
+            agg.birth_year = value_counts(df['Birth Year'])
+
+        if 'Trip Duration' in columns and 'Month' in columns:
+            if 'Age' in columns:
+                agg.age_month = duration.groupby([df['Age'], df['Month']], observed=True, sort=True).agg(['sum', 'count'])
+                agg.cohorts = cohort_partials(df)
+            if 'Gender' in columns:
+                agg.gender_month = duration.groupby([df['Gender'], df['Month']], observed=True, sort=True).agg(['sum', 'count'])
+        return agg.sketch(capacity) if capacity else agg
+
+    def sketch(self, capacity):
+        """Keeps at most capacity values per SKETCHED count (in place) and returns self."""
+        self.capacity = capacity if self.capacity is None else min(self.capacity, capacity)
+        for name in SKETCHED:
+            counts, deducted = compact(getattr(self, name), self.capacity)
+            setattr(self, name, counts)
+            self.errors[name] = self.errors.get(name, 0) + deducted
+        return self
+
+    def merge(self, other):
+        """Returns the aggregates of the union of the trips behind self and other (summarized if either one is)."""
+        agg = TripAggregates()
+        agg.rows = self.rows + other.rows
+        for name in ('hour', 'month', 'start_station', 'end_station', 'trip', 'user_type', 'gender', 'birth_year', 'age_month', 'gender_month', 'cohorts', 'durations'):
+            setattr(agg, name, add_partials(getattr(self, name), getattr(other, name)))
+        agg.weekday = add_partials(self.weekday, other.weekday)
+        if agg.weekday is not None:
+            agg.weekday = agg.weekday.reindex(WEEKDAYS, fill_value=0)
+        if self.duration_sum is None or other.duration_sum is None:
+            agg.duration_sum = self.duration_sum if other.duration_sum is None else other.duration_sum
+            agg.duration_count = self.duration_count if other.duration_count is None else other.duration_count
+        else:
+            agg.duration_sum = self.duration_sum + other.duration_sum
+            agg.duration_count = self.duration_count + other.duration_count
+
+        capacities = [c for c in (self.capacity, other.capacity) if c is not None]
+        if capacities:
+            agg.errors = {name: self.errors.get(name, 0) + other.errors.get(name, 0) for name in SKETCHED}
+            agg.sketch(min(capacities))
+        return agg
+
+    @classmethod
+    def merge_all(cls, partials):
+        """Merges an iterable of partial aggregates into one."""
+        agg = cls()
+        for partial in partials:
+            agg = agg.merge(partial)
+        return agg
+
+    def to_dict(self, age_bands=None):
+        """Summary of every printed statistic as a JSON-serializable dict (with the age cohorts of age_bands, see cohort_table)."""
+        month = self.most_common_month()
+        summary = {
+            'rows': self.rows,
+            'most_common_hour': to_builtin(self.most_common_hour()),
+            'most_common_month': calendar.month_name[month] if month is not None else None,
+            'most_common_day': to_builtin(self.most_common_day()),
+            'most_common_start_station': to_builtin(self.most_common_start_station()),
+            'most_common_end_station': to_builtin(self.most_common_end_station()),
+            'most_common_trip': to_builtin(self.most_common_trip()),
+            'total_duration': to_builtin(self.total_duration()),
+            'mean_duration': to_builtin(self.mean_duration()),
+            'user_types': None if self.user_type is None else {str(k): int(v) for k, v in self.user_type.items()},
+            'genders': None if self.gender is None else {str(k): int(v) for k, v in self.gender.items()},
+            'earliest_birth_year': to_builtin(self.earliest_birth_year()),
+            'most_recent_birth_year': to_builtin(self.most_recent_birth_year()),
+            'most_common_birth_year': to_builtin(self.most_common_birth_year()),
+            'age_month_mean': series_records(self.age_month_mean()),
+            'gender_month_mean': series_records(self.gender_month_mean()),
+            'age_cohorts': frame_records(self.cohort_table(age_bands)),
+            'duration_distribution': self.duration_distribution(),
+        }
+        if self.capacity is not None:
+            summary['approximate'] = {'capacity': self.capacity, 'max_error': dict(self.errors),
+                                      'certain_mode': {name: certain_mode(getattr(self, name), self.errors[name]) for name in SKETCHED}}
+        return summary
+
+    def most_common_hour(self):
+        return mode(self.hour)
+
+    def most_common_month(self):
+        return mode(self.month)
+
+    def most_common_day(self):
+        return mode(self.weekday)
+
+    def most_common_start_station(self):
+        return mode(self.start_station)
+
+    def most_common_end_station(self):
+        return mode(self.end_station)
+
+    def most_common_trip(self):
+        """(start station, end station) of the most frequent trip."""
+        return mode(self.trip)
+
+    def top_trips(self, n=10):
+        """The n most frequent (Start Station, End Station) trips with their counts, most frequent first."""
+        if self.trip is None:
+            return None
+        return self.trip.sort_values(ascending=False, kind='stable').head(n)
+
+    def od_matrix(self):
+        """
+        Full origin-destination count matrix.
+
+        Returns:
+            DataFrame with one row per start station, one column per end station
+            and the number of trips between them (0 where there were none)
+        """
+        if self.trip is None:
+            return None
+        stations = self.trip.index.levels[0].union(self.trip.index.levels[1]).sort_values()
+        start = stations.get_indexer(self.trip.index.get_level_values(0))
+        end = stations.get_indexer(self.trip.index.get_level_values(1))
+        matrix = np.zeros((len(stations), len(stations)), dtype='int64')
+        np.add.at(matrix, (start, end), self.trip.to_numpy())
+        return pd.DataFrame(matrix, index=stations.rename('Start Station'), columns=stations.rename('End Station'))
+
+    def total_duration(self):
+        return self.duration_sum
+
+    def mean_duration(self):
+        if not self.duration_count:
+            return None
+        return self.duration_sum / self.duration_count
+
+    def duration_sketches(self):
+        """{'All': DurationSketch, 'User Type' / 'Gender' / 'City': {value: DurationSketch}} of the trip durations."""
+        return group_sketches(self.durations)
+
+    def duration_distribution(self):
+        """Percentiles, outliers and histogram of the durations, overall and by user type, gender and city (None without durations)."""
+        sketches = self.duration_sketches()
+        if 'All' not in sketches:
+            return None
+        return {group: sketch.to_dict() if group == 'All' else {str(value): s.to_dict() for value, s in sketch.items()}
+                for group, sketch in sketches.items()}
+
+    def earliest_birth_year(self):
+        return self.birth_year.index.min() if self.birth_year is not None and len(self.birth_year) else None
+
+    def most_recent_birth_year(self):
+        return self.birth_year.index.max() if self.birth_year is not None and len(self.birth_year) else None
+
+    def most_common_birth_year(self):
+        return mode(self.birth_year)
+
+    def age_month_mean(self):
+        """Average trip duration by (Age, Month)."""
+        return self.group_mean(self.age_month)
+
+    def gender_month_mean(self):
+        """Average trip duration by (Gender, Month)."""
+        return self.group_mean(self.gender_month)
+
+    def cohort_table(self, bands=None):
+        """
+        Trips, total, mean and median duration by (age band, month, gender) (see cohort_bikeshare.cohort_table).
+
+        Aggregates without cohort partials (eg. the cube's) give the table of their (Age, Month) partials, without
+        genders and medians; None without ages.
+        """
+        partials = self.cohorts if self.cohorts is not None else self.age_month
+        if partials is None or not len(partials):
+            return None
+        return cohort_table(partials, AGE_BANDS if bands is None else bands)
+
+    def group_mean(self, group):
+        if group is None:
+            return None
+        group = group[group['count'] > 0]
+        return (group['sum'] / group['count']).rename('Trip Duration')
@@ -0,0 +1,258 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+import contextlib
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import matplotlib
+from statistics_bikeshare import StatisticsBikeshare
+from synthetic_bikeshare import write_city_data
+
+"""
+Benchmark suite
+
+Times load_data, the aggregation pass and every stats method on synthetic city
+data of growing size and records the peak memory of each stage. Every load is
+measured three ways: straight from the CSVs, while building the columnar cache
+and from the warm cache. Peak memory is traced in a separate pass, so tracing
+does not distort the timings. Results are written as JSON so runs of different
+versions can be compared:
+
+    python benchmark_bikeshare.py --sizes 1e5 1e6 --output new.json --compare old.json
+
+The load test generates the synthetic data in parallel and runs the whole
+headless pipeline (run_batch) in every pipeline mode, from the CSVs and from
+the warm cache, reporting the throughput in rows per second:
+
+    python benchmark_bikeshare.py --load-test --sizes 1e7 1e8 --workers 8 --partitioned
+
+The startup benchmark times importing statistics_bikeshare and validating
+filters in fresh interpreters, and records which heavy modules got imported:
+
+    python benchmark_bikeshare.py --startup
+----------------------------------------
+"""
+
+STATS_STAGES = ['aggregate', 'time_stats', 'station_stats', 'trip_duration_stats', 'user_stats']
+
+LOAD_MODES = ['csv', 'cache build', 'cached']
+
+# pipeline modes of the load test: name -> StatisticsBikeshare settings (workers=True: one worker per CPU)
+LOAD_TEST_PIPELINES = {'load': {}, 'stream': {'streaming': True}, 'parallel': {'workers': True}}
+
+LOAD_TEST_SOURCES = ['csv', 'cached']
+
+# modules the prompts and the filter validation must not import
+HEAVY_MODULES = ['pandas', 'numpy', 'matplotlib']
+
+# run in a fresh interpreter by measure_startup; prints the timings as JSON
+STARTUP_SCRIPT = '''
+import sys, json, time
+start = time.perf_counter()
+from statistics_bikeshare import StatisticsBikeshare
+imported = time.perf_counter()
+bike_stat = StatisticsBikeshare()
+bike_stat.parse_cities(['a'])
+bike_stat.parse_months(['1', '2'])
+bike_stat.parse_days(['wdays', 'su'])
+validated = time.perf_counter()
+print(json.dumps({'import_seconds': imported - start, 'validate_seconds': validated - imported,
+                  'heavy_modules': sorted(m for m in %r if m in sys.modules)}))
+''' % HEAVY_MODULES
+
+
+def measure(fn, trace_memory=True):
+    """Runs fn and returns (seconds, peak traced bytes or None)."""
+    if trace_memory:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        fn()
+        return time.perf_counter() - start, tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+
+def measure_startup(repeat=5):
+    """
+    Times the startup of the command line in repeat fresh interpreters.
+
+    Returns:
+        (dict) startup  - best import and validation seconds, and the heavy modules they imported
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=directory, check=True, stdout=subprocess.PIPE).stdout
+        runs.append(json.loads(output))
+    return {'import_seconds': min(r['import_seconds'] for r in runs), 'validate_seconds': min(r['validate_seconds'] for r in runs),
+            'heavy_modules': runs[-1]['heavy_modules'], 'repeat': repeat}
+
+
+def run_size(city_data, cache_dir, trace_memory=True):
+    """
+    Runs the pipeline on one data set in every load mode.
+
+    Timings come from an untraced pass; with trace_memory a second, traced pass records the peak memory of each stage.
+
+    Returns:
+        list of (mode, stage, seconds, peak bytes or None) tuples
+    """
+    bike_stat = StatisticsBikeshare()
+    bike_stat.CITY_DATA = city_data
+    bike_stat.bulk = True
+    bike_stat.headless = True
+    cities = set(city_data)
+    months = set(bike_stat.months_num)
+    days = set(bike_stat.week_days.values())
+
+    passes = [False, True] if trace_memory else [False]
+    measured = {}
+    for traced in passes:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        for mode in LOAD_MODES:
+            bike_stat.cache_dir = None if mode == 'csv' else cache_dir
+            with contextlib.redirect_stdout(io.StringIO()):
+                measured[traced, mode, 'load_data'] = measure(lambda: bike_stat.load_tables(cities, months, days), traced)
+                for stage in STATS_STAGES:
+                    measured[traced, mode, stage] = measure(getattr(bike_stat, stage), traced)
+
+    return [(mode, stage, measured[False, mode, stage][0], measured[True, mode, stage][1] if trace_memory else None)
+            for mode in LOAD_MODES for stage in ['load_data'] + STATS_STAGES]
+
+
+def run_benchmarks(sizes, work_dir, cities=None, seed=0, trace_memory=True):
+    """
+    Benchmarks every size (rows per city) and returns the JSON-serializable report.
+
+    Synthetic CSVs are written to work_dir/rows-<n> once and reused by later runs.
+    """
+    matplotlib.use('Agg')
+    results = []
+    for n in sizes:
+        data_dir = os.path.join(work_dir, 'rows-{}'.format(n))
+        city_data = write_city_data(data_dir, n, seed, cities)
+        for mode, stage, seconds, peak in run_size(city_data, os.path.join(data_dir, 'cache'), trace_memory):
+            results.append({'rows_per_city': n, 'rows': n * len(city_data), 'mode': mode, 'stage': stage,
+                            'seconds': seconds, 'peak_bytes': peak, 'rows_per_second': n * len(city_data) / seconds if seconds else None})
+            print('{:>11} rows  {:<12} {:<20} {:9.3f} s  {}'.format(n * len(city_data), mode, stage, seconds,
+                  '' if peak is None else '{:9.1f} MB peak'.format(peak / 2**20)), file=sys.stderr)
+    return {'created': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'pandas': pd.__version__, 'numpy': np.__version__, 'cities': sorted(cities or city_data), 'seed': seed, 'results': results}
+
+
+def load_test(city_data, cache_dir, workers=None):
+    """
+    Runs the whole headless pipeline (see StatisticsBikeshare.run_batch) on one data set in every pipeline mode.
+
+    The result cache is disabled; the 'cached' runs read the columnar cache, which is built beforehand (untimed).
+
+    Returns:
+        list of (source, pipeline, seconds, rows scanned) tuples
+    """
+    cities = set(city_data)
+    measured = []
+    for source in LOAD_TEST_SOURCES:
+        for pipeline, settings in LOAD_TEST_PIPELINES.items():
+            bike_stat = StatisticsBikeshare()
+            bike_stat.CITY_DATA = city_data
+            bike_stat.memo = False
+            bike_stat.cache_dir = None if source == 'csv' else cache_dir
+            for name, value in settings.items():
+                setattr(bike_stat, name, (workers or os.cpu_count()) if value is True else value)
+            with contextlib.redirect_stdout(io.StringIO()):
+                if source == 'cached':
+                    for city in sorted(cities):
+                        bike_stat.read_city(city)
+                start = time.perf_counter()
+                results = bike_stat.run_batch(cities, set(bike_stat.months_num), set(bike_stat.week_days.values()))
+                seconds = time.perf_counter() - start
+            measured.append((source, pipeline, seconds, sum(counts['scanned'] for counts in results['scan_counts'].values())))
+    return measured
+
+
+def run_load_test(sizes, work_dir, cities=None, seed=0, workers=None, partitioned=False):
+    """
+    Load-tests every size (rows per city) and returns the JSON-serializable report.
+
+    The synthetic data is generated by workers processes (see synthetic_bikeshare.write_city_data) into
+    work_dir/rows-<n> once; every pipeline run is reported like a benchmark stage ('pipeline:<mode>').
+    """
+    matplotlib.use('Agg')
+    results = []
+    generated = []
+    for n in sizes:
+        data_dir = os.path.join(work_dir, 'rows-{}'.format(n) + ('-partitioned' if partitioned else ''))
+        start = time.perf_counter()
+        city_data = write_city_data(data_dir, n, seed, cities, workers, partitioned)
+        generated.append({'rows_per_city': n, 'seconds': time.perf_counter() - start})
+        for source, pipeline, seconds, rows in load_test(city_data, os.path.join(data_dir, 'cache'), workers):
+            results.append({'rows_per_city': n, 'rows': rows, 'mode': source, 'stage': 'pipeline:' + pipeline,
+                            'seconds': seconds, 'peak_bytes': None, 'rows_per_second': rows / seconds if seconds else None})
+            print('{:>11} rows  {:<12} {:<20} {:9.3f} s  {:12,.0f} rows/s'.format(rows, source, pipeline, seconds, results[-1]['rows_per_second'] or 0),
+                  file=sys.stderr)
+    return {'created': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'pandas': pd.__version__, 'numpy': np.__version__, 'cpus': os.cpu_count(), 'workers': workers or os.cpu_count(),
+            'cities': sorted(cities or city_data), 'seed': seed, 'generated': generated, 'results': results}
+
+
+def compare(old, new):
+    """Returns the new/old time ratio of every (rows, mode, stage) present in both reports."""
+    old_seconds = {(r['rows'], r['mode'], r['stage']): r['seconds'] for r in old['results']}
+    return {key: r['seconds'] / old_seconds[key] for r in new['results']
+            for key in [(r['rows'], r['mode'], r['stage'])] if old_seconds.get(key)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the bikeshare statistics on synthetic data.')
+    parser.add_argument('--sizes', nargs='+', default=['1e5', '1e6'], help='rows per city, eg. 1e5 1e6 1e7 1e8 (default: 1e5 1e6)')
+    parser.add_argument('--cities', nargs='+', choices=['chicago', 'new york city', 'washington'], help='cities to generate (default: all)')
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'bikeshare_benchmark'), help='directory of the synthetic data')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced pass that records the peak memory of each stage')
+    parser.add_argument('--output', metavar='PATH', help='file the JSON report is written to (default: stdout)')
+    parser.add_argument('--compare', metavar='PATH', help='earlier JSON report to compare the timings with')
+    parser.add_argument('--startup', action='store_true', help='only measure the startup (import and filter validation) time')
+    parser.add_argument('--load-test', action='store_true', help='time the whole headless pipeline in every mode and report rows/s')
+    parser.add_argument('--workers', type=int, help='processes generating the data and running the parallel pipeline (default: one per CPU)')
+    parser.add_argument('--partitioned', action='store_true', help='generate every city as a directory of partition files')
+    args = parser.parse_args(argv)
+
+    startup = measure_startup()
+    print('startup  import {:.1f} ms  validation {:.2f} ms  heavy modules: {}'.format(
+          startup['import_seconds'] * 1000, startup['validate_seconds'] * 1000, ', '.join(startup['heavy_modules']) or 'none'), file=sys.stderr)
+    if args.startup:
+        report = {'created': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(), 'startup': startup, 'results': []}
+    elif args.load_test:
+        report = run_load_test([int(float(n)) for n in args.sizes], args.work_dir, args.cities, args.seed, args.workers, args.partitioned)
+        report['startup'] = startup
+    else:
+        report = run_benchmarks([int(float(n)) for n in args.sizes], args.work_dir, args.cities, args.seed, not args.no_memory)
+        report['startup'] = startup
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            ratios = compare(json.load(f), report)
+        for (rows, mode, stage), ratio in sorted(ratios.items()):
+            print('{:>11} rows  {:<12} {:<20} x{:.2f}{}'.format(rows, mode, stage, ratio, '  <- slower' if ratio > 1.1 else ''), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+from cache_bikeshare import concat_frames
+
+"""
+Lazy row browser
+
+RowBrowser is a cursor over a source of row chunks (for example the filtered
+chunks streamed from a city CSV or its memory-mapped cache). Pages are cut
+from the chunk that holds them, so only one chunk is in memory at a time and
+no page depends on the previous ones: browsing any number of pages uses
+constant memory and stack.
+----------------------------------------
+"""
+
+
+class RowBrowser:
+    """
+    Cursor over the rows of a chunked source.
+
+    Parameters:
+        (callable) chunks   - returns a fresh iterator of DataFrame chunks (called again to seek backwards),
+
+        (int) page_size     - rows per page
+    """
+
+    def __init__(self, chunks, page_size=5):
+        if page_size < 1:
+            raise ValueError('page_size must be positive')
+        self.chunks = chunks
+        self.page_size = page_size
+        self.offset = 0
+        self.restart()
+
+    def restart(self):
+        """Starts reading the source again from its first row."""
+        self._iter = iter(self.chunks())
+        self._chunk = None
+        self._chunk_start = 0
+
+    def seek(self, offset):
+        """Moves the cursor to row offset (0-based)."""
+        if offset < 0:
+            raise ValueError('offset must not be negative')
+        self.offset = offset
+
+    def page(self, offset=None):
+        """Returns the rows [offset, offset + page_size) without moving the cursor (fewer rows at the end)."""
+        start = self.offset if offset is None else offset
+        stop = start + self.page_size
+        if start < self._chunk_start:
+            self.restart()
+
+        parts = []
+        while True:
+            if self._chunk is None:
+                self._chunk = next(self._iter, None)
+                if self._chunk is None:
+                    break
+            chunk_stop = self._chunk_start + len(self._chunk)
+            if start < chunk_stop:
+                parts.append(self._chunk.iloc[max(start - self._chunk_start, 0):stop - self._chunk_start])
+            if stop <= chunk_stop:
+                break
+            # the page continues in the next chunk; this one is no longer needed
+            self._chunk_start = chunk_stop
+            self._chunk = None
+
+        page = concat_frames(parts)
+        page.index = range(start, start + len(page))
+        return page
+
+    def next_page(self):
+        """Returns the page at the cursor and moves the cursor past it."""
+        page = self.page()
+        self.offset += len(page)
+        return page
+
+    def __iter__(self):
+        """Yields the remaining pages from the cursor on."""
+        while True:
+            page = self.next_page()
+            if page.empty:
+                return
+            yield page
@@ -0,0 +1,297 @@
+import os
+import json
+import shutil
+import hashlib
+import pandas as pd
+import numpy as np
+from trace_bikeshare import stage
+from timeindex_bikeshare import TimeFilter, TimeIndex
+
+"""
+Columnar on-disk cache for the city CSVs
+
+The first load of a city CSV parses it, adds the derived columns and stores
+every column as its own .npy file next to a small meta.json:
+    - datetime columns as datetime64[ns]
+    - numeric columns with their native dtype
+    - text columns (stations, user type, gender, ...) as integer category codes
+    - Month and Day of week as int8 codes, Trip Duration as float32
+
+The rows are stored sorted by Start Time, so the memory-mapped frame is a
+TimeIndex: scans find the rows of a filter by binary search and slice them out.
+Later loads memory-map those files and skip CSV parsing completely. Entries are
+keyed by the source file's path, size and mtime, so editing or replacing the
+CSV invalidates its entry automatically.
+----------------------------------------
+"""
+
+CACHE_VERSION = 4
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# columns parsed to datetime64 before caching
+DATETIME_COLUMNS = ['Start Time', 'End Time']
+
+# text columns stored as categoricals; the columns of a group share one category list (so their codes are comparable)
+CATEGORY_GROUPS = [('Start Station', 'End Station'), ('User Type',), ('Gender',)]
+
+
+def parse_frame(df):
+    """
+    Parses the datetime columns of a raw CSV frame and adds the Month and Day of week columns.
+
+    Rows without a Start Time match no month or day filter, so they are dropped (as scan_csv does).
+    """
+    for col in DATETIME_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+
+    if 'Start Time' in df.columns:
+        if df['Start Time'].isna().any():
+            df = df[df['Start Time'].notna()].reset_index(drop=True)
+        # extract Month and Day of week from Start Time as int8 codes
+        df['Month'] = df['Start Time'].dt.month.astype('int8')
+        df['Day of week'] = pd.Categorical.from_codes(df['Start Time'].dt.weekday.astype('int8'), WEEKDAYS)
+    return df
+
+
+def parse_csv(path):
+    """Reads a city CSV and adds the Month and Day of week columns."""
+    return parse_frame(pd.read_csv(path))
+
+
+def scan_csv(path, months, days, chunksize=100000, counts=None, tracer=None, where=None):
+    """
+    Streams a city CSV in chunks and yields only the rows matching months and days.
+
+    The Start Time column of every chunk is parsed first and used to drop the
+    non-matching rows, so the rest of the parsing (and the memory held by the
+    caller) only covers the kept rows.
+
+    Parameters:
+        (str) path          - CSV file to read,
+
+        (set) months        - numbers of the months to keep,
+
+        (set) days          - names of the days to keep,
+
+        (int) chunksize     - rows parsed at once,
+
+        (dict) counts       - optional dict whose 'scanned' and 'kept' entries are incremented,
+
+        (Tracer) tracer     - optional Tracer recording the read_csv, filter and parse stages of every chunk,
+
+        (TimeFilter) where  - optional date range, dates and hour windows narrowing months and days
+    """
+    if counts is None:
+        counts = {}
+    time_filter = TimeFilter.from_filters(months, days, where)
+    reader = iter(pd.read_csv(path, chunksize=chunksize))
+    while True:
+        # stages are closed before every yield, so the caller's time is not counted
+        with stage(tracer, 'read_csv') as read:
+            chunk = next(reader, None)
+            read.rows_out = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            return
+        counts['scanned'] = counts.get('scanned', 0) + len(chunk)
+        with stage(tracer, 'filter', len(chunk)) as filtered:
+            start_time = pd.to_datetime(chunk['Start Time'])
+            mask = time_filter.mask(start_time)
+            chunk = chunk[mask].copy()
+            chunk['Start Time'] = start_time[mask]
+            filtered.rows_out = len(chunk)
+        counts['kept'] = counts.get('kept', 0) + len(chunk)
+        if len(chunk):
+            with stage(tracer, 'parse', len(chunk)):
+                chunk = parse_frame(chunk)
+            yield chunk
+
+
+def harmonize_categories(frames):
+    """Gives every CATEGORY_GROUPS column of frames one shared, sorted category list (converting text columns)."""
+    for group in CATEGORY_GROUPS:
+        cols = [(df, c) for df in frames for c in group if c in df.columns]
+        if not cols:
+            continue
+        categories = pd.Index([], dtype=object)
+        for df, c in cols:
+            values = df[c].cat.categories if isinstance(df[c].dtype, pd.CategoricalDtype) else pd.unique(df[c].dropna())
+            categories = categories.union(pd.Index(values, dtype=object))
+        dtype = pd.CategoricalDtype(categories.sort_values())
+        for df, c in cols:
+            col = df[c]
+            if not isinstance(col.dtype, pd.CategoricalDtype):
+                df[c] = col.astype(dtype)
+            elif not col.cat.categories.equals(dtype.categories):
+                # remap the integer codes instead of re-encoding the values
+                mapping = dtype.categories.get_indexer(col.cat.categories)
+                codes = col.cat.codes.to_numpy()
+                df[c] = pd.Categorical.from_codes(np.where(codes >= 0, mapping[codes], -1), dtype=dtype)
+    return frames
+
+
+def compact_frame(df):
+    """
+    Converts a trips frame to the compact schema (in place):
+        - categorical stations (one shared category list), User Type and Gender
+        - int8 Month and categorical Day of week
+        - float32 Trip Duration
+    """
+    harmonize_categories([df])
+    if 'Month' in df.columns:
+        df['Month'] = df['Month'].astype('int8')
+    if 'Day of week' in df.columns and not isinstance(df['Day of week'].dtype, pd.CategoricalDtype):
+        df['Day of week'] = pd.Categorical(df['Day of week'], categories=WEEKDAYS)
+    if 'Trip Duration' in df.columns:
+        df['Trip Duration'] = df['Trip Duration'].astype('float32')
+    return df
+
+
+def concat_frames(frames):
+    """Concatenates trips frames without losing their categorical columns to object."""
+    frames = [df for df in frames if len(df.columns)]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(harmonize_categories(frames), ignore_index=True)
+
+
+def memory_footprint(df):
+    """Memory used by a frame in bytes, including the contents of object columns."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def source_key(path):
+    """Returns (path key, version key) of a source file from its path, size and mtime."""
+    st = os.stat(path)
+    path_key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12]
+    version_key = hashlib.sha1('{}:{}:{}'.format(st.st_size, st.st_mtime_ns, CACHE_VERSION).encode()).hexdigest()[:12]
+    return path_key, version_key
+
+
+class ColumnarCache:
+    """Stores parsed city frames as memory-mappable .npy columns (recording its stages on tracer, if given)."""
+
+    def __init__(self, cache_dir='.bikeshare_cache', tracer=None):
+        self.cache_dir = cache_dir
+        self.tracer = tracer
+
+    def entry_dir(self, path):
+        path_key, version_key = source_key(path)
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.cache_dir, '{}-{}-{}'.format(name, path_key, version_key))
+
+    def read(self, path, parse=parse_csv):
+        """Returns the cached frame of path, parsing and storing it first on a miss."""
+        with stage(self.tracer, 'cache_load'):
+            df = self.load(path)
+        if df is None:
+            with stage(self.tracer, 'read_csv') as read:
+                df = parse(path)
+                read.rows_out = len(df)
+            with stage(self.tracer, 'cache_store', len(df)):
+                self.store(path, df)
+            with stage(self.tracer, 'cache_load'):
+                df = self.load(path)
+        return df
+
+    def scan(self, path, months, days, chunksize=100000, counts=None, where=None, build=True):
+        """
+        Same as scan_csv, but slices the rows out of the memory-mapped (time sorted) cache entry instead of parsing the CSV.
+
+        Building an entry parses the whole file at once; without build, a file that has no entry yet is streamed with
+        scan_csv instead, so at most chunksize rows are in memory.
+        """
+        if counts is None:
+            counts = {}
+        if not build:
+            with stage(self.tracer, 'cache_load'):
+                cached = self.load(path) is not None
+            if not cached:
+                yield from scan_csv(path, months, days, chunksize, counts, self.tracer, where)
+                return
+        df = self.read(path)
+        counts['scanned'] = counts.get('scanned', 0) + len(df)
+        time_filter = TimeFilter.from_filters(months, days, where)
+        with stage(self.tracer, 'filter', len(df)) as filtered:
+            index = TimeIndex(df, assume_sorted=True)
+            filtered.rows_out = index.count(time_filter)
+        counts['kept'] = counts.get('kept', 0) + filtered.rows_out
+        for chunk in index.chunks(time_filter, chunksize):
+            yield chunk
+
+    def load(self, path):
+        """Memory-maps the cached frame of path or returns None if there is no valid entry."""
+        entry = self.entry_dir(path)
+        try:
+            with open(os.path.join(entry, 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get('version') != CACHE_VERSION:
+            return None
+
+        columns = {}
+        for col in meta['columns']:
+            arr = np.load(os.path.join(entry, col['file']), mmap_mode='r')
+            if col['kind'] == 'category':
+                columns[col['name']] = pd.Categorical.from_codes(arr, meta['categories'][col['categories']])
+            else:
+                columns[col['name']] = arr
+        return pd.DataFrame({name: columns[name] for name in meta['order']}, copy=False)
+
+    def store(self, path, df):
+        """Writes df as the cache entry of path and drops stale entries of the same file."""
+        entry = self.entry_dir(path)
+        prefix = os.path.basename(entry).rsplit('-', 1)[0] + '-'
+        tmp = entry + '.tmp{}'.format(os.getpid())
+        os.makedirs(tmp, exist_ok=True)
+
+        df = TimeIndex(compact_frame(df)).df if 'Start Time' in df.columns else compact_frame(df)
+        meta = {'version': CACHE_VERSION, 'source': os.path.abspath(path), 'rows': len(df), 'order': list(df.columns), 'columns': [], 'categories': {}}
+        shared = {col: group[0] for group in CATEGORY_GROUPS if len(group) > 1 and all(c in df.columns for c in group) for col in group}
+        for group in CATEGORY_GROUPS:
+            if group[0] in shared:
+                # compact_frame gave the whole group one category list
+                meta['categories'][group[0]] = [str(c) for c in df[group[0]].cat.categories]
+                for c in group:
+                    self.save_column(tmp, meta, c, df[c].cat.codes.to_numpy(), 'category', group[0])
+
+        for name in df.columns:
+            if name in shared:
+                continue
+            col = df[name]
+            if isinstance(col.dtype, pd.CategoricalDtype):
+                meta['categories'][name] = [str(c) for c in col.cat.categories]
+                self.save_column(tmp, meta, name, col.cat.codes.to_numpy(), 'category', name)
+            elif pd.api.types.is_datetime64_any_dtype(col.dtype) or pd.api.types.is_numeric_dtype(col.dtype):
+                self.save_column(tmp, meta, name, col.to_numpy(), 'numeric')
+            else:
+                codes, uniques = pd.factorize(col.astype(object), sort=True)
+                meta['categories'][name] = [str(u) for u in uniques]
+                self.save_column(tmp, meta, name, codes.astype(self.code_dtype(len(uniques))), 'category', name)
+
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        # drop older versions of this source (not the .tmp directories other processes are still writing) and
+        # publish the new entry
+        if os.path.isdir(self.cache_dir):
+            for other in os.listdir(self.cache_dir):
+                if other.startswith(prefix) and '.tmp' not in other and os.path.join(self.cache_dir, other) != entry:
+                    shutil.rmtree(os.path.join(self.cache_dir, other), ignore_errors=True)
+        os.replace(tmp, entry)
+
+    def save_column(self, entry, meta, name, arr, kind, categories=None):
+        col = {'name': name, 'kind': kind, 'file': 'col{}.npy'.format(len(meta['columns']))}
+        if categories is not None:
+            col['categories'] = categories
+        np.save(os.path.join(entry, col['file']), np.ascontiguousarray(arr))
+        meta['columns'].append(col)
+
+    def code_dtype(self, n_categories):
+        """Smallest signed integer dtype that holds the codes (-1 marks missing values)."""
+        for dtype in ('int8', 'int16', 'int32'):
+            if n_categories < np.iinfo(dtype).max:
+                return dtype
+        return 'int64'
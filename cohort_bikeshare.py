@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+from duration_bikeshare import bucket_ids, bucket_values
+
+"""
+Age cohorts
+
+The trips are binned into age bands by a single pd.cut over the ages (the
+bands are half-open, [low, high), so every age falls in exactly one band) and
+the trip count, mean and median duration of every (age band, month, gender)
+are computed in one grouped pass, as a tidy table the printed statistics and
+the age plot share.
+
+To stay mergeable like the other TripAggregates partials, the cohorts are kept
+as duration 'sum' and 'count' by (Age, Month, Gender, duration Bucket) (see
+duration_bikeshare): the counts and means of any banding are exact and the
+medians are read from the bucket counts, within 1% of the exact ones. Without
+buckets (eg. the (Age, Month) partials of the cube) the table has no medians.
+----------------------------------------
+"""
+
+# lower bounds of the age bands after the first one: age < 30, 30 <= age < 60, 60 <= age < 90, age >= 90
+AGE_BANDS = [30, 60, 90]
+
+# gender of the trips without one
+UNKNOWN_GENDER = 'Unknown'
+
+def band_labels(bands=AGE_BANDS):
+    """Labels of the age bands bounded by bands, eg. ['age < 30', '30 <= age < 60', ..., 'age >= 90']."""
+    return (['age < {}'.format(bands[0])] + ['{} <= age < {}'.format(low, high) for low, high in zip(bands, bands[1:])]
+            + ['age >= {}'.format(bands[-1])])
+
+
+def age_bands(ages, bands=AGE_BANDS):
+    """Ordered categorical age band of every age (missing for missing ages)."""
+    ages = pd.Series(ages).astype('float64')
+    return pd.cut(ages, [-np.inf] + list(bands) + [np.inf], right=False, labels=band_labels(bands))
+
+
+def cohort_partials(df, by=None):
+    """
+    Mergeable cohort partials of an enriched trips frame.
+
+    Parameters:
+        (DataFrame) df          - trips with Trip Duration, Month and Age columns,
+
+        (Series) by             - optional extra key (eg. the cube cell of every row), kept as the first index level
+
+    Returns:
+        (DataFrame) partials    - duration 'sum' and 'count' by ([by,] Age, Month, Gender, Bucket), None without
+                                  Trip Duration, Month or Age columns
+    """
+    if not {'Trip Duration', 'Month', 'Age'} <= set(df.columns):
+        return None
+    duration = df['Trip Duration'].astype('float64')
+    valid = (duration.notna() & df['Age'].notna()).to_numpy()
+    duration = duration[valid]
+    gender = df['Gender'][valid].astype(object).fillna(UNKNOWN_GENDER) if 'Gender' in df.columns else pd.Series(UNKNOWN_GENDER, index=duration.index)
+    keys = [] if by is None else [by[valid]]
+    keys += [df['Age'][valid].astype('int64').rename('Age'), df['Month'][valid].astype('int64').rename('Month'), gender.rename('Gender'),
+            pd.Series(bucket_ids(duration.to_numpy()), index=duration.index, name='Bucket')]
+    partials = duration.groupby(keys, sort=True).agg(['sum', 'count'])
+    partials['count'] = partials['count'].astype('int64')
+    return partials
+
+
+def cohort_table(partials, bands=AGE_BANDS):
+    """
+    Trip count, total, mean and median duration per (age band, month[, gender]) of cohort partials.
+
+    Parameters:
+        (DataFrame) partials    - duration 'sum' and 'count' indexed by Age, Month and optionally Gender and Bucket,
+
+        (list) bands            - lower bounds of the age bands after the first one
+
+    Returns:
+        (DataFrame) table       - Age Band, Month, Gender, Trips, Total Duration, Mean Duration and Median Duration
+                                  of every non-empty cohort (no Gender without a Gender level, no Median Duration
+                                  without a Bucket level)
+    """
+    names = partials.index.names
+    keys = [pd.CategoricalIndex(age_bands(partials.index.get_level_values('Age'), bands), name='Age Band'),
+            pd.Index(partials.index.get_level_values('Month'), name='Month')]
+    if 'Gender' in names:
+        keys.append(pd.Index(partials.index.get_level_values('Gender'), name='Gender'))
+
+    table = partials.groupby(keys, observed=True, sort=True).sum()
+    table = table[table['count'] > 0]
+    result = pd.DataFrame({'Trips': table['count'].astype('int64'), 'Total Duration': table['sum'],
+                           'Mean Duration': table['sum'] / table['count']})
+    if 'Bucket' in names:
+        result['Median Duration'] = cohort_medians(partials['count'], keys)
+    return result.reset_index()
+
+
+def cohort_medians(counts, keys):
+    """Median duration per cohort from the trip counts by (..., Bucket), as DurationSketch.quantiles([0.5])."""
+    bucket = pd.Index(counts.index.get_level_values('Bucket'), name='Bucket')
+    levels = list(range(len(keys)))
+    counts = counts.groupby(keys + [bucket], observed=True, sort=True).sum()
+    counts = counts[counts > 0]
+    cumulative = counts.groupby(level=levels, sort=False).cumsum()
+    total = counts.groupby(level=levels, sort=False).transform('sum')
+    # first bucket whose cumulative count passes the median rank
+    first = counts[cumulative > 0.5 * (total - 1)].groupby(level=levels, sort=False).head(1)
+    return pd.Series(bucket_values(first.index.get_level_values('Bucket').to_numpy()), index=first.index.droplevel('Bucket'))
+
+
+def band_month_means(table):
+    """Mean duration per (Age Band, Month) of a cohort table, over every gender."""
+    sums = table.groupby(['Age Band', 'Month'], observed=True, sort=True)[['Total Duration', 'Trips']].sum()
+    return (sums['Total Duration'] / sums['Trips']).rename('Mean Duration').reset_index()
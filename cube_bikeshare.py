@@ -0,0 +1,152 @@
+import pandas as pd
+import numpy as np
+from aggregate_bikeshare import TripAggregates, WEEKDAYS
+from duration_bikeshare import duration_buckets
+from cohort_bikeshare import cohort_partials
+
+"""
+Cube of partial aggregates
+
+StatsCube splits every loaded city into (month, weekday, hour) cells and keeps,
+per cell, the trip count and duration sum/count plus the station, trip, user
+type, gender, birth year, age, age cohort and duration bucket histograms. Any (cities, months, days) filter
+is a set of cells, so it is answered by summing the partials of those cells
+instead of scanning the trips again: the whole 3 x 6 x 7 report grid costs one
+load per city.
+
+A city may be added as several partitions (eg. one per trip export file); a
+query merges the partials of all of them.
+----------------------------------------
+"""
+
+HOURS = 24
+
+# version of the partials layout (part of the persisted partials' keys)
+PARTIALS_VERSION = 3
+
+# cell id = (month - 1) * CELLS_PER_MONTH + weekday * HOURS + hour
+CELLS_PER_MONTH = len(WEEKDAYS) * HOURS
+
+# histograms kept per cell: name -> columns
+COUNT_DIMENSIONS = {'start_station': ['Start Station'], 'end_station': ['End Station'], 'trip': ['Start Station', 'End Station'],
+                    'user_type': ['User Type'], 'gender': ['Gender'], 'birth_year': ['Birth Year']}
+
+# duration partials kept per cell: name -> column
+DURATION_DIMENSIONS = {'age_month': 'Age', 'gender_month': 'Gender'}
+
+
+def cell_ids(months, days, hours=range(HOURS)):
+    """Cell ids of every (month number, day name, hour) combination."""
+    months = np.array([int(m) for m in months], dtype='int64')
+    days = np.array([WEEKDAYS.index(d) for d in days], dtype='int64')
+    hours = np.asarray(list(hours), dtype='int64')
+    return ((months[:, None, None] - 1) * CELLS_PER_MONTH + days[None, :, None] * HOURS + hours[None, None, :]).ravel()
+
+
+def plain_index(index):
+    """Index (or MultiIndex) with its categorical levels converted to plain values."""
+    if isinstance(index, pd.MultiIndex):
+        return pd.MultiIndex.from_arrays([plain_index(index.get_level_values(i)) for i in range(index.nlevels)], names=index.names)
+    return index.astype(object) if isinstance(index, pd.CategoricalIndex) else index
+
+
+class StatsCube:
+    """Per-city partial aggregates keyed by (month, weekday, hour) cells."""
+
+    def __init__(self):
+        # city -> list of partition partials {'cells': DataFrame, name: Series or DataFrame indexed by (cell, value...)}
+        self.cities = {}
+
+    @staticmethod
+    def city_partials(df, city=None):
+        """Computes the cell partials of one city's enriched trips frame (city names the city for the duration breakdown)."""
+        start_time = df['Start Time']
+        month = np.asarray(df['Month'] if 'Month' in df.columns else start_time.dt.month, dtype='int64')
+        cell = pd.Series((month - 1) * CELLS_PER_MONTH + start_time.dt.weekday.to_numpy() * HOURS + start_time.dt.hour.to_numpy(),
+                         index=df.index, name='cell')
+
+        partials = {'has_duration': 'Trip Duration' in df.columns}
+        duration = df['Trip Duration'].astype('float64') if partials['has_duration'] else pd.Series(np.nan, index=df.index)
+        partials['cells'] = duration.groupby(cell).agg(['size', 'sum', 'count'])
+        for name, columns in COUNT_DIMENSIONS.items():
+            if all(col in df.columns for col in columns):
+                partials[name] = df.groupby([cell] + [df[col] for col in columns], observed=True, sort=True).size()
+        for name, column in DURATION_DIMENSIONS.items():
+            if column in df.columns and 'Trip Duration' in df.columns:
+                partials[name] = duration.groupby([cell, df[column]], observed=True, sort=True).agg(['sum', 'count'])
+        if partials['has_duration']:
+            partials['durations'] = duration_buckets(df, cell, city)
+        cohorts = cohort_partials(df, cell)
+        if cohorts is not None:
+            partials['cohorts'] = cohorts
+        return partials
+
+    def add_city(self, city, df):
+        """Adds (or replaces) one city, given its whole enriched trips frame."""
+        self.cities[city] = [self.city_partials(df, city)]
+
+    def add_partition(self, city, partials):
+        """Adds the partials of one more partition of city (as returned by city_partials)."""
+        self.cities.setdefault(city, []).append(partials)
+
+    def query(self, cities, months, days, hours=range(HOURS)):
+        """
+        Aggregates of the trips of cities in months and days, without rescanning any trip.
+
+        Parameters:
+            (set) cites     - names of the cities (all must have been added),
+
+            (set) months    - numbers of the months to filter by,
+
+            (set) days      - names of the days to filter by,
+
+            hours           - start hours to filter by (default: all)
+
+        Returns:
+            TripAggregates, equal to TripAggregates.from_frame of the filtered trips
+        """
+        cells = cell_ids(months, days, hours)
+        return TripAggregates.merge_all(self.query_partials(partials, cells) for city in sorted(cities) for partials in self.cities[city])
+
+    def query_partials(self, partials, cells):
+        """Aggregates of the cells of one partition."""
+        agg = TripAggregates()
+
+        selected = partials['cells'][partials['cells'].index.isin(cells)]
+        agg.rows = int(selected['size'].sum())
+        cell = selected.index.to_numpy()
+        size = selected['size'].to_numpy()
+        agg.hour = pd.Series(np.bincount(cell % HOURS, weights=size, minlength=HOURS).astype('int64'), name='Hour').rename_axis('Hour')
+        agg.month = pd.Series(np.bincount(cell // CELLS_PER_MONTH + 1, weights=size, minlength=13)[1:].astype('int64'),
+                              index=range(1, 13), name='Month').rename_axis('Month')
+        agg.weekday = pd.Series(np.bincount(cell % CELLS_PER_MONTH // HOURS, weights=size, minlength=len(WEEKDAYS)).astype('int64'),
+                                index=pd.Index(WEEKDAYS, name='Day of week'), name='Day of week')
+
+        if partials['has_duration']:
+            agg.duration_sum = float(selected['sum'].sum())
+            agg.duration_count = int(selected['count'].sum())
+
+        for name, columns in COUNT_DIMENSIONS.items():
+            if name in partials:
+                counts = self.select(partials[name], cells).groupby(level=columns, observed=True, sort=True).sum()
+                counts = counts[counts > 0]
+                counts.index = plain_index(counts.index)
+                setattr(agg, name, counts.rename(columns[0] if len(columns) == 1 else 'Trip'))
+
+        for name, column in DURATION_DIMENSIONS.items():
+            if name in partials:
+                table = self.select(partials[name], cells)
+                month = pd.Index(table.index.get_level_values('cell') // CELLS_PER_MONTH + 1, name='Month')
+                table = table.groupby([plain_index(table.index.get_level_values(column)), month], sort=True).sum()
+                setattr(agg, name, table)
+
+        if 'durations' in partials:
+            agg.durations = self.select(partials['durations'], cells).groupby(level=['Group', 'Value', 'Bucket'], sort=True).sum()
+        if 'cohorts' in partials:
+            agg.cohorts = self.select(partials['cohorts'], cells).groupby(level=['Age', 'Month', 'Gender', 'Bucket'], sort=True).sum()
+        return agg
+
+    @staticmethod
+    def select(partial, cells):
+        """Rows of a (cell, ...) indexed partial whose cell is in cells."""
+        return partial[partial.index.get_level_values('cell').isin(cells)]
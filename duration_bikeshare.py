@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+
+"""
+Trip duration distribution
+
+Durations are counted in logarithmic buckets: bucket i holds the durations in
+(GAMMA^(i-1), GAMMA^i] seconds, GAMMA = (1 + ALPHA) / (1 - ALPHA). Reporting
+each bucket by 2 GAMMA^i / (GAMMA + 1) is off by at most ALPHA (1%) of the
+true value, so every quantile read from the counts is within 1% of the exact
+one (the DDSketch guarantee). The bucket grid is fixed, so the counts of
+chunks, files, cities or cube cells merge by adding them, like the other
+TripAggregates counts, and their size only grows with the log of the spread
+of the durations.
+
+TripAggregates keeps the counts of all trips and of every user type, gender
+and city (the frames of one city are aggregated with its name) as one Series
+indexed by (Group, Value, Bucket); DurationSketch answers the percentiles, the
+log-binned histogram and the outlier counts of one of them.
+----------------------------------------
+"""
+
+# relative accuracy of the quantiles
+ALPHA = 0.01
+
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+
+# bucket of the durations <= 0 (counted, but below every positive duration)
+ZERO_BUCKET = np.iinfo('int32').min
+
+# columns the distribution is broken down by (the whole distribution is the group 'All', the city the group 'City')
+DURATION_GROUPS = ['User Type', 'Gender']
+
+# seconds: 1, 2, 4, ... 1024 minutes (the last bin is open)
+HISTOGRAM_EDGES = np.concatenate([[0.0], 60.0 * 2.0 ** np.arange(11)])
+
+PERCENTILES = [50, 90, 99]
+
+
+def bucket_ids(seconds):
+    """Bucket of every duration (float seconds; NaN must be filtered out first)."""
+    seconds = np.asarray(seconds, dtype='float64')
+    ids = np.full(len(seconds), ZERO_BUCKET, dtype='int64')
+    positive = seconds > 0
+    ids[positive] = np.ceil(np.log(seconds[positive]) / np.log(GAMMA)).astype('int64')
+    return ids
+
+
+def bucket_values(ids):
+    """Representative duration of every bucket (0 for ZERO_BUCKET)."""
+    ids = np.asarray(ids, dtype='int64')
+    return np.where(ids == ZERO_BUCKET, 0.0, 2 * GAMMA ** ids.astype('float64') / (GAMMA + 1))
+
+
+def duration_buckets(df, by=None, city=None):
+    """
+    Bucket counts of the trip durations of a frame, overall and per value of every DURATION_GROUPS column it has.
+
+    Parameters:
+        (DataFrame) df  - trips with a Trip Duration column,
+
+        (Series) by     - optional extra key (eg. the cube cell of every row), kept as the second index level,
+
+        (str) city      - city of the trips, if they are of one city (also counted as the group 'City')
+
+    Returns:
+        (Series) counts - int64 trip counts indexed by (Group, [by,] Value, Bucket), None without durations
+    """
+    if 'Trip Duration' not in df.columns:
+        return None
+    duration = df['Trip Duration'].astype('float64')
+    valid = duration.notna().to_numpy()
+    bucket = pd.Series(bucket_ids(duration.to_numpy()[valid]), index=df.index[valid], name='Bucket')
+    keys = [] if by is None else [by[valid]]
+
+    parts = {'All': bucket.groupby(keys + [pd.Series('', index=bucket.index, name='Value'), bucket], sort=True).size()}
+    for column in DURATION_GROUPS:
+        if column in df.columns:
+            value = df[column][valid].rename('Value')
+            parts[column] = bucket.groupby(keys + [value, bucket], observed=True, sort=True).size()
+    if city is not None:
+        parts['City'] = parts['All'].rename(index={'': city}, level='Value')
+    for name, part in parts.items():
+        # plain values: categorical levels do not concatenate
+        part.index = pd.MultiIndex.from_arrays([part.index.get_level_values(i).astype(object) if i == len(keys) else part.index.get_level_values(i)
+                                                for i in range(part.index.nlevels)], names=part.index.names)
+    counts = pd.concat(parts, names=['Group']).astype('int64').rename('Trips')
+    return counts[counts > 0]
+
+
+class DurationSketch:
+    """
+    Distribution of the durations of one group of trips.
+
+    Parameters:
+        (Series) counts - trip counts indexed by bucket (as in TripAggregates.durations)
+    """
+
+    def __init__(self, counts=None):
+        counts = pd.Series(dtype='int64') if counts is None else counts
+        self.counts = counts[counts > 0].sort_index()
+
+    @classmethod
+    def from_values(cls, seconds):
+        """Sketch of an array of durations in seconds (NaN ignored)."""
+        seconds = np.asarray(seconds, dtype='float64')
+        ids, counts = np.unique(bucket_ids(seconds[~np.isnan(seconds)]), return_counts=True)
+        return cls(pd.Series(counts, index=ids))
+
+    def merge(self, other):
+        """Sketch of the durations behind self and other."""
+        return DurationSketch(self.counts.add(other.counts, fill_value=0).astype('int64'))
+
+    def count(self):
+        return int(self.counts.sum())
+
+    def quantiles(self, qs):
+        """Durations at the quantiles qs (0 to 1), within ALPHA of the exact ones (None for an empty sketch)."""
+        if not self.count():
+            return [None] * len(qs)
+        cumulative = np.cumsum(self.counts.to_numpy())
+        ranks = np.asarray(qs, dtype='float64') * (cumulative[-1] - 1)
+        positions = np.searchsorted(cumulative, ranks, side='right')
+        return [float(v) for v in bucket_values(self.counts.index.to_numpy()[positions])]
+
+    def percentiles(self, ps=PERCENTILES):
+        """{'p50': seconds, ...} of the percentiles ps."""
+        return {'p{}'.format(p): v for p, v in zip(ps, self.quantiles([p / 100 for p in ps]))}
+
+    def histogram(self, edges=HISTOGRAM_EDGES):
+        """Trips per [edges[i], edges[i + 1]) duration bin, the last bin being open."""
+        bins = np.searchsorted(edges, bucket_values(self.counts.index.to_numpy()), side='right') - 1
+        return np.bincount(np.maximum(bins, 0), weights=self.counts.to_numpy(), minlength=len(edges)).astype('int64')
+
+    def outlier_fence(self):
+        """Upper Tukey fence, Q3 + 1.5 IQR (None for an empty sketch)."""
+        q1, q3 = self.quantiles([0.25, 0.75])
+        return None if q1 is None else q3 + 1.5 * (q3 - q1)
+
+    def outliers(self):
+        """Number of trips longer than the outlier fence."""
+        fence = self.outlier_fence()
+        if fence is None:
+            return 0
+        return int(self.counts[bucket_values(self.counts.index.to_numpy()) > fence].sum())
+
+    def to_dict(self, edges=HISTOGRAM_EDGES):
+        """Count, percentiles, outliers and histogram as a JSON-serializable dict."""
+        summary = {'trips': self.count()}
+        summary.update(self.percentiles())
+        summary['outlier_fence'] = self.outlier_fence()
+        summary['outliers'] = self.outliers()
+        summary['histogram'] = [{'from': float(low), 'to': None if high is None else float(high), 'trips': int(n)}
+                                for low, high, n in zip(edges, list(edges[1:]) + [None], self.histogram(edges))]
+        return summary
+
+
+def group_sketches(durations):
+    """
+    Splits (Group, Value, Bucket) duration counts into sketches.
+
+    Returns:
+        (dict) sketches - {'All': DurationSketch, group: {value: DurationSketch}} of the groups present
+    """
+    if durations is None:
+        return {}
+    sketches = {}
+    for (group, value), counts in durations.groupby(level=['Group', 'Value'], sort=True):
+        sketch = DurationSketch(counts.droplevel(['Group', 'Value']))
+        if group == 'All':
+            sketches['All'] = sketch
+        else:
+            sketches.setdefault(group, {})[value] = sketch
+    return sketches
@@ -0,0 +1,104 @@
+import os
+import pickle
+import hashlib
+import pandas as pd
+from cache_bikeshare import source_key
+from trace_bikeshare import stage
+
+"""
+Incremental ingestion of partitioned city data
+
+A city can be backed by many trip files (eg. one export per day or month)
+instead of one CSV. PartitionStore keeps the cube partials (see
+cube_bikeshare) of every partition file on disk, keyed by the file's path,
+size and mtime like the columnar cache. A refresh only reads the partitions
+that are new or changed since the last run; the partials of the others are
+loaded as they are, so the cost of a refresh is proportional to the new data.
+Queries merge the partials of all partitions.
+----------------------------------------
+"""
+
+
+def partition_paths(source):
+    """
+    Partition files of a city source.
+
+    Parameters:
+        source  - CSV file, directory of CSV files (read in name order) or list of files
+    """
+    if isinstance(source, (list, tuple)):
+        return list(source)
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source) if name.endswith('.csv'))
+    return [source]
+
+
+class PartitionStore:
+    """
+    Persisted partials of partition files.
+
+    Parameters:
+        (str) store_dir     - directory of the persisted partials,
+
+        (str) tag           - extra key of the entries (eg. the reference year of the ages they contain),
+
+        (Tracer) tracer     - optional Tracer recording the partition_load and partition_build stages
+    """
+
+    def __init__(self, store_dir, tag='', tracer=None):
+        self.store_dir = store_dir
+        self.tag = tag
+        self.tracer = tracer
+
+    def entry_path(self, path):
+        path_key, version_key = source_key(path)
+        version_key = hashlib.sha1('{}:{}'.format(version_key, self.tag).encode()).hexdigest()[:12]
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.store_dir, '{}-{}-{}.pkl'.format(name, path_key, version_key))
+
+    def load(self, path):
+        """Returns the stored {'partials': ...} entry of path, or None if there is no valid entry."""
+        try:
+            return pd.read_pickle(self.entry_path(path))
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+
+    def store(self, path, partials):
+        """Persists the partials of path and drops the entries of its older versions."""
+        entry = self.entry_path(path)
+        prefix = os.path.basename(entry).rsplit('-', 1)[0] + '-'
+        os.makedirs(self.store_dir, exist_ok=True)
+        for other in os.listdir(self.store_dir):
+            # the .tmp files of other processes are still being written
+            if other.startswith(prefix) and '.tmp' not in other and other != os.path.basename(entry):
+                os.remove(os.path.join(self.store_dir, other))
+        tmp = entry + '.tmp{}'.format(os.getpid())
+        pd.to_pickle({'partials': partials}, tmp)
+        os.replace(tmp, entry)
+
+    def refresh(self, paths, build):
+        """
+        Returns the partials of every partition in paths, building and storing only the missing ones.
+
+        Parameters:
+            (list) paths        - partition files,
+
+            (callable) build    - returns the partials of one partition file (None for a partition without trips)
+
+        Returns:
+            (list) partials     - partials of every partition with trips, in the order of paths,
+
+            (list) built        - partitions that were new or changed
+        """
+        partials, built = [], []
+        for path in paths:
+            with stage(self.tracer, 'partition_load'):
+                entry = self.load(path)
+            if entry is None:
+                with stage(self.tracer, 'partition_build'):
+                    entry = {'partials': build(path)}
+                    self.store(path, entry['partials'])
+                built.append(path)
+            if entry['partials'] is not None:
+                partials.append(entry['partials'])
+        return partials, built
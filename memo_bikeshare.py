@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import argparse
+
+"""
+Result cache
+
+The statistics of a filter set only change with the data files behind it.
+ResultCache persists the aggregates (and the rendered plots) of every run in a
+local directory, keyed by the normalized filters and a fingerprint of the data
+files (their paths, sizes and modification times), so a later run, in any
+process, with the same filters on the same files returns them at once.
+
+Entries are directories; reading one marks it as recently used (its mtime), and
+once the store grows past max_bytes the least recently used entries are
+removed. The hit, miss and eviction counters are kept in the store as well:
+
+    python memo_bikeshare.py .bikeshare_cache/results
+----------------------------------------
+"""
+
+# bumped whenever the layout of the cached results changes
+MEMO_VERSION = 2
+
+
+def directory_size(path):
+    """Bytes of the files under path."""
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+class ResultCache:
+    """
+    Persisted results with size-based LRU eviction.
+
+    Parameters:
+        (str) store_dir     - directory of the entries and counters,
+
+        (int) max_bytes     - size the entries are evicted down to
+    """
+
+    def __init__(self, store_dir, max_bytes=64 * 2**20):
+        self.store_dir = store_dir
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(**parts):
+        """Key of a result: the hash of its normalized parts (JSON-serializable values)."""
+        return hashlib.sha1(json.dumps(dict(parts, version=MEMO_VERSION), sort_keys=True, default=str).encode()).hexdigest()[:24]
+
+    def entry_dir(self, key):
+        return os.path.join(self.store_dir, key)
+
+    def get(self, key):
+        """
+        Returns the cached result of key (marking it as recently used) or None, counting the hit or miss.
+
+        Returns:
+            (dict) result   - the stored result, with 'plots' mapping plot names to the cached image files
+        """
+        entry = self.entry_dir(key)
+        try:
+            with open(os.path.join(entry, 'result.pkl'), 'rb') as f:
+                result = pickle.load(f)
+            os.utime(entry)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            self.count('misses')
+            return None
+        result['plots'] = {name: os.path.join(entry, name + '.png') for name in result.pop('plot_names', [])}
+        self.count('hits')
+        return result
+
+    def put(self, key, result, plots=None):
+        """
+        Stores result (a picklable dict) and copies of the plot image files as the entry of key, then evicts.
+
+        Parameters:
+            (dict) plots    - plot name -> rendered image file
+        """
+        plots = plots or {}
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp = self.entry_dir(key) + '.tmp{}'.format(os.getpid())
+        os.makedirs(tmp, exist_ok=True)
+        for name, path in plots.items():
+            shutil.copyfile(path, os.path.join(tmp, name + '.png'))
+        with open(os.path.join(tmp, 'result.pkl'), 'wb') as f:
+            pickle.dump(dict(result, plot_names=sorted(plots)), f, protocol=pickle.HIGHEST_PROTOCOL)
+        shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+        os.replace(tmp, self.entry_dir(key))
+        self.evict()
+
+    def entries(self):
+        """(mtime, bytes, path) of every entry, least recently used first."""
+        if not os.path.isdir(self.store_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.store_dir):
+            path = os.path.join(self.store_dir, name)
+            if os.path.isdir(path) and '.tmp' not in name:
+                entries.append((os.path.getmtime(path), directory_size(path), path))
+        return sorted(entries)
+
+    def evict(self):
+        """Removes the least recently used entries until the store fits in max_bytes; returns their number."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            evicted += 1
+        if evicted:
+            self.count('evictions', evicted)
+        return evicted
+
+    def counters(self):
+        try:
+            with open(os.path.join(self.store_dir, 'counters.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def count(self, name, n=1):
+        """Adds n to a persisted counter."""
+        counters = self.counters()
+        counters[name] = counters.get(name, 0) + n
+        counters['updated'] = time.time()
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp = os.path.join(self.store_dir, 'counters.json.tmp{}'.format(os.getpid()))
+        with open(tmp, 'w') as f:
+            json.dump(counters, f)
+        os.replace(tmp, os.path.join(self.store_dir, 'counters.json'))
+
+    def stats(self):
+        """Counters and size of the store, for monitoring."""
+        counters = self.counters()
+        entries = self.entries()
+        return {'hits': counters.get('hits', 0), 'misses': counters.get('misses', 0), 'evictions': counters.get('evictions', 0),
+                'entries': len(entries), 'bytes': sum(size for _, size, _ in entries), 'max_bytes': self.max_bytes}
+
+    def clear(self):
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show (or clear) the counters and size of a result cache.')
+    parser.add_argument('store_dir', nargs='?', default=os.path.join('.bikeshare_cache', 'results'))
+    parser.add_argument('--clear', action='store_true', help='remove every entry and reset the counters')
+    args = parser.parse_args(argv)
+
+    cache = ResultCache(args.store_dir)
+    if args.clear:
+        cache.clear()
+    print(json.dumps(cache.stats(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from cohort_bikeshare import band_month_means
+
+"""
+Plot rendering
+
+The plots are drawn from the already computed age cohort table (see
+cohort_bikeshare) and (Gender, Month) mean durations with matplotlib's object oriented API, so they do not touch the
+global pyplot state. PlotRenderer renders them to image files with the Agg
+canvas in background threads: submitting a plot returns at once and the
+statistics go on while the files are written.
+----------------------------------------
+"""
+
+# styles of the age bands of the age plot, youngest first (cycled when there are more bands)
+AGE_STYLES = ['m.', 'b.', 'g.', 'r.', 'c.', 'y.', 'k.']
+
+
+def draw_age_groups(figure, cohorts):
+    """Draws Avg. Trip Duration by Month and age band from a cohort table (see cohort_bikeshare.cohort_table) on figure."""
+    ax = figure.add_subplot()
+    means = band_month_means(cohorts)
+    labels = list(cohorts['Age Band'].cat.categories)
+    for i, label in enumerate(labels):
+        rows = means[means['Age Band'] == label]
+        ax.plot(rows['Month'].to_numpy(), rows['Mean Duration'].to_numpy(), AGE_STYLES[i % len(AGE_STYLES)], alpha=1 if i == 0 else 0.5, label=label)
+    ax.set_title('Avg.Trip Duration by Month and Age groups\n' + ', '.join(labels))
+    ax.set_ylabel('Trip Duration')
+    ax.set_xlabel('Months')
+    ax.legend()
+    return figure
+
+
+def draw_gender_month(figure, df_gender):
+    """Draws Avg. Trip Duration by Month for Female and Male from the (Gender, Month) means on figure."""
+    ax = figure.add_subplot()
+    for gender, style in (('Female', 'g.-'), ('Male', 'b.-')):
+        rows = df_gender[df_gender['Gender'] == gender]
+        ax.plot(rows['Month'], rows['Trip Duration'], style, label=gender)
+    ax.set_title('Avg.Trip Duration by Month\nFemale vs Male')
+    ax.set_ylabel('Trip Duration')
+    ax.set_xlabel('Months')
+    ax.legend()
+    return figure
+
+
+PLOTS = {'age_groups': draw_age_groups, 'gender_month': draw_gender_month}
+
+
+def render(name, data, path):
+    """Draws plot name (a PLOTS key) from data and writes it to path with the Agg canvas; returns path."""
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    PLOTS[name](figure, data)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    figure.savefig(path)
+    return path
+
+
+def copy_plot(source, path):
+    """Copies a rendered plot file to path (see render); returns path."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    shutil.copyfile(source, path)
+    return path
+
+
+class PlotRenderer:
+    """
+    Renders plots to files in background threads.
+
+    Parameters:
+        (int) workers   - plots rendered at the same time
+    """
+
+    def __init__(self, workers=1):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending = []
+
+    def submit(self, name, data, path):
+        """Queues plot name of data to be written to path and returns its Future at once."""
+        future = self.pool.submit(render, name, data.copy(), path)
+        self.pending.append(future)
+        return future
+
+    def copy(self, source, path):
+        """Queues an already rendered plot file to be copied to path and returns its Future at once."""
+        future = self.pool.submit(copy_plot, source, path)
+        self.pending.append(future)
+        return future
+
+    def wait(self):
+        """Waits for every queued plot and returns their paths (re-raising the first rendering error)."""
+        pending, self.pending = self.pending, []
+        return [future.result() for future in pending]
+
+    def close(self):
+        self.wait()
+        self.pool.shutdown()
@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from aggregate_bikeshare import encode_stations, WEEKDAYS
+
+"""
+Station rollups
+
+StationRollup counts the departures and arrivals of every station per day of
+the week and hour of the day, as two dense (station, weekday, hour) integer
+tensors. Departures are counted at the Start Station and Start Time, arrivals
+at the End Station and End Time (Start Time when the data has no End Time).
+Rollups of chunks, files or cities merge by adding the tensors, and are saved
+as .npz files, so questions such as the busiest hour of a station or the top
+stations at 8am on weekdays are answered without rescanning the trips:
+
+    python statistics_bikeshare.py --cities c --rollup chicago.npz
+    python rollup_bikeshare.py chicago.npz --station 'Canal St & Adams St'
+    python rollup_bikeshare.py chicago.npz --top 10 --hours 8 --days wdays
+----------------------------------------
+"""
+
+HOURS = 24
+
+KINDS = ['departures', 'arrivals']
+
+
+def slot_counts(ids, times, n_stations):
+    """(station, weekday, hour) counts of the trips with a station id and a time, as an int32 tensor."""
+    valid = (ids >= 0) & times.notna().to_numpy()
+    weekday = times.dt.weekday.to_numpy()[valid].astype('int64')
+    hour = times.dt.hour.to_numpy()[valid].astype('int64')
+    keys = (ids[valid].astype('int64') * len(WEEKDAYS) + weekday) * HOURS + hour
+    counts = np.bincount(keys, minlength=n_stations * len(WEEKDAYS) * HOURS)
+    return counts.reshape(n_stations, len(WEEKDAYS), HOURS).astype('int32')
+
+
+class StationRollup:
+    """
+    Departures and arrivals by (station, weekday, hour).
+
+    Parameters:
+        stations            - station names, sorted,
+
+        (ndarray) departures, arrivals  - int32 counts of shape (stations, 7, 24), weekday 0 being Monday
+    """
+
+    def __init__(self, stations=(), departures=None, arrivals=None):
+        self.stations = pd.Index(list(stations), dtype=object, name='Station')
+        shape = (len(self.stations), len(WEEKDAYS), HOURS)
+        self.departures = np.zeros(shape, dtype='int32') if departures is None else departures
+        self.arrivals = np.zeros(shape, dtype='int32') if arrivals is None else arrivals
+
+    @classmethod
+    def from_frame(cls, df):
+        """Rollup of a trips frame (an empty one if it lacks the station or time columns)."""
+        if not {'Start Station', 'End Station', 'Start Time'} <= set(df.columns):
+            return cls()
+        start_ids, end_ids, names = encode_stations(df['Start Station'], df['End Station'])
+        departures = slot_counts(start_ids, df['Start Time'], len(names))
+        arrivals = slot_counts(end_ids, df['End Time'] if 'End Time' in df.columns else df['Start Time'], len(names))
+        # keep the stations with trips, in name order
+        used = np.flatnonzero(departures.any(axis=(1, 2)) | arrivals.any(axis=(1, 2)))
+        order = used[np.argsort(np.asarray(names[used], dtype=object), kind='stable')]
+        return cls(names[order], departures[order], arrivals[order])
+
+    def merge(self, other):
+        """Returns the rollup of the trips behind self and other."""
+        stations = self.stations.union(other.stations)
+        merged = StationRollup(stations)
+        for rollup in (self, other):
+            rows = stations.get_indexer(rollup.stations)
+            merged.departures[rows] += rollup.departures
+            merged.arrivals[rows] += rollup.arrivals
+        return merged
+
+    @classmethod
+    def merge_all(cls, rollups):
+        """Merges an iterable of rollups into one."""
+        merged = cls()
+        for rollup in rollups:
+            merged = merged.merge(rollup)
+        return merged
+
+    def save(self, path):
+        """Writes the rollup to path as an .npz file (atomically) and returns path."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, stations=np.array(self.stations, dtype=str), departures=self.departures, arrivals=self.arrivals)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['stations'].astype(object), data['departures'], data['arrivals'])
+
+    def tensor(self, kind):
+        if kind not in KINDS:
+            raise ValueError('unknown kind: {} (expected one of {})'.format(kind, ', '.join(KINDS)))
+        return getattr(self, kind)
+
+    def counts(self, kind='departures', days=None, hours=None):
+        """
+        Trips per station in the selected days and hours.
+
+        Parameters:
+            (str) kind      - 'departures' or 'arrivals',
+
+            days            - names of the days of the week (default: all),
+
+            hours           - hours of the day (default: all)
+
+        Returns:
+            (Series) counts - int64 counts indexed by station
+        """
+        tensor = self.tensor(kind)
+        if days is not None:
+            tensor = tensor[:, sorted(WEEKDAYS.index(d) for d in set(days)), :]
+        if hours is not None:
+            tensor = tensor[:, :, sorted({int(h) for h in hours})]
+        return pd.Series(tensor.sum(axis=(1, 2), dtype='int64'), index=self.stations, name=kind)
+
+    def station_profile(self, station, kind='departures', days=None):
+        """Trips of one station by hour of the day in the selected days (raises KeyError for unknown stations)."""
+        tensor = self.tensor(kind)[self.stations.get_loc(station)]
+        if days is not None:
+            tensor = tensor[sorted(WEEKDAYS.index(d) for d in set(days))]
+        return pd.Series(tensor.sum(axis=0, dtype='int64'), index=pd.RangeIndex(HOURS, name='Hour'), name=kind)
+
+    def busiest_hour(self, station, kind='departures', days=None):
+        """Hour of the day with the most trips at station (the earliest one on ties; None without trips)."""
+        profile = self.station_profile(station, kind, days)
+        return int(np.argmax(profile.to_numpy())) if profile.any() else None
+
+    def top_stations(self, n=10, kind='departures', days=None, hours=None):
+        """The n stations with the most trips in the selected days and hours, busiest first (by name on ties)."""
+        counts = self.counts(kind, days, hours)
+        return counts[counts > 0].sort_values(ascending=False, kind='stable').head(n)
+
+    def net_flow(self, days=None, hours=None):
+        """Arrivals minus departures per station in the selected days and hours (positive where bikes pile up)."""
+        return (self.counts('arrivals', days, hours) - self.counts('departures', days, hours)).rename('net_flow')
+
+
+def main(argv=None):
+    from statistics_bikeshare import StatisticsBikeshare, InvalidInput
+
+    parser = argparse.ArgumentParser(description='Query a saved station rollup without rescanning the trips.')
+    parser.add_argument('path', help='.npz file written by statistics_bikeshare.py --rollup')
+    parser.add_argument('--station', help='report the hourly profile and the busiest hour of this station')
+    parser.add_argument('--top', type=int, metavar='N', help='report the N busiest stations (default: 10)')
+    parser.add_argument('--net-flow', action='store_true', help='report the stations gaining and losing the most bikes')
+    parser.add_argument('--arrivals', action='store_true', help='count arrivals instead of departures')
+    parser.add_argument('--days', nargs='+', default=['a'], help="day letters m t w th f s su, wdays, wends, or a for all (default)")
+    parser.add_argument('--hours', nargs='+', type=int, help='hours of the day, eg. 7 8 9 (default: all)')
+    args = parser.parse_args(argv)
+
+    try:
+        days = StatisticsBikeshare().parse_days(args.days)
+    except InvalidInput:
+        parser.error('invalid days: {}'.format(' '.join(args.days)))
+    if args.hours is not None and not all(0 <= h < HOURS for h in args.hours):
+        parser.error('hours must be between 0 and 23')
+    kind = 'arrivals' if args.arrivals else 'departures'
+
+    rollup = StationRollup.load(args.path)
+    result = {'kind': kind, 'days': sorted(days, key=WEEKDAYS.index), 'hours': args.hours}
+    if args.station is not None:
+        if args.station not in rollup.stations:
+            print('Unknown station: {}'.format(args.station), file=sys.stderr)
+            return 1
+        result['station'] = args.station
+        result['busiest_hour'] = rollup.busiest_hour(args.station, kind, days)
+        result['by_hour'] = [int(v) for v in rollup.station_profile(args.station, kind, days)]
+    if args.net_flow:
+        flow = rollup.net_flow(days, args.hours).sort_values(kind='stable')
+        result['net_flow'] = {'losing': {str(k): int(v) for k, v in flow.head(args.top or 10).items() if v < 0},
+                              'gaining': {str(k): int(v) for k, v in flow[::-1].head(args.top or 10).items() if v > 0}}
+    if args.top is not None or (args.station is None and not args.net_flow):
+        result['top_stations'] = {str(k): int(v) for k, v in rollup.top_stations(args.top or 10, kind, days, args.hours).items()}
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+from aggregate_bikeshare import mode, to_builtin
+
+"""
+Quick-look sampling
+
+A quick look computes the statistics of a random sample of the filtered trips
+instead of all of them and reports how far they can be trusted: for every mode
+the probability that it is the mode of all the trips, and confidence intervals
+for the mean and total duration and the user type and gender counts.
+
+The trips are split into units, the rows of one month of one partition file.
+From a columnar cache entry only the sampled rows are read: their positions
+are drawn at random within the time ranges of the unit (see TimeIndex.ranges)
+and taken from the memory-mapped columns, so the time of a quick look does not
+grow with the data. Without the cache, the CSVs are streamed once through a
+bounded Reservoir per unit.
+
+The sample is uniform over all the rows (the number of rows drawn from every
+unit is multivariate hypergeometric), or stratified: every (city, month) gets
+a share of the sample proportional to its rows. Both are self-weighting, so the
+statistics of the sample estimate those of all the rows directly.
+----------------------------------------
+"""
+
+# rows of a quick-look sample
+SAMPLE_SIZE = 10000
+
+# level of the confidence intervals
+CONFIDENCE = 0.95
+
+# TripAggregates counts whose mode is estimated
+MODE_COUNTS = ['hour', 'month', 'weekday', 'start_station', 'end_station', 'trip', 'birth_year']
+
+# runner-up values the sampled mode is compared with by mode_agreement
+CONTENDERS = 10
+
+
+class Reservoir:
+    """
+    Uniform sample of at most size rows of a stream of frames.
+
+    Every row gets a random key and the rows with the smallest keys are kept (bottom-k sampling), in key order, so
+    the first n rows kept are a uniform sample of n rows as well.
+
+    Parameters:
+        (int) size          - rows kept,
+
+        (Generator) rng     - numpy random generator of the keys
+    """
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.rows = None
+        self.keys = np.empty(0)
+        # rows added
+        self.population = 0
+
+    def add(self, chunk):
+        keys = self.rng.random(len(chunk))
+        self.population += len(chunk)
+        if len(self.keys) == self.size:
+            keep = keys < self.keys[-1]
+            chunk, keys = chunk[keep], keys[keep]
+        if not len(chunk):
+            return
+        rows = chunk if self.rows is None else pd.concat([self.rows, chunk], ignore_index=True)
+        keys = np.concatenate([self.keys, keys])
+        order = np.argsort(keys, kind='stable')[:self.size]
+        self.rows = rows.take(order).reset_index(drop=True)
+        self.keys = keys[order]
+
+    def draw(self, n):
+        """Uniform sample of n (at most size) of the rows added."""
+        return self.rows.iloc[:n]
+
+
+class MappedUnit:
+    """
+    Rows of a time-sorted (eg. memory-mapped cache) frame in a set of row ranges, drawn at random positions.
+
+    Parameters:
+        (DataFrame) df      - the frame,
+
+        (ndarray) first     - first row of every range,
+
+        (ndarray) stop      - end of every range (see TimeIndex.ranges),
+
+        (Generator) rng     - numpy random generator of the positions
+    """
+
+    def __init__(self, df, first, stop, rng):
+        self.df = df
+        self.first = np.asarray(first, dtype='int64')
+        self.offsets = np.cumsum(np.asarray(stop, dtype='int64') - self.first)
+        self.rng = rng
+        self.population = int(self.offsets[-1]) if len(self.offsets) else 0
+
+    def draw(self, n):
+        """Uniform sample of n of the rows, in row order (only those rows are read)."""
+        offsets = np.sort(self.rng.choice(self.population, n, replace=False))
+        ranges = np.searchsorted(self.offsets, offsets, side='right')
+        positions = self.first[ranges] + offsets - np.concatenate([[0], self.offsets])[ranges]
+        return self.df.take(positions)
+
+
+def allocate(populations, size, strata=None, rng=None):
+    """
+    Rows drawn from every unit of a population split into units.
+
+    Parameters:
+        (list) populations  - rows of every unit,
+
+        (int) size          - rows of the sample (at most all of them),
+
+        (list) strata       - optional stratum label of every unit: every stratum then gets a share of the sample
+                              proportional to its rows (largest remainders), spread uniformly over its units,
+
+        (Generator) rng     - numpy random generator
+
+    Returns:
+        (ndarray) sizes     - rows drawn from every unit
+    """
+    populations = np.asarray(populations, dtype='int64')
+    size = min(size, int(populations.sum()))
+    if not len(populations) or not size:
+        return np.zeros(len(populations), dtype='int64')
+    if strata is None:
+        return rng.multivariate_hypergeometric(populations, size)
+
+    codes, labels = pd.factorize(pd.Series(strata, dtype=object))
+    totals = np.bincount(codes, weights=populations, minlength=len(labels))
+    quotas = totals * size / totals.sum()
+    shares = np.floor(quotas).astype('int64')
+    shares[np.argsort(shares - quotas, kind='stable')[:size - shares.sum()]] += 1
+    sizes = np.zeros(len(populations), dtype='int64')
+    for stratum, share in enumerate(shares):
+        units = np.flatnonzero(codes == stratum)
+        sizes[units] = rng.multivariate_hypergeometric(populations[units], share)
+    return sizes
+
+
+def mode_agreement(counts, fpc=1.0, contenders=CONTENDERS):
+    """
+    Approximate probability that the most common value of a sample is the most common value of the population.
+
+    The difference between the sample shares of the mode and of each runner-up is about normal (multinomial
+    covariance, finite population correction fpc); the probabilities that the mode beats each of the contenders
+    most common runner-ups are multiplied, as if independent.
+    """
+    shares = np.sort(counts.to_numpy().astype('float64'))[::-1][:contenders + 1] / counts.sum()
+    if len(shares) < 2:
+        return 1.0
+    differences = shares[0] - shares[1:]
+    sd = fpc * np.sqrt(np.maximum(shares[0] + shares[1:] - differences ** 2, 0) / counts.sum())
+    normal = NormalDist()
+    probability = 1.0
+    for d, s in zip(differences, sd):
+        probability *= normal.cdf(d / s) if s > 0 else (1.0 if d > 0 else 0.5)
+    return float(probability)
+
+
+def interval(value, half):
+    return {'estimate': float(value), 'low': float(value - half), 'high': float(value + half)}
+
+
+def estimate(stats, durations, population, confidence=CONFIDENCE):
+    """
+    Estimates of the statistics of all the rows from the aggregates of a uniform or proportionally stratified sample.
+
+    Parameters:
+        (TripAggregates) stats  - aggregates of the sample,
+
+        durations               - trip durations of the sample rows in seconds (missing ones as NaN),
+
+        (int) population        - rows the sample was drawn from,
+
+        (float) confidence      - level of the intervals
+
+    Returns:
+        (dict) estimate         - JSON-serializable population and sample rows, the sampled modes with their
+                                  agreement probabilities and the mean and total duration and user type and gender
+                                  counts with their confidence intervals
+    """
+    n = stats.rows
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    # finite population correction: a sample of all the rows is exact
+    fpc = np.sqrt(max(population - n, 0) / max(population - 1, 1))
+    summary = {'population': int(population), 'sample_rows': int(n), 'confidence': confidence, 'modes': {}}
+    for name in MODE_COUNTS:
+        counts = getattr(stats, name)
+        if counts is not None and counts.any():
+            summary['modes'][name] = {'value': to_builtin(mode(counts)), 'agreement': mode_agreement(counts, fpc)}
+
+    durations = np.asarray(durations, dtype='float64')
+    if n > 1 and (~np.isnan(durations)).any():
+        known = durations[~np.isnan(durations)]
+        summary['mean_duration'] = interval(known.mean(), z * fpc * known.std(ddof=1) / np.sqrt(len(known)) if len(known) > 1 else np.inf)
+        # total = population x mean duration per row (rows without one count 0)
+        per_row = np.nan_to_num(durations)
+        summary['total_duration'] = interval(population * per_row.mean(), population * z * fpc * per_row.std(ddof=1) / np.sqrt(n))
+
+    for name, key in (('user_type', 'user_types'), ('gender', 'genders')):
+        counts = getattr(stats, name)
+        if counts is not None and n:
+            shares = counts.to_numpy() / n
+            halves = z * fpc * np.sqrt(shares * (1 - shares) / n)
+            summary[key] = {str(value): interval(population * share, population * half) for value, share, half in zip(counts.index, shares, halves)}
+    return summary
+
+
+def refine(summary, exact):
+    """
+    Compares the estimates of a quick look with the exact aggregates of the same rows.
+
+    Returns:
+        (dict) refined  - per mode the sampled and exact value and whether they agree, per interval the exact value
+                          and whether the interval holds it
+    """
+    refined = {'modes': {}}
+    for name, sampled in summary['modes'].items():
+        value = to_builtin(mode(getattr(exact, name)))
+        refined['modes'][name] = {'sampled': sampled['value'], 'exact': value, 'agreed': sampled['value'] == value}
+    for key, value in (('mean_duration', exact.mean_duration()), ('total_duration', exact.total_duration())):
+        if key in summary and value is not None:
+            refined[key] = {'exact': float(value), 'covered': summary[key]['low'] <= value <= summary[key]['high']}
+    for name, key in (('user_type', 'user_types'), ('gender', 'genders')):
+        counts = getattr(exact, name)
+        if key in summary and counts is not None:
+            exact_counts = {str(value): int(count) for value, count in counts.items()}
+            refined[key] = {value: {'exact': exact_counts.get(value, 0), 'covered': bounds['low'] <= exact_counts.get(value, 0) <= bounds['high']}
+                            for value, bounds in summary[key].items()}
+    return refined
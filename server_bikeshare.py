@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from statistics_bikeshare import StatisticsBikeshare, InvalidInput
+from aggregate_bikeshare import TripAggregates
+from cube_bikeshare import StatsCube
+from timeindex_bikeshare import TimeFilter, TimeIndex, WEEKDAYS
+
+"""
+Query server
+
+Loads the city datasets once and answers statistics requests over HTTP from
+the warm data, concurrently (one thread per request):
+
+    python server_bikeshare.py --port 8000
+    curl 'http://localhost:8000/stats?cities=c+n&months=1+2&days=wends&hours=7-9'
+
+Every city is kept as a time-sorted frame plus its StatsCube partials. Month,
+day and hour filters are answered from the cube; date ranges and dates slice
+the sorted frames. Answers are cached per normalized filter with LRU eviction.
+GET /health reports the loaded cities and the cache counters.
+----------------------------------------
+"""
+
+
+class LRUCache:
+    """Thread-safe mapping of at most maxsize entries, evicting the least recently used one."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        """Returns the entry of key (marking it as recently used) or None."""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class StatsService:
+    """
+    Warm data of the cities and the cached answers to filters.
+
+    Parameters:
+        (StatisticsBikeshare) bike_stat - configured instance the cities are loaded with (CITY_DATA, cache_dir, ...),
+
+        (set) cities                    - names of the cities to load,
+
+        (int) cache_size                - answers kept in the LRU cache
+    """
+
+    def __init__(self, bike_stat, cities, cache_size=256):
+        self.bike_stat = bike_stat
+        self.indexes = {}
+        self.cube = StatsCube()
+        for city in sorted(cities):
+            df = bike_stat.load_city(city, [str(m) for m in range(1, 13)], WEEKDAYS)
+            self.indexes[city] = TimeIndex(df) if 'Start Time' in df.columns else None
+            if self.indexes[city] is not None:
+                self.cube.add_city(city, self.indexes[city].df)
+        self.results = LRUCache(cache_size)
+
+    def query(self, params):
+        """
+        Answers a statistics request.
+
+        Parameters:
+            (dict) params   - query parameters: cities, months and days (as in the command line, 'a' for all by default),
+                              start, end (inclusive date), dates and hours (eg. '7-9 16-19'); values are space or comma separated
+
+        Returns:
+            (dict) result   - JSON-serializable filters and statistics (raises InvalidInput or ValueError on bad filters)
+        """
+        def tokens(name, default=None):
+            value = params.get(name)
+            return default if value is None else value.replace(',', ' ').split()
+
+        cities = tokens('cities', ['a'])
+        # 'a' means every loaded city
+        cities = set(self.indexes) if 'a' in [c.lower() for c in cities] else self.bike_stat.parse_cities(cities)
+        months = self.bike_stat.parse_months(tokens('months', ['a']))
+        days = self.bike_stat.parse_days(tokens('days', ['a']))
+        missing = cities - set(self.indexes)
+        if missing:
+            raise ValueError('not loaded: {}'.format(', '.join(sorted(missing))))
+        where = None
+        if any(params.get(name) for name in ('start', 'end', 'dates', 'hours')):
+            where = TimeFilter.from_args(params.get('start'), params.get('end'), tokens('dates'), tokens('hours'))
+
+        key = (tuple(sorted(cities)), tuple(sorted(months, key=int)), tuple(sorted(days)), None if where is None else json.dumps(where.to_dict()))
+        result = self.results.get(key)
+        if result is not None:
+            return result
+
+        time_filter = TimeFilter.from_filters(months, days, where)
+        cities = [city for city in sorted(cities) if self.indexes[city] is not None]
+        if time_filter.has_dates():
+            stats = TripAggregates.merge_all(TripAggregates.from_frame(self.indexes[city].select(time_filter), city=city) for city in cities)
+        else:
+            stats = self.cube.query(cities, [str(m) for m in time_filter.months], [WEEKDAYS[d] for d in time_filter.days], time_filter.hour_list())
+
+        result = {'cities': list(key[0]), 'months': list(key[1]), 'days': list(key[2]), 'stats': stats.to_dict()}
+        if where is not None:
+            result['where'] = where.to_dict()
+        self.results.put(key, result)
+        return result
+
+    def health(self):
+        return {'cities': {city: 0 if index is None else len(index.df) for city, index in self.indexes.items()}, 'cache': self.results.stats()}
+
+
+class StatsHandler(BaseHTTPRequestHandler):
+    """GET /stats?... and GET /health of the StatsService in self.server.service."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        start = time.perf_counter()
+        if url.path == '/health':
+            self.send_json(200, self.server.service.health())
+        elif url.path == '/stats':
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            try:
+                result = self.server.service.query(params)
+            except (InvalidInput, ValueError) as e:
+                self.send_json(400, {'error': str(e) or 'invalid filter', 'params': params})
+                return
+            self.send_json(200, dict(result, seconds=time.perf_counter() - start))
+        else:
+            self.send_json(404, {'error': 'unknown path: {}'.format(url.path)})
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(service, host='127.0.0.1', port=8000, quiet=False):
+    """Returns a ThreadingHTTPServer answering from service (port 0 picks a free port)."""
+    server = ThreadingHTTPServer((host, port), StatsHandler)
+    server.service = service
+    server.quiet = quiet
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the bikeshare statistics over HTTP from warm data.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--cities', nargs='+', default=['a'], help="city letters to load: c n w, or a for all (default)")
+    parser.add_argument('--data-dir', metavar='DIR', help='directory of the city CSV files')
+    parser.add_argument('--cache-dir', metavar='DIR', default=StatisticsBikeshare.cache_dir, help='directory of the columnar CSV cache')
+    parser.add_argument('--no-cache', action='store_true', help='read the CSV files directly')
+    parser.add_argument('--cache-size', type=int, default=256, help='answers kept in the LRU result cache (default: 256)')
+    parser.add_argument('--quiet', action='store_true', help='do not log the requests')
+    args = parser.parse_args(argv)
+
+    bike_stat = StatisticsBikeshare()
+    try:
+        cities = bike_stat.parse_cities(args.cities)
+    except InvalidInput:
+        parser.error('invalid cities: {}'.format(' '.join(args.cities)))
+    if args.data_dir is not None:
+        bike_stat.CITY_DATA = {city: os.path.join(args.data_dir, path) for city, path in bike_stat.CITY_DATA.items()}
+    bike_stat.cache_dir = None if args.no_cache else args.cache_dir
+
+    try:
+        service = StatsService(bike_stat, cities, args.cache_size)
+    except OSError as e:
+        print('Could not read the bikeshare data: {}'.format(e), file=sys.stderr)
+        return 1
+    server = make_server(service, args.host, args.port, args.quiet)
+    print('Serving {} on http://{}:{}/'.format(', '.join(sorted(cities)), *server.server_address[:2]), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,48 @@
+import numpy as np
+
+"""
+Bounded-memory frequency summaries
+
+The frequency counts of TripAggregates are exact, mergeable pandas Series.
+For inputs with very many distinct stations and trips they can be bounded
+with a Misra-Gries summary (the mergeable form of Space-Saving): only the
+capacity heaviest values are kept, and every compaction subtracts the count of
+the (capacity + 1)-th value from the others. For every value the true count
+then lies in [estimate, estimate + error], where error is the sum of the
+subtracted counts and never exceeds (total count) / (capacity + 1). Summaries
+of chunks, files or workers merge by adding the counts and compacting again;
+their errors add up.
+----------------------------------------
+"""
+
+
+def compact(counts, capacity):
+    """
+    Reduces a counts Series to its capacity heaviest values.
+
+    Returns:
+        (Series) counts     - the kept (lowered) counts, in index order,
+
+        (int) deducted      - the count subtracted from every kept value (0 if nothing was dropped)
+    """
+    if counts is None or len(counts) <= capacity:
+        return counts, 0
+    values = counts.to_numpy()
+    deducted = np.partition(values, len(values) - capacity - 1)[len(values) - capacity - 1]
+    kept = counts[values > deducted] - deducted
+    return kept, int(deducted)
+
+
+def certain_mode(counts, error):
+    """
+    Whether the most common value of a summary is the true mode.
+
+    It is if its estimate beats the next estimate and every untracked value by more than the error.
+    """
+    if error == 0:
+        return True
+    if counts is None or not len(counts):
+        return False
+    values = np.sort(counts.to_numpy())[::-1]
+    runner_up = values[1] if len(values) > 1 else 0
+    return bool(values[0] > runner_up + error and values[0] > error)
@@ -1,9 +1,13 @@
-import time
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
 import os
-from datetime import datetime, date
+import io
+import sys
+import json
+import argparse
+import calendar
+import contextlib
+from itertools import repeat
+from datetime import date
+from trace_bikeshare import Tracer
 
 """
 Statistics Computed
@@ -37,7 +41,12 @@ average trip duration by month distributed by gender
 plot for Avg. Trip Duration by Month distributed by Gender
 earliest, most recent, and most common year of birth
 plot for Avg. Trip Duration distributed by age groups
+trip count, mean and median duration by age band, month and gender
 ----------------------------------------
+
+pandas, numpy, matplotlib and the modules built on them are imported by the
+methods that need them, so the prompts and the filter validation start in
+milliseconds and matplotlib is only loaded once a plot is drawn.
 """
 
 class InvalidInput(Exception):
@@ -47,6 +56,7 @@ class InvalidInput(Exception):
         return self.msg
 
 class StatisticsBikeshare:
+    # city -> CSV file, directory of CSV files or list of CSV files (partitions, eg. one per export)
     CITY_DATA = { 'chicago': 'chicago.csv',
               'new york city': 'new_york_city.csv',
               'washington': 'washington.csv' }
@@ -59,11 +69,115 @@ class StatisticsBikeshare:
 
     bulk = False
 
-    df = pd.DataFrame()
+    # directory of the columnar CSV cache (None disables caching)
+    cache_dir = '.bikeshare_cache'
+
+    # keep the statistics and plots of every run in <cache_dir>/results (see memo_bikeshare), at most memo_max_bytes
+    memo = True
+
+    memo_max_bytes = 64 * 2**20
+
+    # whether the last run was answered from the result cache (None if it was not looked up) and its cached plot files
+    memo_hit = None
+
+    memo_plots = {}
+
+    # rows parsed and filtered at once by load_data (and held in memory at once by the streaming mode)
+    chunksize = 100000
+
+    # aggregate the rows chunk by chunk as they are scanned, without loading them (memory bounded by chunksize; files
+    # without a columnar cache entry are read from the CSV and not cached)
+    streaming = False
+
+    # rows scanned and kept per city by the last load_data
+    scan_counts = {}
+
+    # memory footprint in bytes of the last load_data before and after compacting dtypes
+    memory_usage = {}
+
+    # date ages are computed against (None means today)
+    reference_date = None
+
+    # worker processes used to load and aggregate the cities (None loads them sequentially)
+    workers = None
+
+    # aggregate from the persisted partials of every partition, reading only new or changed partitions
+    incremental = False
+
+    # partitions read per city by the last refresh
+    refreshed = {}
+
+    # .npz file the station rollup (departures and arrivals by station, weekday and hour) of a batch run is saved to
+    rollup_path = None
+
+    # lower bounds of the age bands of the cohort table and age plot after the first one (None: cohort_bikeshare.AGE_BANDS)
+    age_bands = None
+
+    # stations and trips kept by the approximate (bounded memory) counts; None counts them exactly
+    sketch_capacity = None
+
+    # rows of the quick-look sample the statistics are estimated from (see sample_bikeshare); None computes them exactly
+    sample_size = None
+
+    # draw the sample proportionally from every (city, month) instead of uniformly from all the rows
+    stratified = False
+
+    sample_seed = 0
+
+    # follow a headless quick look by the exact run of the same filters (the menu asks instead)
+    refine = False
+
+    # estimates of the last quick look (see sample_bikeshare.estimate); None after exact runs
+    sample_estimate = None
+
+    # (cities, months, days) of the last loaded or aggregated data
+    filters = None
+
+    # TimeFilter (date range, dates, hour windows) narrowing the month and day filters (None keeps every time)
+    where = None
+
+    # headless runs never prompt or open plot windows; plots are written to plot_dir instead
+    headless = False
+
+    # with plot_dir set, plots are written there in the background (by plot_renderer) instead of being shown
+    plot_dir = None
 
-    start = 0
+    plot_renderer = None
 
-    stop = 5
+    # loaded rows (see the df property); None until rows are loaded
+    _df = None
+
+    # per-city tables of the last load_data (see tables_bikeshare); None when df was set directly
+    tables = None
+
+    # aggregates of df, computed once by aggregate()
+    stats = None
+
+    # stage timings of the current run (see trace_bikeshare), exported to trace_path after every run if set
+    tracer = None
+
+    trace_path = None
+
+    # trace memory deltas with tracemalloc (instead of the process RSS) and profile the runs with cProfile
+    trace_memory = False
+
+    profile = False
+
+    @property
+    def df(self):
+        """Rows of the last load_data as one frame (built from the per-city tables on first use; empty before any load)."""
+        if self._df is None:
+            if self.tables is not None:
+                self._df = self.tables.union()
+            else:
+                import pandas as pd
+                self._df = pd.DataFrame()
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = df
+        self.tables = None
 
     def not_bulk(self):
         input("Press Enter to continue...\n\n\n")
@@ -102,7 +216,9 @@ class StatisticsBikeshare:
 
     def col_check(self, col_name):
         """Checks if column is part of the dataframe."""
-        return col_name in list(self.df.columns)
+        if self.tables is not None:
+            return self.tables.has_column(col_name)
+        return col_name in self.df.columns
 
     def want_filter(self):
         """Checks if user want unique filters."""
@@ -121,13 +237,81 @@ class StatisticsBikeshare:
                 print('\n!! Type valid input please !! (eg.: \'y\' | \'yes\' | \'n\' | \'no\')\n\n'+'-'*48+'\n')
                 continue
 
+    def want_refine(self):
+        """Checks if user wants the exact statistics after a quick look."""
+        while True:
+            try:
+                inp = input('\nDo you want the exact statistics of these filters? Enter (y)yes or (n)no.\n')
+                if inp.lower() == 'yes' or inp.lower() == 'y':
+                    print('Computing the exact statistics!\n'+'-'*48+'\n')
+                    return True
+                elif inp.lower() == 'no' or inp.lower() == 'n':
+                    print('Keeping the quick look!\n'+'-'*48+'\n')
+                    return False
+                else:
+                    raise InvalidInput
+            except InvalidInput:
+                print('\n!! Type valid input please !! (eg.: \'y\' | \'yes\' | \'n\' | \'no\')\n\n'+'-'*48+'\n')
+                continue
+
     def to_age(self, birth_year):
         """Converts birth year to age"""
-        return datetime.today().year - birth_year
+        return self.today().year - birth_year
+
+    def today(self):
+        """Reference date of the ages (reference_date if set, otherwise today)."""
+        return self.reference_date or date.today()
+
+    def ages(self, birth_year):
+        """Vectorized to_age of a birth year Series, as nullable Int16."""
+        return (self.today().year - birth_year).round().astype('Int16')
 
     def secure_input(self, input_set):
         return set(input_set.lower() for input_set in input_set)
 
+    def parse_cities(self, tokens):
+        """Maps city letters ('c', 'n', 'w' or 'a' for all) to city names, raising InvalidInput on anything else."""
+        cities = self.secure_input(tokens)
+
+        tmp = set()
+        if not cities:
+            raise InvalidInput
+        if 'a' in cities:
+            cities.remove('a')
+            cities.update(self.city_letters.keys())
+        if all(e in self.city_letters.keys() for e in cities):
+            for val in cities:
+                tmp.add(self.city_letters[val])
+            return tmp
+        raise InvalidInput
+
+    def parse_months(self, tokens):
+        """Validates month numbers ('1' to '6' or 'a' for all), raising InvalidInput on anything else."""
+        months = self.secure_input(tokens)
+
+        if not months:
+            raise InvalidInput
+        if 'a' in months:
+            months.remove('a')
+            months.update(self.months_num)
+        if all(ch in self.months_num for ch in months):
+            return months
+        raise InvalidInput
+
+    def parse_days(self, tokens):
+        """Maps day letters (and 'wdays', 'wends', 'a') to day names, raising InvalidInput on anything else."""
+        days = self.secure_input(tokens)
+        days = self.map_input_to_days(days)
+
+        tmp = set()
+        if not days:
+            raise InvalidInput
+        if all(e in self.week_days.keys() for e in days):
+            for val in days:
+                tmp.add(self.week_days[val])
+            return tmp
+        raise InvalidInput
+
     def get_filters(self):
         """
         Asks user
@@ -157,22 +341,8 @@ class StatisticsBikeshare:
             while True:
                 try:
                     print('Which cities\' data are you interested in?\n  - (c)Chicago,\n  - (n)New York City,\n  - (w)Washington\n  - (a)All\n')
-                    cities = set(input('Type here (separated by space): ').split())
-                    cities = self.secure_input(cities)
-
-                    tmp = set()
-                    if not cities:
-                        raise InvalidInput
-                    if 'a' in cities:
-                        cities.remove('a')
-                        cities.update(self.city_letters.keys())
-                    if all(e in self.city_letters.keys() for e in cities):
-                        for val in cities:
-                            tmp.add(self.city_letters[val])
-                        cities = tmp
-                        break
-                    else:
-                        raise InvalidInput
+                    cities = self.parse_cities(input('Type here (separated by space): ').split())
+                    break
                 except InvalidInput:
                     print('\n  !! Type valid input please !! (eg.: \'c n w\')\n\n')
                     continue
@@ -182,18 +352,8 @@ class StatisticsBikeshare:
             while True:
                 try:
                     print('Which months\' data are you interested in?\n  - (a)All  (1)Jan  (2)Feb  (3)March  (4)Apr  (5)May  (6)June\n')
-                    months = set(input('Type here (separated by space): ').split())
-                    months = self.secure_input(months)
-
-                    if not months:
-                        raise InvalidInput
-                    if 'a' in months:
-                        months.remove('a')
-                        months.update(self.months_num)
-                    if all(ch in self.months_num for ch in months):
-                        break
-                    else:
-                        raise InvalidInput
+                    months = self.parse_months(input('Type here (separated by space): ').split())
+                    break
                 except InvalidInput:
                     print('\n!! Type valid input please !! (eg.: \'1 2 3 4 5 6\')\n\n'+'-'*48+'\n')
                     continue
@@ -204,20 +364,8 @@ class StatisticsBikeshare:
                 try:
                     print('Which days\' data are you interested in?')
                     print('Options:\n  - (m)Monday  (t)Tuesday  (w)Wednesday  (th)Thursday  (f)Friday  (s)Saturday  (su)Sunday\n    (wdays)Weekdays  (wends)Weekends  (a)all\n')
-                    days = set(input('Type here (separated by space): ').split())
-                    days = self.secure_input(days)
-                    days = self.map_input_to_days(days)
-
-                    tmp = set()
-                    if not days:
-                        raise InvalidInput
-                    if all(e in self.week_days.keys() for e in days):
-                        for val in days:
-                            tmp.add(self.week_days[val])
-                        days = tmp
-                        break
-                    else:
-                        raise InvalidInput
+                    days = self.parse_days(input('Type here (separated by space): ').split())
+                    break
                 except InvalidInput:
                     print('\n!! Type valid input please !! (eg.: \'m t w th f s su\')\n\n'+'-'*48+'\n')
                     continue
@@ -233,6 +381,9 @@ class StatisticsBikeshare:
         """
         Loads data for the specified cities and filters by month(s) and day(s) if applicable.
 
+        The statistics only need the per-city tables (see load_tables); the combined frame returned here is built
+        from them on demand.
+
         Parameters:
             (set) cites     - names of the cities to analyze,
 
@@ -243,55 +394,595 @@ class StatisticsBikeshare:
         Returns:
             df - Pandas DataFrame containing specified cities' data filtered by month(s) and day(s)
         """
-        # load data file into a dataframe
-        self.df = pd.concat((pd.read_csv(self.CITY_DATA[city]) for city in list(cities)), ignore_index=True)
+        self.load_tables(cities, months, days)
+        return self.df
 
-        if self.col_check('Start Time'):
-            # convert the Start Time column to datetime
-            self.df['Start Time'] = pd.to_datetime(self.df['Start Time'])
+    def load_tables(self, cities, months, days):
+        """
+        Loads every city's rows matching months and days into a TableRegistry, one frame per city in its own schema.
 
-            # extract Month and Day of Week from Start Time to create new columns
-            self.df['Month'] = self.df['Start Time'].dt.month
-            self.df['Day of week'] = self.df['Start Time'].dt.day_name()
+        Parameters:
+            (set) cites     - names of the cities to analyze,
 
-        if self.col_check('Birth Year'):
+            (set) months    - numbers of the months to filter by,
+
+            (set) days      - names of the days to filter by
+
+        Returns:
+            (TableRegistry) tables - the loaded cities, also kept in self.tables
+        """
+        from tables_bikeshare import TableRegistry
+
+        # stream each city's data and keep only the rows matching months and days
+        self.filters = (cities, months, days)
+        self.scan_counts = {}
+        self.memory_usage = {'before': 0, 'after': 0}
+        tables = TableRegistry()
+        with self.stage('load_data') as stage:
+            for city in sorted(cities):
+                self.scan_counts[city] = {'scanned': 0, 'kept': 0}
+                df = self.load_city(city, months, days, self.scan_counts[city], self.memory_usage)
+                # keep the rows sorted by Start Time, so select() slices time ranges out by binary search
+                with self.stage('sort', len(df)):
+                    tables.add(city, df)
+                print('Loaded {}: {} rows scanned, {} rows kept'.format(city, self.scan_counts[city]['scanned'], self.scan_counts[city]['kept']))
+            stage.rows_in = sum(counts['scanned'] for counts in self.scan_counts.values())
+            stage.rows_out = tables.rows()
+        self.memory_usage['after'] = tables.memory_footprint()
+        print('Memory footprint: {:.1f} MB ({:.1f} MB before compacting dtypes)'.format(self.memory_usage['after'] / 2**20, self.memory_usage['before'] / 2**20))
+        print('-'*48+'\n')
+
+        self.df = None
+        self.tables = tables
+        self.stats = None
+        return tables
+
+
+    def load_city(self, city, months, days, counts=None, memory_usage=None):
+        """
+        Loads one city's rows matching months and days in the compact schema and adds the Age column.
+
+        If memory_usage is given, the footprint of the rows before compacting is added to memory_usage['before'].
+        """
+        from cache_bikeshare import concat_frames
+
+        if counts is None:
+            counts = {}
+        with self.stage('load_city:' + city) as stage:
+            df = self.enrich(concat_frames(list(self.scan_city(city, months, days, counts))), memory_usage)
+            stage.rows_in = counts.get('scanned', 0)
+            stage.rows_out = len(df)
+        return df
+
+    def enrich(self, df, memory_usage=None):
+        """Adds the Age column to loaded rows and converts them to the compact schema (see load_city)."""
+        from cache_bikeshare import compact_frame, memory_footprint
+
+        if 'Birth Year' in df.columns:
             # extract Age from Birth Year to create new column
-            self.df['Age'] = self.df['Birth Year'].astype('Int64').apply(self.to_age)
+            with self.stage('age', len(df)):
+                df['Age'] = self.ages(df['Birth Year'])
+
+        if memory_usage is not None:
+            memory_usage['before'] = memory_usage.get('before', 0) + memory_footprint(df)
+        with self.stage('compact', len(df)):
+            return compact_frame(df)
 
-        # getting the corresponding int type numpy array
-        months = np.array(list(months)).astype(int)
+    def select(self, where):
+        """
+        Rows of the loaded data kept by a TimeFilter (eg. a date range, holidays or the commute hours).
 
-        # filter by month to create the new dataframe
-        self.df = self.df[self.df['Month'].isin(months)]
+        The rows are sorted by Start Time, so they are found by binary search and sliced out, without a boolean mask.
+        """
+        from timeindex_bikeshare import TimeIndex
 
-        # filter by day of week to create the new dataframe
-        self.df = self.df[self.df['Day of week'].isin(days)]
+        with self.stage('select') as stage:
+            rows = self.tables.select(where) if self.tables is not None else TimeIndex(self.df).select(where)
+            stage.rows_out = len(rows)
+        return rows
 
-        return self.df
+    def aggregate_city(self, city, months, days):
+        """Worker task of aggregate_parallel: returns one city's aggregates and scan counts."""
+        from aggregate_bikeshare import TripAggregates
+
+        counts = {'scanned': 0, 'kept': 0}
+        if self.streaming:
+            return self.stream_city(city, months, days, counts), counts
+        return TripAggregates.from_frame(self.load_city(city, months, days, counts), self.sketch_capacity, city), counts
+
+    def stream_city(self, city, months, days, counts=None):
+        """
+        Aggregates one city's rows matching months and days chunk by chunk, as they are scanned.
+
+        Every chunk gets the Age column and the compact schema (see enrich), is aggregated and dropped, so at most
+        chunksize rows are in memory at a time. The merged counts, sums and group partials equal those of load_city.
+        """
+        from aggregate_bikeshare import TripAggregates
+
+        if counts is None:
+            counts = {}
+        with self.stage('stream_city:' + city) as stage:
+            stats = TripAggregates.merge_all(TripAggregates.from_frame(self.enrich(chunk), self.sketch_capacity, city)
+                                             for chunk in self.scan_city(city, months, days, counts, build=False))
+            stage.rows_in = counts.get('scanned', 0)
+            stage.rows_out = stats.rows
+        return stats
+
+    def aggregate_streaming(self, cities, months, days):
+        """
+        Aggregates every city chunk by chunk (see stream_city), for data that does not fit in memory.
+
+        Parameters:
+            (set) cites     - names of the cities to analyze,
+
+            (set) months    - numbers of the months to filter by,
+
+            (set) days      - names of the days to filter by
+
+        Returns:
+            stats - TripAggregates of the specified cities' data filtered by month(s) and day(s)
+        """
+        from aggregate_bikeshare import TripAggregates
+
+        self.filters = (cities, months, days)
+        self.scan_counts = {}
+        partials = []
+        for city in sorted(cities):
+            self.scan_counts[city] = {'scanned': 0, 'kept': 0}
+            partials.append(self.stream_city(city, months, days, self.scan_counts[city]))
+            print('Loaded {}: {} rows scanned, {} rows kept'.format(city, self.scan_counts[city]['scanned'], self.scan_counts[city]['kept']))
+        print('-'*48+'\n')
+
+        # rows are not kept; browse() reads them lazily
+        self.df = None
+        self.stats = TripAggregates.merge_all(partials)
+        return self.stats
+
+    def aggregate_parallel(self, cities, months, days, workers=None):
+        """
+        Loads and aggregates every city in its own worker process and merges the partial aggregates.
+
+        Parameters:
+            (set) cites     - names of the cities to analyze,
+
+            (set) months    - numbers of the months to filter by,
+
+            (set) days      - names of the days to filter by,
+
+            (int) workers   - worker processes (defaults to self.workers, then to the number of CPUs)
+
+        Returns:
+            stats - TripAggregates of the specified cities' data filtered by month(s) and day(s)
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        from aggregate_bikeshare import TripAggregates
+
+        self.filters = (cities, months, days)
+        cities = sorted(cities)
+        workers = min(workers or self.workers or os.cpu_count() or 1, len(cities))
+        with self.stage('aggregate_parallel') as stage, ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(self.aggregate_city, cities, repeat(months), repeat(days)))
+            stage.rows_in = sum(counts['kept'] for _, counts in results)
+
+        self.scan_counts = {}
+        for city, (_, counts) in zip(cities, results):
+            self.scan_counts[city] = counts
+            print('Loaded {}: {} rows scanned, {} rows kept'.format(city, counts['scanned'], counts['kept']))
+        print('-'*48+'\n')
+
+        # rows are not kept; browse() reads them lazily
+        self.df = None
+        self.stats = TripAggregates.merge_all(agg for agg, _ in results)
+        return self.stats
+
+    def build_cube(self, cities, workers=None):
+        """
+        Loads every city once and returns a StatsCube of their (month, weekday, hour) partials.
 
+        With workers (or self.workers) set, the cities are loaded and summarized in worker processes.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        from cube_bikeshare import StatsCube
+
+        cities = sorted(cities)
+        cube = StatsCube()
+        workers = workers or self.workers
+        with self.stage('build_cube'):
+            if workers:
+                with ProcessPoolExecutor(max_workers=min(workers, len(cities))) as pool:
+                    results = list(pool.map(self.cube_city, cities))
+            else:
+                results = [self.cube_city(city) for city in cities]
+        self.refreshed = {}
+        for city, (partials, read) in zip(cities, results):
+            cube.cities[city] = partials
+            self.refreshed[city] = read
+        return cube
+
+    def cube_city(self, city):
+        """
+        Cell partials of every partition of one whole city (every month and day).
+
+        With the cache enabled, the partials are persisted per partition file and only new or changed partitions are read.
+
+        Returns:
+            (list) partials - cell partials of the partitions with trips,
+
+            (int) read      - number of partition files read
+        """
+        from ingest_bikeshare import PartitionStore, partition_paths
+
+        paths = partition_paths(self.CITY_DATA[city])
+        if self.cache_dir is None:
+            partials = [self.partition_partials(path, city) for path in paths]
+            return [p for p in partials if p is not None], len(paths)
+        from cube_bikeshare import PARTIALS_VERSION
+
+        store = PartitionStore(os.path.join(self.cache_dir, 'partials'), '{}:{}'.format(self.today().year, PARTIALS_VERSION), self.tracer)
+        partials, built = store.refresh(paths, lambda path: self.partition_partials(path, city))
+        print('Refreshed {}: {} of {} partitions read'.format(city, len(built), len(paths)))
+        return partials, len(built)
+
+    def partition_partials(self, path, city=None):
+        """Cell partials of one partition file of city (None if it has no trips)."""
+        from cache_bikeshare import concat_frames
+        from cube_bikeshare import StatsCube
+
+        # every trip of the partition: the hour windows of where are answered by the cube queries
+        df = self.enrich(concat_frames(list(self.scan_path(path, [str(m) for m in range(1, 13)], self.week_days.values(), narrow=False))))
+        if 'Start Time' not in df.columns:
+            return None
+        return StatsCube.city_partials(df, city)
+
+    def aggregate_incremental(self, cities, months, days):
+        """
+        Aggregates cities from the persisted partials of their partitions, reading only new or changed partition files.
+
+        Parameters:
+            (set) cites     - names of the cities to analyze,
+
+            (set) months    - numbers of the months to filter by,
+
+            (set) days      - names of the days to filter by
+
+        Returns:
+            stats - TripAggregates of the specified cities' data filtered by month(s) and day(s)
+        """
+        from timeindex_bikeshare import TimeFilter, WEEKDAYS
+
+        self.filters = (cities, months, days)
+        time_filter = TimeFilter.from_filters(months, days, self.where)
+        if time_filter.has_dates():
+            raise ValueError('date ranges and dates need a scan of the trips; they cannot be answered incrementally')
+        months = [str(m) for m in time_filter.months]
+        days = [WEEKDAYS[d] for d in time_filter.days]
+        hours = time_filter.hour_list()
+
+        cube = self.build_cube(cities)
+        self.scan_counts = {}
+        for city in sorted(cities):
+            kept = cube.query({city}, months, days, hours).rows
+            self.scan_counts[city] = {'scanned': sum(int(p['cells']['size'].sum()) for p in cube.cities[city]), 'kept': kept}
+            print('Loaded {}: {} rows scanned, {} rows kept'.format(city, self.scan_counts[city]['scanned'], kept))
+        print('-'*48+'\n')
+
+        # rows are not kept; browse() reads them lazily
+        self.df = None
+        with self.stage('cube_query'):
+            self.stats = cube.query(cities, months, days, hours)
+        if self.sketch_capacity:
+            self.stats.sketch(self.sketch_capacity)
+        return self.stats
+
+    def aggregate_sample(self, cities, months, days):
+        """
+        Aggregates a random sample of sample_size of the cities' rows matching months and days (see sample_bikeshare).
+
+        From columnar cache entries only the sampled rows are read, so a quick look takes about the same time whatever
+        the size of the data; files without an entry are streamed once through bounded reservoirs (and not cached).
+        The estimates of the statistics of all the rows are kept in sample_estimate.
+
+        Parameters:
+            (set) cites     - names of the cities to analyze,
+
+            (set) months    - numbers of the months to filter by,
+
+            (set) days      - names of the days to filter by
+
+        Returns:
+            stats - TripAggregates of the sample
+        """
+        import numpy as np
+        from aggregate_bikeshare import TripAggregates
+        from cache_bikeshare import concat_frames
+        from ingest_bikeshare import partition_paths
+        from sample_bikeshare import allocate, estimate
+
+        self.filters = (cities, months, days)
+        rng = np.random.default_rng(self.sample_seed)
+        self.scan_counts = {}
+        units = []
+        with self.stage('sample') as stage:
+            for city in sorted(cities):
+                self.scan_counts[city] = {'scanned': 0, 'kept': 0}
+                for path in partition_paths(self.CITY_DATA[city]):
+                    units.extend((city, month, unit) for month, unit in self.sample_units(path, months, days, self.scan_counts[city], rng))
+            population = sum(unit.population for _, _, unit in units)
+            sizes = allocate([unit.population for _, _, unit in units], self.sample_size,
+                             ['{}:{}'.format(city, month) for city, month, _ in units] if self.stratified else None, rng)
+            frames = {}
+            for (city, _, unit), size in zip(units, sizes):
+                if size:
+                    frames.setdefault(city, []).append(unit.draw(size))
+            samples = {city: self.enrich(concat_frames(parts)) for city, parts in frames.items()}
+            stage.rows_in, stage.rows_out = population, int(sizes.sum())
+        print('Quick look: {} of {} rows sampled ({})'.format(int(sizes.sum()), population, 'stratified by city and month' if self.stratified else 'uniformly')
+              +'\n'+'-'*48+'\n')
+
+        # rows are not kept; browse() reads them lazily
+        self.df = None
+        with self.stage('aggregate', int(sizes.sum())):
+            self.stats = TripAggregates.merge_all([TripAggregates.from_frame(sample, self.sketch_capacity, city) for city, sample in sorted(samples.items())])
+        durations = np.concatenate([[]] + [sample['Trip Duration'].to_numpy(dtype='float64') for sample in samples.values() if 'Trip Duration' in sample.columns])
+        if len(durations) < self.stats.rows:
+            # cities without durations count as missing ones
+            durations = np.concatenate([durations, np.full(self.stats.rows - len(durations), np.nan)])
+        self.sample_estimate = estimate(self.stats, durations, population)
+        return self.stats
+
+    def sample_units(self, path, months, days, counts, rng):
+        """
+        (month, unit) of every month of one partition file the sample rows are drawn from (see aggregate_sample).
+
+        Units of a cache entry are the row ranges of the month (sample_bikeshare.MappedUnit); a file without a cache
+        entry (yet) is scanned once into a sample_bikeshare.Reservoir per month rather than parsed whole into a new
+        entry, so a quick look on a cold cache costs one streaming pass, not a full load.
+        """
+        from cache_bikeshare import ColumnarCache, scan_csv
+        from sample_bikeshare import MappedUnit, Reservoir
+        from timeindex_bikeshare import TimeFilter, TimeIndex
+
+        df = None
+        if self.cache_dir is not None:
+            with self.stage('cache_load'):
+                df = ColumnarCache(self.cache_dir, self.tracer).load(path)
+        if df is None:
+            reservoirs = {}
+            for chunk in scan_csv(path, months, days, self.chunksize, counts, self.tracer, self.where):
+                for month, rows in chunk.groupby('Month', sort=True):
+                    reservoirs.setdefault(int(month), Reservoir(self.sample_size, rng)).add(rows)
+            return sorted(reservoirs.items())
+
+        counts['scanned'] += len(df)
+        if 'Start Time' not in df.columns:
+            return []
+        index = TimeIndex(df, assume_sorted=True)
+        units = [(int(month), MappedUnit(df, *index.ranges(TimeFilter.from_filters({month}, days, self.where)), rng))
+                 for month in sorted(months, key=int)]
+        counts['kept'] += sum(unit.population for _, unit in units)
+        return [(month, unit) for month, unit in units if unit.population]
+
+    def build_rollup(self, cities, months, days):
+        """
+        Departures and arrivals of the cities' rows matching months and days by station, weekday and hour.
+
+        The rows are scanned chunk by chunk (see stream_city), so the memory does not grow with the data.
+
+        Returns:
+            StationRollup of every city
+        """
+        from rollup_bikeshare import StationRollup
+
+        with self.stage('rollup') as stage:
+            rollup = StationRollup.merge_all(StationRollup.from_frame(chunk) for city in sorted(cities)
+                                             for chunk in self.scan_city(city, months, days, build=False))
+            stage.rows_out = len(rollup.stations)
+        return rollup
+
+    def compute_stats(self, cities, months, days):
+        """
+        Loads or aggregates the cities' rows matching months and days the configured way (a random sample of them
+        with sample_size set), unless the result cache has their statistics already.
+
+        Returns:
+            (str) key   - result cache key of the filters and data files (None with the result cache disabled)
+        """
+        # quick looks are not cached: they are cheap and their estimates are not the statistics
+        cache = None if self.sample_size else self.result_cache()
+        self.memo_hit, self.memo_plots = None, {}
+        self.sample_estimate = None
+        key = None
+        if cache is not None:
+            with self.stage('memo_lookup'):
+                key = self.result_key(cities, months, days)
+                cached = cache.get(key)
+            self.memo_hit = cached is not None
+            if cached is not None:
+                print('Cached statistics of {} (the data files did not change)'.format(', '.join(sorted(cities)))+'\n'+'-'*48+'\n')
+                self.filters = (cities, months, days)
+                self.df = None
+                self.stats = cached['stats']
+                self.scan_counts = cached['scan_counts']
+                self.refreshed = {}
+                self.memo_plots = cached['plots']
+                return key
+
+        if self.sample_size:
+            self.aggregate_sample(cities, months, days)
+        elif self.incremental:
+            self.aggregate_incremental(cities, months, days)
+        elif self.workers:
+            self.aggregate_parallel(cities, months, days)
+        elif self.streaming:
+            self.aggregate_streaming(cities, months, days)
+        else:
+            self.load_tables(cities, months, days)
+        return key
+
+    def result_cache(self):
+        """ResultCache of the runs in <cache_dir>/results, None if caching is disabled."""
+        from memo_bikeshare import ResultCache
+
+        if not self.memo or self.cache_dir is None:
+            return None
+        return ResultCache(os.path.join(self.cache_dir, 'results'), self.memo_max_bytes)
+
+    def result_key(self, cities, months, days):
+        """Result cache key of the normalized filters, the options changing the statistics or plots and the cities' data files."""
+        from memo_bikeshare import ResultCache
+        from cache_bikeshare import source_key
+        from ingest_bikeshare import partition_paths
+
+        return ResultCache.key(cities=sorted(cities), months=sorted(months, key=int), days=sorted(days),
+                               where=None if self.where is None else self.where.to_dict(), capacity=self.sketch_capacity, age_bands=self.age_bands,
+                               year=self.today().year, data={city: [source_key(path) for path in partition_paths(self.CITY_DATA[city])]
+                                                             for city in sorted(cities)})
+
+    def remember(self, key, plots=()):
+        """Stores the statistics (and plot files) of a run computed by compute_stats in the result cache."""
+        if key is None or self.memo_hit:
+            return
+        with self.stage('memo_store'):
+            self.result_cache().put(key, {'stats': self.aggregate(), 'scan_counts': self.scan_counts},
+                                    {os.path.splitext(os.path.basename(path))[0]: path for path in plots})
+
+    def batch_stats(self, specs, workers=None):
+        """
+        Answers many filter combinations from a single load of each city involved (narrowed by where, without dates).
+
+        Parameters:
+            (list) specs    - (cities, months, days) filter sets, as returned by get_filters
+
+        Returns:
+            list of TripAggregates, one per spec
+        """
+        from timeindex_bikeshare import TimeFilter, WEEKDAYS
+
+        if self.where is not None and self.where.has_dates():
+            raise ValueError('date ranges and dates need a scan of the trips; they cannot be answered from the cube')
+        queries = []
+        for cities, months, days in specs:
+            time_filter = TimeFilter.from_filters(months, days, self.where)
+            queries.append((cities, [str(m) for m in time_filter.months], [WEEKDAYS[d] for d in time_filter.days], time_filter.hour_list()))
+        cube = self.build_cube(set().union(*(spec[0] for spec in specs)), workers)
+        with self.stage('cube_query') as stage:
+            stage.rows_out = len(specs)
+            results = [cube.query(*query) for query in queries]
+        if self.sketch_capacity:
+            for stats in results:
+                stats.sketch(self.sketch_capacity)
+        return results
+
+    def __getstate__(self):
+        # worker processes get the configuration, not the loaded data
+        state = self.__dict__.copy()
+        state.pop('_df', None)
+        state.pop('tables', None)
+        state.pop('stats', None)
+        state.pop('tracer', None)
+        state.pop('plot_renderer', None)
+        return state
+
+    def read_city(self, city):
+        """Reads and parses one city's CSV files, through the columnar cache if enabled."""
+        from cache_bikeshare import concat_frames
+        from ingest_bikeshare import partition_paths
+
+        return concat_frames([self.read_path(path) for path in partition_paths(self.CITY_DATA[city])])
+
+    def read_path(self, path):
+        from cache_bikeshare import ColumnarCache, parse_csv
+
+        if self.cache_dir is None:
+            with self.stage('read_csv'):
+                return parse_csv(path)
+        return ColumnarCache(self.cache_dir, self.tracer).read(path)
+
+    def scan_city(self, city, months, days, counts=None, build=True):
+        """
+        Yields the chunks of one city's data matching months and days, updating counts['scanned'] and counts['kept'].
+
+        Without build, files that have no columnar cache entry yet are streamed from the CSV instead of being parsed
+        whole into one (see ColumnarCache.scan), so at most chunksize rows are in memory.
+        """
+        from ingest_bikeshare import partition_paths
+
+        for path in partition_paths(self.CITY_DATA[city]):
+            yield from self.scan_path(path, months, days, counts, build=build)
+
+    def scan_path(self, path, months, days, counts=None, narrow=True, build=True):
+        """scan_city of a single CSV file (narrowed by where unless narrow is False)."""
+        from cache_bikeshare import ColumnarCache, scan_csv
+
+        where = self.where if narrow else None
+        if self.cache_dir is None:
+            return scan_csv(path, months, days, self.chunksize, counts, self.tracer, where)
+        return ColumnarCache(self.cache_dir, self.tracer).scan(path, months, days, self.chunksize, counts, where, build)
+
+    def stage(self, name, rows_in=None):
+        """Context manager timing one pipeline stage on self.tracer (see Tracer.stage)."""
+        if self.tracer is None:
+            self.tracer = Tracer()
+        return self.tracer.stage(name, rows_in)
+
+    def wait(self):
+        """Context manager excluding a blocking wait (prompt, plot window) from the open stages."""
+        if self.tracer is None:
+            self.tracer = Tracer()
+        return self.tracer.wait()
+
+    def start_trace(self):
+        """Starts a new trace for the next run."""
+        self.tracer = Tracer(self.trace_memory, self.profile).start()
+        return self.tracer
+
+    def finish_trace(self):
+        """Stops the trace of the run and writes it to trace_path (if set)."""
+        if self.tracer is None:
+            return
+        if self.trace_path is not None:
+            self.tracer.export(self.trace_path)
+        self.tracer.stop()
+
+    def aggregate(self):
+        """Returns the aggregates of the loaded data, computing them in one pass on first use."""
+        from aggregate_bikeshare import TripAggregates
+
+        if self.stats is None:
+            if self.tables is not None:
+                # per city on the native schemas, merged
+                with self.stage('aggregate', self.tables.rows()) as stage:
+                    self.stats = self.tables.aggregate(self.sketch_capacity)
+                    stage.rows_out = self.stats.rows
+                return self.stats
+            with self.stage('aggregate', len(self.df)) as stage:
+                self.stats = TripAggregates.from_frame(self.df, self.sketch_capacity)
+                stage.rows_out = self.stats.rows
+        return self.stats
 
     def time_stats(self):
         """Displays statistics on the most frequent times of travel."""
 
         print('| Calculating The Most Frequent Times of Travel... |\n\n')
-        start_time = time.time()
+        with self.stage('time_stats') as stage:
+            stats = self.aggregate()
 
-        if self.col_check('Start Time'):
-            # display the most common start hour
-            print('Most popular start hour:\n  {}\n'.format(self.df['Start Time'].dt.hour.mode()[0])+'-'*10)
+            if stats.hour is not None and stats.rows:
+                # display the most common start hour
+                print('Most popular start hour:\n  {}\n'.format(stats.most_common_hour())+'-'*10)
 
-            # display the most common month
-            print('Most popular months:\n  {}\n'.format(self.df['Start Time'].dt.month_name().mode()[0])+'-'*10)
-        else:
-            print('No start time data to share.\n'+'-'*10)
+                # display the most common month
+                print('Most popular months:\n  {}\n'.format(calendar.month_name[stats.most_common_month()])+'-'*10)
+            else:
+                print('No start time data to share.\n'+'-'*10)
 
-        if self.col_check('Day of week'):
-            # display the most common day of week
-            print('Most popular day:\n  {}\n'.format(self.df['Day of week'].mode()[0])+'-'*10)
-        else:
-            print('No day data to share.\n'+'-'*10)
+            if stats.weekday is not None and stats.rows:
+                # display the most common day of week
+                print('Most popular day:\n  {}\n'.format(stats.most_common_day())+'-'*10)
+            else:
+                print('No day data to share.\n'+'-'*10)
 
-        print("This took %s seconds.\n" % (time.time() - start_time)+'-'*48)
+        print("This took %s seconds.\n" % stage.seconds+'-'*48)
         if not self.bulk:
             self.not_bulk()
 
@@ -299,27 +990,33 @@ class StatisticsBikeshare:
         """Displays statistics on the most popular stations and trip."""
 
         print('| Calculating The Most Popular Stations and Trip... |\n\n')
-        start_time = time.time()
-
-        if self.col_check('Start Station'):
-            # display most commonly used start station
-            print('Most popular Start Station:\n  {}\n'.format(self.df['Start Station'].mode()[0])+'-'*10)
-        else:
-            print('No start station data to share.\n''-'*10)
-
-        if self.col_check('End Station'):
-            # display most commonly used end station
-            print('Most popular End Station:\n  {}\n'.format(self.df['End Station'].mode()[0])+'-'*10)
-        else:
-            print('No end station data to share.\n'+'-'*10)
-
-        if self.col_check('Start Station') and self.col_check('End Station'):
-            # display most frequent combination of start station and end station trip
-            print('Most popular Start - End Stations combo:\n  {}\n'.format((self.df['Start Station'] + ' - ' + self.df['End Station']).mode()[0])+'-'*10)
-        else:
-            print('No start station or end station data to share.\n'+'-'*10)
-
-        print("This took %s seconds.\n" % (time.time() - start_time)+'-'*48)
+        with self.stage('station_stats') as stage:
+            stats = self.aggregate()
+
+            if stats.start_station is not None and stats.rows:
+                # display most commonly used start station
+                print('Most popular Start Station:\n  {}\n'.format(stats.most_common_start_station())+'-'*10)
+            else:
+                print('No start station data to share.\n'+'-'*10)
+
+            if stats.end_station is not None and stats.rows:
+                # display most commonly used end station
+                print('Most popular End Station:\n  {}\n'.format(stats.most_common_end_station())+'-'*10)
+            else:
+                print('No end station data to share.\n'+'-'*10)
+
+            if stats.trip is not None and stats.rows:
+                # display most frequent combination of start station and end station trip
+                print('Most popular Start - End Stations combo:\n  {}\n'.format(' - '.join(stats.most_common_trip()))+'-'*10)
+            else:
+                print('No start station or end station data to share.\n'+'-'*10)
+
+            if stats.capacity is not None:
+                # approximate counts: the true count of every station and trip is at most this much higher
+                print('Approximate counts (top {} kept), count error at most:\n  stations {} / {}, trips {}\n'.format(
+                    stats.capacity, stats.errors['start_station'], stats.errors['end_station'], stats.errors['trip'])+'-'*10)
+
+        print("This took %s seconds.\n" % stage.seconds+'-'*48)
         if not self.bulk:
             self.not_bulk()
 
@@ -327,107 +1024,239 @@ class StatisticsBikeshare:
         """Displays statistics on the total and average trip duration."""
 
         print('| Calculating Trip Duration... |\n\n')
-        start_time = time.time()
+        with self.stage('trip_duration_stats') as stage:
+            stats = self.aggregate()
 
-        if self.col_check('Trip Duration'):
-            # converting seconds to dd:hh:mm:ss
-            duration_days = pd.to_timedelta(self.df['Trip Duration'], unit='s')
+            if stats.duration_count:
+                import pandas as pd
 
-            # display total travel time
-            print('Total Trip Duration:\n  {}\n'.format(duration_days.sum())+'-'*10)
+                # display total travel time (converted from seconds to dd:hh:mm:ss)
+                print('Total Trip Duration:\n  {}\n'.format(pd.to_timedelta(stats.total_duration(), unit='s'))+'-'*10)
 
-            # display mean travel time
-            print('Average Trip Duration:\n  {}\n'.format(duration_days.mean(skipna = True))+'-'*10)
-        else:
-            print('No trip duration data to share.\n'+'-'*10)
+                # display mean travel time
+                print('Average Trip Duration:\n  {}\n'.format(pd.to_timedelta(stats.mean_duration(), unit='s'))+'-'*10)
+
+                sketches = stats.duration_sketches()
+                if 'All' in sketches:
+                    # display the percentiles and outliers (overall, by user type, gender and city) and the histogram
+                    print('Trip Duration percentiles (minutes, within 1%):\n{}\n'.format(self.duration_table(sketches))+'-'*10)
+                    print('Trip Duration histogram:\n{}\n'.format(self.duration_histogram(sketches['All']))+'-'*10)
+            else:
+                print('No trip duration data to share.\n'+'-'*10)
 
-        print("This took %s seconds.\n" % (time.time() - start_time)+'-'*48)
+        print("This took %s seconds.\n" % stage.seconds+'-'*48)
         if not self.bulk:
             self.not_bulk()
 
+    def duration_table(self, sketches):
+        """Percentile and outlier lines of the duration sketches (see TripAggregates.duration_sketches)."""
+        rows = [('All trips', sketches['All'])]
+        rows += [('{}: {}'.format(group, value), sketch) for group in sorted(g for g in sketches if g != 'All')
+                 for value, sketch in sorted(sketches[group].items())]
+        lines = []
+        for label, sketch in rows:
+            percentiles = '  '.join('{} {:7.1f}'.format(p, v / 60) for p, v in sketch.percentiles().items())
+            lines.append('  {:<28} {:>9} trips  {}  outliers {} (> {:.1f})'.format(label, sketch.count(), percentiles, sketch.outliers(), sketch.outlier_fence() / 60))
+        return '\n'.join(lines)
+
+    def duration_histogram(self, sketch):
+        """Log-binned histogram lines of a duration sketch, with bars."""
+        from duration_bikeshare import HISTOGRAM_EDGES
+
+        counts = sketch.histogram()
+        lines = []
+        for i, n in enumerate(counts):
+            label = '>= {:g} min'.format(HISTOGRAM_EDGES[i] / 60) if i == len(counts) - 1 else '{:g}-{:g} min'.format(HISTOGRAM_EDGES[i] / 60, HISTOGRAM_EDGES[i + 1] / 60)
+            lines.append('  {:>14} {:>9} {}'.format(label, n, '#' * int(round(40 * n / max(counts.max(), 1)))))
+        return '\n'.join(lines)
+
     def user_stats(self):
         """Displays statistics on bikeshare users."""
 
         print('|  Calculating User Stats...  |\n')
-        start_time = time.time()
+        with self.stage('user_stats') as stage:
+            stats = self.aggregate()
+
+            if stats.user_type is not None:
+                # display counts of user types
+                print('Counts of User Types:\n  {}\n'.format(stats.user_type)+'-'*10)
+            else:
+                print('No user type data to share.\n'+'-'*10)
+
+            if stats.gender is not None:
+                # display counts of gender
+                print('Counts of Gender:\n  {}\n'.format(stats.gender)+'-'*10)
+            else:
+                print('No gender data to share.\n'+'-'*10)
+
+
+            if stats.birth_year is not None and len(stats.birth_year):
+                # display earliest, most recent, and most common year of birth
+                print('Earliest year of birth among participants:\n  {}\n'.format(stats.earliest_birth_year())+'-'*10)
+                print('Most recent year of birth among participants:\n  {}\n'.format(stats.most_recent_birth_year())+'-'*10)
+                print('Most common year of birth among participants:\n  {}\n'.format(stats.most_common_birth_year())+'-'*10)
+
+            cohorts = stats.cohort_table(self.age_bands)
+            if cohorts is not None:
+                # trips, mean and median trip duration by age band, month and gender, shared with the age plot
+                print('Trip duration by age band, month and gender:\n{}\n'.format(cohorts.to_string(index=False))+'-'*10)
+
+                # plot for Avg. Trip Duration distributed by age groups
+                with self.stage('plot_age_groups', len(cohorts)):
+                    self.plot_age_groups(cohorts)
+            else:
+                print('No birth year data to share.\n'+'-'*10)
+
+            if stats.gender_month is not None and len(stats.gender_month):
+                # average trip duration by month distributed by gender
+                gender_month_mean = stats.gender_month_mean()
+                print('Avg. Trip Duration by Month distributed by Gender:\n  {}\n'.format(gender_month_mean)+'-'*10)
+
+                # creating new DataFrame for transparency 
+                df_gender = gender_month_mean.reset_index()
+
+                # plot for Avg. Trip Duration by Month distributed by Gender
+                with self.stage('plot_gender_month', len(df_gender)):
+                    self.plot_gender_month(df_gender)
+            else:
+                print('No gender or trip duration or month data to share.\n'+'-'*10)
+
+        print("This took %s seconds.\n" % stage.seconds+'-'*48)
+
+    def sample_stats(self):
+        """Displays how far the statistics of the last quick look can be trusted (see sample_bikeshare.estimate)."""
+        summary = self.sample_estimate
+        level = '{:.0%}'.format(summary['confidence'])
+
+        print('|  Quick Look Confidence ({} of {} rows sampled)  |\n'.format(summary['sample_rows'], summary['population']))
+        for name, sampled in summary['modes'].items():
+            # display every mode with the probability that all the rows have the same one
+            print('Most common {}:\n  {} (the exact one with probability {:.0%})\n'.format(name.replace('_', ' '), sampled['value'], sampled['agreement'])+'-'*10)
+        for key, label in (('mean_duration', 'Average Trip Duration'), ('total_duration', 'Total Trip Duration')):
+            if key in summary:
+                print('{} ({} confidence interval, seconds):\n  {:.1f} ({:.1f} to {:.1f})\n'.format(label, level, summary[key]['estimate'], summary[key]['low'],
+                                                                                                   summary[key]['high'])+'-'*10)
+        for key, label in (('user_types', 'User Types'), ('genders', 'Gender')):
+            if key in summary:
+                # display the counts scaled to all the rows
+                print('Estimated Counts of {} ({} confidence interval):\n{}\n'.format(label, level, '\n'.join(
+                    '  {}: {:.0f} ({:.0f} to {:.0f})'.format(value, bounds['estimate'], bounds['low'], bounds['high']) for value, bounds in summary[key].items()))+'-'*10)
+        print('-'*38)
+
+    def refine_sample(self, cities, months, days):
+        """
+        Computes the exact statistics of the filters of the last quick look and compares them with its estimates.
 
-        if self.col_check('User Type'):
-            # display counts of user types
-            print('Counts of User Types:\n  {}\n'.format(self.df.groupby(['User Type'])['User Type'].count())+'-'*10)
-        else:
-            print('No user type data to share.\n'+'-'*10)
+        Returns:
+            (dict) refined  - see sample_bikeshare.refine
+        """
+        from sample_bikeshare import refine
+
+        summary = self.sample_estimate
+        sample_size, self.sample_size = self.sample_size, None
+        try:
+            key = self.compute_stats(cities, months, days)
+            self.remember(key)
+        finally:
+            self.sample_size = sample_size
+        with self.stage('refine'):
+            refined = refine(summary, self.aggregate())
+
+        agreed = [name for name, compared in refined['modes'].items() if compared['agreed']]
+        print('Exact statistics: {} of {} sampled modes agreed{}\n'.format(len(agreed), len(refined['modes']), ''.join(
+            '\n  {}: {} sampled, {} exact'.format(name, compared['sampled'], compared['exact']) for name, compared in refined['modes'].items() if not compared['agreed'])))
+        for key in ('mean_duration', 'total_duration'):
+            if key in refined:
+                print('{}: {:.1f} exact, {} the confidence interval'.format(key.replace('_', ' ').capitalize(), refined[key]['exact'],
+                                                                           'within' if refined[key]['covered'] else 'outside'))
+        print('-'*48+'\n')
+        return refined
+
+    def plot_age_groups(self, cohorts):
+        """Plots Avg. Trip Duration by Month and age band from the cohort table (see TripAggregates.cohort_table)."""
+        self.show_plot('age_groups', cohorts)
+
+    def plot_gender_month(self, df_gender):
+        """Plots Avg. Trip Duration by Month for Female and Male from the (Gender, Month) means."""
+        self.show_plot('gender_month', df_gender)
+
+    def show_plot(self, name, data, plot_dir=None):
+        """
+        Renders plot name (see plot_bikeshare.PLOTS) of data.
 
-        if self.col_check('Gender'):
-            # display counts of gender
-            print('Counts of Gender:\n  {}\n'.format(self.df.groupby(['Gender'])['Gender'].count())+'-'*10)
-        else:
-            print('No gender data to share.\n'+'-'*10)
-
-
-        if self.col_check('Birth Year'):
-            # display earliest, most recent, and most common year of birth
-            print('Earliest year of birth among participants:\n  {}\n'.format(self.df['Birth Year'].min())+'-'*10)
-            print('Most recent year of birth among participants:\n  {}\n'.format(self.df['Birth Year'].max())+'-'*10)
-            print('Most common year of birth among participants:\n  {}\n'.format(self.df['Birth Year'].mode()[0])+'-'*10)
-
-            # creating new DataFrame for transparency 
-            df_age = pd.DataFrame(self.df.groupby(['Age', 'Month'])['Trip Duration'].mean()).reset_index()
-            print('Average trip duration among participants\' younger than 20 years\':\n {}\n'.format(df_age[['Age', 'Trip Duration', 'Month']].loc[df_age['Age'] < 20])+'-'*10)
-
-            # plot for Avg. Trip Duration distributed by age groups
-            plt.plot(df_age['Month'].loc[(df_age['Age'] < 30)], df_age['Trip Duration'].loc[(df_age['Age'] < 30)], 'm.', label = 'age < 30')
-            plt.plot(df_age['Month'].loc[(df_age['Age'] > 30) & (df_age['Age'] < 60)],
-                     df_age['Trip Duration'].loc[(df_age['Age'] > 30) & (df_age['Age'] < 60)], 'b.', alpha = 0.5, label = '30 < age < 60')
-            plt.plot(df_age['Month'].loc[(df_age['Age'] > 60) & (df_age['Age'] < 90)],
-                     df_age['Trip Duration'].loc[(df_age['Age'] > 60) & (df_age['Age'] < 90)], 'g.', alpha = 0.5, label = '60 < age < 90')
-            plt.plot(df_age['Month'].loc[(df_age['Age'] > 90)], df_age['Trip Duration'].loc[(df_age['Age'] > 90)], 'r.', alpha = 0.5, label = 'age > 90')
-            plt.title('Avg.Trip Duration by Month and Age groups\n age < 30, 30 < age < 60, 60 < age < 90, 90 < age')
-            plt.ylabel('Trip Duration')
-            plt.xlabel('Months')
-            plt.legend()
-            plt.show()
-        else:
-            print('No birth year data to share.\n'+'-'*10)
-
-        if self.col_check('Gender') and self.col_check('Trip Duration') and self.col_check('Month'):
-            # average trip duration by month distributed by gender
-            print('Avg. Trip Duration by Month distributed by Gender:\n  {}\n'.format(self.df.groupby(['Gender', 'Month'])['Trip Duration'].mean())+'-'*10)
-
-            # creating new DataFrame for transparency 
-            df_gender = pd.DataFrame(self.df.groupby(['Gender', 'Month'])['Trip Duration'].mean()).reset_index()
-
-            # plot for Avg. Trip Duration by Month distributed by Gender
-            plt.plot(df_gender['Month'].loc[df_gender['Gender'] == 'Female'], df_gender['Trip Duration'].loc[df_gender['Gender'] == 'Female'], 'g.-', label = 'Female')
-            plt.plot(df_gender['Month'].loc[df_gender['Gender'] == 'Male'], df_gender['Trip Duration'].loc[df_gender['Gender'] == 'Male'], 'b.-', label = 'Male')
-            plt.title('Avg.Trip Duration by Month\nFemale vs Male')
-            plt.ylabel('Trip Duration')
-            plt.xlabel('Months')
-            plt.legend()
+        With plot_dir (or self.plot_dir) set, the plot is queued to be written as <plot_dir>/<name>.png in the
+        background and its Future is returned at once; otherwise it is shown in a window, unless the run is headless.
+        """
+        plot_dir = plot_dir or self.plot_dir
+        if plot_dir is None and self.headless:
+            return None
+        # matplotlib is only imported here, once a plot is drawn
+        from plot_bikeshare import PlotRenderer, PLOTS
+
+        if plot_dir is not None:
+            if self.plot_renderer is None:
+                self.plot_renderer = PlotRenderer(self.workers or 1)
+            if name in self.memo_plots:
+                # rendered by an earlier run of the same filters (see compute_stats)
+                return self.plot_renderer.copy(self.memo_plots[name], os.path.join(plot_dir, name + '.png'))
+            return self.plot_renderer.submit(name, data, os.path.join(plot_dir, name + '.png'))
+        import matplotlib.pyplot as plt
+
+        PLOTS[name](plt.figure(), data)
+        with self.wait():
             plt.show()
-        else:
-            print('No gender or trip duration or month data to share.\n'+'-'*10)
 
-        print("This took %s seconds.\n" % (time.time() - start_time)+'-'*48)
+    def wait_plots(self):
+        """Waits until the queued plots are written and returns their paths."""
+        if self.plot_renderer is None:
+            return []
+        with self.stage('wait_plots'):
+            return self.plot_renderer.wait()
+
+    default_input_msg = '\nDo you want to check the first {} rows of the dataset related to the chosen city?\nEnter (y)yes or (n)no.\n'
+    default_print_msg = '\nFirs {} rows of dataset:\n{{}}\n'
+
+    # rows shown per page by show_five_rows
+    page_size = 5
+
+    def browse(self, page_size=None):
+        """Returns a RowBrowser over the rows of the current filters, read lazily from the CSV files or the cache."""
+        from browse_bikeshare import RowBrowser
 
-    default_input_msg = '\nDo you want to check the first 5 rows of the dataset related to the chosen city?\nEnter (y)yes or (n)no.\n'
-    default_print_msg = '\nFirs 5 rows of dataset:\n{}\n'
+        cities, months, days = self.filters
+        return RowBrowser(lambda: self.scan_rows(cities, months, days), page_size or self.page_size)
+
+    def scan_rows(self, cities, months, days):
+        """Yields the rows of cities matching months and days chunk by chunk, with the Age column."""
+        for city in sorted(cities):
+            for chunk in self.scan_city(city, months, days, build=False):
+                if 'Birth Year' in chunk.columns:
+                    chunk = chunk.assign(Age=self.ages(chunk['Birth Year']))
+                yield chunk
 
     def show_five_rows(self):
-        next_five_input_msg = '\nDo you want to check another 5 rows of the dataset?\nEnter (y)yes or (n)no.\n'
-        next_five_print_msg = '\n Next 5 rows of dataset:\n{}\n'
+        """Shows the filtered rows page by page while the user asks for more."""
+        next_five_input_msg = '\nDo you want to check another {} rows of the dataset?\nEnter (y)yes or (n)no.\n'.format(self.page_size)
+        next_five_print_msg = '\n Next {} rows of dataset:\n{{}}\n'.format(self.page_size)
+        input_msg = self.default_input_msg.format(self.page_size)
+        print_msg = self.default_print_msg.format(self.page_size)
+        browser = self.browse()
         while True:
             try:
-                check_five_rows = input(self.default_input_msg)
+                check_five_rows = input(input_msg)
                 if check_five_rows.lower() == 'yes' or check_five_rows.lower() == 'y':
-                    self.default_input_msg = next_five_input_msg
-                    print(self.default_print_msg.format(self.df.iloc[self.start:self.stop])+'-'*48+'\n')
-                    self.default_print_msg = next_five_print_msg
-                    self.start += 5
-                    self.stop += 5
-                    self.show_five_rows()
+                    with self.stage('browse_page') as stage:
+                        page = browser.next_page()
+                        stage.rows_out = len(page)
+                    if page.empty:
+                        print('\nNo more rows in dataset\n'+'-'*48+'\n')
+                        return
+                    print(print_msg.format(page)+'-'*48+'\n')
+                    input_msg = next_five_input_msg
+                    print_msg = next_five_print_msg
                 elif check_five_rows.lower() == 'no' or check_five_rows.lower() == 'n':
                     print('\nShowing no more of dataset\n'+'-'*48+'\n')
-                    self.restart_kernel()
+                    return
                 else:
                     raise InvalidInput
             except InvalidInput:
@@ -435,17 +1264,14 @@ class StatisticsBikeshare:
                 continue
 
     def restart_kernel(self):
-        self.start = 0
-        self.stop = 5
-        self.default_input_msg = '\nDo you want to check the first 5 rows of the dataset related to the chosen city?\nEnter (y)yes or (n)no.\n'
-        self.default_print_msg = '\nFirs 5 rows of dataset:\n{}\n'
+        """Asks if the user wants another run; returns True if so and exits otherwise."""
         while True:
             try:
                 restart = input('\nWould you like to restart the kernel? Enter (y)yes or (n)no.\n')
                 if restart.lower() == 'yes' or restart.lower() == 'y':
                     print('\nRestart.\n'+'-'*48+'\n')
                     os.system('cls' if os.name == 'nt' else 'clear')
-                    self.menu()
+                    return True
                 elif restart.lower() == 'no' or restart.lower() == 'n':
                     print('\nExit.\n'+'='*48+'\n')
                     exit()
@@ -456,15 +1282,257 @@ class StatisticsBikeshare:
                 continue
 
     def menu(self):
-        cities, months, days = self.get_filters()
-        self.df = self.load_data(cities, months, days)
-        self.time_stats()
-        self.station_stats()
-        self.trip_duration_stats()
-        self.user_stats()
-        self.show_five_rows()
-        
+        while True:
+            cities, months, days = self.get_filters()
+            self.start_trace()
+            try:
+                key = self.compute_stats(cities, months, days)
+                self.time_stats()
+                self.station_stats()
+                self.trip_duration_stats()
+                self.user_stats()
+                if self.sample_estimate is not None:
+                    self.sample_stats()
+                self.remember(key, self.wait_plots())
+                if self.sample_estimate is not None and self.want_refine():
+                    # the exact statistics of the quick look's filters
+                    self.refine_sample(cities, months, days)
+                    self.time_stats()
+                    self.station_stats()
+                    self.trip_duration_stats()
+                    self.user_stats()
+                    self.wait_plots()
+                self.show_five_rows()
+            finally:
+                self.finish_trace()
+            if not self.restart_kernel():
+                break
+
+    def run_batch(self, cities, months, days):
+        """
+        Runs the full statistics pipeline without prompts or plot windows.
 
-if __name__ == "__main__":
+        Parameters:
+            (set) cites         - names of the cities to analyze,
+
+            (set) months        - numbers of the months to filter by,
+
+            (set) days          - names of the days to filter by
+
+        Returns:
+            (dict) results      - JSON-serializable filters, rows scanned/kept per city and statistics
+        """
+        self.headless = True
+        self.bulk = True
+
+        print('Current filters:\n  Cities: {}\n  Months: {}\n  Days: {}\n'.format(sorted(cities), sorted(months), sorted(days))+'='*48+'\n')
+        self.start_trace()
+        try:
+            key = self.compute_stats(cities, months, days)
+            self.time_stats()
+            self.station_stats()
+            self.trip_duration_stats()
+            self.user_stats()
+            summary, refined = self.sample_estimate, None
+            if summary is not None:
+                self.sample_stats()
+            plots = self.wait_plots()
+            self.remember(key, plots)
+            if summary is not None and self.refine:
+                refined = self.refine_sample(cities, months, days)
+            if self.rollup_path is not None:
+                rollup = self.build_rollup(cities, months, days).save(self.rollup_path)
+        finally:
+            self.finish_trace()
+
+        results = {'cities': sorted(cities), 'months': sorted(months, key=int), 'days': sorted(days), 'scan_counts': self.scan_counts,
+                   'stats': self.aggregate().to_dict(self.age_bands)}
+        if self.incremental:
+            results['partitions_read'] = self.refreshed
+        if summary is not None:
+            results['sample'] = summary if refined is None else dict(summary, refined=refined)
+        if self.memo_hit is not None:
+            results['memo'] = dict(self.result_cache().stats(), hit=self.memo_hit)
+        if plots:
+            results['plots'] = plots
+        if self.rollup_path is not None:
+            results['rollup'] = rollup
+        if self.where is not None:
+            results['where'] = self.where.to_dict()
+        return results
+
+    def run_grid(self, cities, months, days):
+        """
+        Computes the statistics of every single (city, month, day) combination of the filters headlessly.
+
+        Returns:
+            (list) results  - one JSON-serializable result per combination, from one load of each city
+        """
+        self.memo_hit, self.memo_plots = None, {}
+        specs = [({city}, {month}, {day}) for city in sorted(cities) for month in sorted(months, key=int) for day in self.week_days.values() if day in days]
+        results = []
+        self.start_trace()
+        try:
+            partials = self.batch_stats(specs)
+        finally:
+            self.finish_trace()
+        for spec, stats in zip(specs, partials):
+            results.append({'cities': sorted(spec[0]), 'months': sorted(spec[1]), 'days': sorted(spec[2]), 'stats': stats.to_dict(self.age_bands)})
+            if self.plot_dir is not None:
+                # one plot directory per combination, rendered concurrently
+                results[-1]['plots'] = self.plot_stats(stats, os.path.join(self.plot_dir, '-'.join(next(iter(s)) for s in spec)))
+        self.wait_plots()
+        for result in results:
+            if 'plots' in result:
+                result['plots'] = [future.result() for future in result['plots']]
+        return results
+
+    def plot_stats(self, stats, plot_dir=None):
+        """Queues every plot that stats has data for (see show_plot) and returns their Futures."""
+        futures = []
+        cohorts = stats.cohort_table(self.age_bands)
+        if cohorts is not None:
+            futures.append(self.show_plot('age_groups', cohorts, plot_dir))
+        if stats.gender_month is not None and len(stats.gender_month):
+            futures.append(self.show_plot('gender_month', stats.gender_month_mean().reset_index(), plot_dir))
+        return [future for future in futures if future is not None]
+
+
+def main(argv=None):
+    """
+    Command line entry point.
+
+    Without arguments the interactive menu is started. With arguments the
+    statistics are computed headlessly (no prompts, no plot windows) and the
+    exit status is 0 on success, 1 if the data could not be read and 2 on
+    invalid arguments.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
     bike_stat = StatisticsBikeshare()
-    bike_stat.menu()
\ No newline at end of file
+    if not argv:
+        bike_stat.menu()
+        return 0
+
+    parser = argparse.ArgumentParser(description='US bikeshare statistics (headless run).')
+    parser.add_argument('--cities', nargs='+', default=['a'], help="city letters: c n w, or a for all (default)")
+    parser.add_argument('--months', nargs='+', default=['a'], help="month numbers 1 to 6, or a for all (default)")
+    parser.add_argument('--days', nargs='+', default=['a'], help="day letters m t w th f s su, wdays, wends, or a for all (default)")
+    parser.add_argument('--start', metavar='DATE', help='first date (or time) of the trips to analyze')
+    parser.add_argument('--end', metavar='DATE', help='last date of the trips to analyze (inclusive)')
+    parser.add_argument('--dates', nargs='+', metavar='DATE', help='only these dates (eg. holidays)')
+    parser.add_argument('--hours', nargs='+', metavar='H-H', help='hour-of-day windows, eg. 7-9 16-19 for the commutes')
+    parser.add_argument('--json', metavar='PATH', default='-', help="file the results are written to as JSON ('-' for stdout, the default)")
+    parser.add_argument('--plots', metavar='DIR', help='directory the plots are written to as PNG files')
+    parser.add_argument('--data-dir', metavar='DIR', help='directory of the city CSV files')
+    parser.add_argument('--city-data', nargs=2, action='append', metavar=('CITY', 'PATH'), default=[],
+                        help='CSV file or directory of partition CSV files of a city (eg. --city-data chicago exports/chicago/)')
+    parser.add_argument('--incremental', action='store_true', help='aggregate from persisted per-partition partials, reading only new or changed files')
+    parser.add_argument('--cache-dir', metavar='DIR', default=StatisticsBikeshare.cache_dir, help='directory of the columnar CSV cache')
+    parser.add_argument('--no-cache', action='store_true', help='read the CSV files directly')
+    parser.add_argument('--no-memo', action='store_true', help='recompute the statistics even if an earlier run cached them')
+    parser.add_argument('--memo-size', type=float, default=StatisticsBikeshare.memo_max_bytes / 2**20, metavar='MB',
+                        help='size the cached results are evicted down to (least recently used first)')
+    parser.add_argument('--workers', type=int, help='load and aggregate the cities in this many worker processes')
+    parser.add_argument('--stream', action='store_true', help='aggregate the rows chunk by chunk without loading them (for data larger than memory)')
+    parser.add_argument('--chunksize', type=int, default=StatisticsBikeshare.chunksize, help='rows read (and with --stream held in memory) at a time')
+    parser.add_argument('--grid', action='store_true', help='report every single (city, month, day) combination of the filters')
+    parser.add_argument('--quiet', action='store_true', help='do not print the statistics')
+    parser.add_argument('--rollup', metavar='PATH', help='save departures and arrivals by station, weekday and hour to PATH (.npz, see rollup_bikeshare.py)')
+    parser.add_argument('--age-bands', nargs='+', type=int, metavar='AGE', help='age band bounds of the cohort table, eg. 25 35 50 65 (default: 30 60 90)')
+    parser.add_argument('--approximate', type=int, metavar='K', help='count only the K most frequent stations and trips (bounded memory, error bounds reported)')
+    parser.add_argument('--sample', type=int, metavar='N', help='quick look: estimate the statistics from N random rows, with confidence intervals')
+    parser.add_argument('--stratified', action='store_true', help='draw the --sample rows proportionally from every (city, month)')
+    parser.add_argument('--sample-seed', type=int, default=StatisticsBikeshare.sample_seed, help='random seed of the --sample rows')
+    parser.add_argument('--refine', action='store_true', help='follow the --sample quick look by the exact statistics, compared with its estimates')
+    parser.add_argument('--menu', action='store_true', help='start the interactive menu with these options (eg. --sample 10000 for quick looks); the filters are asked for')
+    parser.add_argument('--trace', metavar='PATH', help='file the stage timings of the run are written to as JSON')
+    parser.add_argument('--trace-memory', action='store_true', help='trace the memory delta of every stage with tracemalloc (slower)')
+    parser.add_argument('--profile', action='store_true', help='profile the run with cProfile (written next to the trace as PATH.prof)')
+    args = parser.parse_args(argv)
+
+    try:
+        cities = bike_stat.parse_cities(args.cities)
+        months = bike_stat.parse_months(args.months)
+        days = bike_stat.parse_days(args.days)
+    except InvalidInput:
+        parser.error('invalid filter (cities: {}, months: {}, days: {})'.format(' '.join(args.cities), ' '.join(args.months), ' '.join(args.days)))
+    if args.start or args.end or args.dates or args.hours:
+        from timeindex_bikeshare import TimeFilter
+
+        try:
+            bike_stat.where = TimeFilter.from_args(args.start, args.end, args.dates, args.hours)
+        except ValueError as e:
+            parser.error('invalid time filter: {}'.format(e))
+        if (args.incremental or args.grid) and bike_stat.where.has_dates():
+            parser.error('--start, --end and --dates cannot be combined with --incremental or --grid')
+
+    if args.data_dir is not None:
+        bike_stat.CITY_DATA = {city: os.path.join(args.data_dir, path) for city, path in bike_stat.CITY_DATA.items()}
+    for city, path in args.city_data:
+        if city not in bike_stat.CITY_DATA:
+            parser.error('unknown city: {}'.format(city))
+        bike_stat.CITY_DATA = dict(bike_stat.CITY_DATA, **{city: path})
+    bike_stat.incremental = args.incremental
+    bike_stat.cache_dir = None if args.no_cache else args.cache_dir
+    bike_stat.memo = not args.no_memo
+    bike_stat.memo_max_bytes = int(args.memo_size * 2**20)
+    bike_stat.workers = args.workers
+    if args.chunksize < 1:
+        parser.error('--chunksize needs a positive number of rows')
+    bike_stat.streaming = args.stream
+    bike_stat.chunksize = args.chunksize
+    if args.approximate is not None and args.approximate < 1:
+        parser.error('--approximate needs a positive capacity')
+    bike_stat.sketch_capacity = args.approximate
+    if args.sample is not None and args.sample < 1:
+        parser.error('--sample needs a positive number of rows')
+    if args.sample is None and (args.stratified or args.refine):
+        parser.error('--stratified and --refine need --sample N')
+    if args.sample is not None and args.grid:
+        parser.error('--sample cannot be combined with --grid')
+    bike_stat.sample_size = args.sample
+    bike_stat.stratified = args.stratified
+    bike_stat.sample_seed = args.sample_seed
+    bike_stat.refine = args.refine
+    if args.age_bands is not None and (args.age_bands[0] < 1 or sorted(set(args.age_bands)) != args.age_bands):
+        parser.error('--age-bands needs increasing positive ages')
+    bike_stat.age_bands = args.age_bands
+    bike_stat.plot_dir = args.plots
+    if args.rollup is not None and args.grid:
+        parser.error('--rollup cannot be combined with --grid')
+    bike_stat.rollup_path = args.rollup
+    bike_stat.trace_path = args.trace
+    bike_stat.trace_memory = args.trace_memory
+    bike_stat.profile = args.profile
+    if args.profile and args.trace is None:
+        parser.error('--profile needs --trace PATH')
+
+    if args.menu:
+        bike_stat.menu()
+        return 0
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO() if args.quiet or args.json == '-' else sys.stdout):
+            if args.grid:
+                results = bike_stat.run_grid(cities, months, days)
+            else:
+                results = bike_stat.run_batch(cities, months, days)
+    except (OSError, ValueError) as e:
+        # includes pandas' ParserError, EmptyDataError and unparseable dates or numbers
+        print('Could not read the bikeshare data: {}'.format(' '.join(str(e).split())), file=sys.stderr)
+        return 1
+    except KeyError as e:
+        print('Could not read the bikeshare data: missing column {}'.format(e), file=sys.stderr)
+        return 1
+
+    if args.json == '-':
+        sys.stdout.write(json.dumps(results, indent=2) + '\n')
+    else:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
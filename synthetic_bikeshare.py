@@ -0,0 +1,255 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+"""
+Synthetic bikeshare data
+
+Generates trips in the schema of the city CSVs (Washington has no Gender and
+Birth Year columns), so the statistics can be run and measured without the
+real data files. The distributions follow the shape of the real exports:
+station popularity is Zipf-like, weekday trips peak at the commute hours and
+weekend trips in the afternoon, there are more trips on weekdays and in the
+warmer months, durations are log-normal (longer for customers) and the riders'
+ages are centered on the mid-thirties.
+
+Generation is seeded and done in chunks, each chunk seeded by its first row,
+so the chunks of a file can be generated by parallel workers (and large files
+written with bounded memory) and still give the same bytes:
+
+    python synthetic_bikeshare.py data/ --rows 1e8 --workers 8
+----------------------------------------
+"""
+
+# columns of the city CSVs ('Unnamed: 0' is the leading index column of the exports)
+CITY_COLUMNS = {
+    'chicago': ['Unnamed: 0', 'Start Time', 'End Time', 'Trip Duration', 'Start Station', 'End Station', 'User Type', 'Gender', 'Birth Year'],
+    'new york city': ['Unnamed: 0', 'Start Time', 'End Time', 'Trip Duration', 'Start Station', 'End Station', 'User Type', 'Gender', 'Birth Year'],
+    'washington': ['Unnamed: 0', 'Start Time', 'End Time', 'Trip Duration', 'Start Station', 'End Station', 'User Type'],
+}
+
+CITY_FILES = {'chicago': 'chicago.csv', 'new york city': 'new_york_city.csv', 'washington': 'washington.csv'}
+
+YEAR_START = pd.Timestamp('2017-01-01')
+
+# the exports cover January to June
+DAYS = 181
+
+# popularity of the stations: the i-th one is drawn with a probability proportional to 1 / (i + 1) ** ZIPF_EXPONENT
+ZIPF_EXPONENT = 1.1
+
+# relative number of trips per start hour on weekdays (commute peaks) and on weekends
+WEEKDAY_HOURS = [2, 1, 1, 1, 2, 6, 20, 45, 60, 32, 20, 24, 30, 29, 26, 32, 50, 75, 52, 32, 22, 16, 11, 6]
+WEEKEND_HOURS = [5, 4, 3, 1, 1, 1, 3, 6, 12, 22, 32, 40, 45, 46, 45, 44, 42, 38, 32, 24, 18, 14, 11, 8]
+
+# relative number of trips per weekday (Monday first) and per month (January first)
+WEEKDAY_WEIGHTS = [1.0, 1.0, 1.0, 1.0, 0.95, 0.75, 0.7]
+MONTH_WEIGHTS = [0.35, 0.4, 0.6, 0.8, 1.1, 1.3]
+
+# log-normal trip durations in seconds (median 11 minutes for subscribers), clipped to MIN_DURATION..MAX_DURATION
+DURATION_MEDIAN = 660
+DURATION_SIGMA = 0.7
+CUSTOMER_DURATION_FACTOR = 2.0
+MIN_DURATION = 60
+MAX_DURATION = 86400
+
+# riders' ages in the export year: normal, clipped to 16..80
+AGE_MEAN = 36
+AGE_SIGMA = 11
+
+CUSTOMER_SHARE = 0.2
+FEMALE_SHARE = 0.25
+MISSING_GENDER_SHARE = 0.1
+
+
+def probabilities(weights):
+    """Weights normalized to sum to 1."""
+    weights = np.asarray(weights, dtype='float64')
+    return weights / weights.sum()
+
+
+def station_weights(n_stations):
+    """Zipf-like probabilities of drawing each station."""
+    return probabilities(1.0 / np.arange(1, n_stations + 1) ** ZIPF_EXPONENT)
+
+
+def day_weights():
+    """Probabilities of a trip starting on each day of the exports."""
+    days = pd.date_range(YEAR_START, periods=DAYS, freq='D')
+    return probabilities(np.array(WEEKDAY_WEIGHTS)[days.weekday] * np.array(MONTH_WEIGHTS)[days.month - 1])
+
+
+def make_trips(n, city='chicago', seed=0, first_row=0, n_stations=500):
+    """
+    Generates n trips of city as a raw (unparsed) frame in the CSV schema.
+
+    Parameters:
+        (int) n             - number of trips,
+
+        (str) city          - city whose columns are generated,
+
+        (int) seed          - random seed (the same seed, city and first_row give the same rows),
+
+        (int) first_row     - value of the leading index column of the first trip,
+
+        (int) n_stations    - number of distinct stations
+    """
+    rng = np.random.default_rng([seed, list(CITY_FILES).index(city), first_row])
+    day = rng.choice(DAYS, n, p=day_weights())
+    weekend = (YEAR_START.weekday() + day) % 7 >= 5
+    hour = np.where(weekend, rng.choice(24, n, p=probabilities(WEEKEND_HOURS)), rng.choice(24, n, p=probabilities(WEEKDAY_HOURS)))
+    seconds = np.sort(day * 86400 + hour * 3600 + rng.integers(0, 3600, n))
+    start = YEAR_START + pd.to_timedelta(seconds, unit='s')
+
+    customer = rng.random(n) < CUSTOMER_SHARE
+    median = np.where(customer, DURATION_MEDIAN * CUSTOMER_DURATION_FACTOR, DURATION_MEDIAN)
+    duration = np.clip(np.round(median * rng.lognormal(0.0, DURATION_SIGMA, n)), MIN_DURATION, MAX_DURATION).astype('int64')
+    stations = np.array(['{} Station {}'.format(city.title(), i) for i in range(n_stations)], dtype=object)
+    popularity = station_weights(n_stations)
+
+    df = pd.DataFrame({
+        'Unnamed: 0': np.arange(first_row, first_row + n),
+        'Start Time': start.strftime('%Y-%m-%d %H:%M:%S'),
+        'End Time': (start + pd.to_timedelta(duration, unit='s')).strftime('%Y-%m-%d %H:%M:%S'),
+        'Trip Duration': duration.astype(float),
+        'Start Station': stations[rng.choice(n_stations, n, p=popularity)],
+        'End Station': stations[rng.choice(n_stations, n, p=popularity)],
+        'User Type': np.array(['Subscriber', 'Customer'], dtype=object)[customer.astype(int)],
+    })
+    if 'Gender' in CITY_COLUMNS[city]:
+        gender = np.array(['Male', 'Female'], dtype=object)[(rng.random(n) < FEMALE_SHARE).astype(int)]
+        gender[rng.random(n) < MISSING_GENDER_SHARE] = None
+        age = np.clip(np.round(rng.normal(AGE_MEAN, AGE_SIGMA, n)), 16, 80)
+        birth_year = (YEAR_START.year - age).astype(float)
+        birth_year[pd.isna(gender)] = np.nan
+        df['Gender'] = gender
+        df['Birth Year'] = birth_year
+    return df[CITY_COLUMNS[city]]
+
+
+def write_chunk(path, n, city, seed, first_row, header=True, mode='w'):
+    """Writes the n synthetic trips of city starting at first_row to path (see make_trips); returns path."""
+    make_trips(n, city, seed, first_row).to_csv(path, index=False, mode=mode, header=header)
+    return path
+
+
+def chunk_starts(n, chunksize):
+    """First row and number of rows of every chunk of n rows."""
+    return [(first, min(chunksize, n - first)) for first in range(0, max(n, 1), chunksize)]
+
+
+def write_city_csv(path, n, city='chicago', seed=0, chunksize=1000000, workers=None):
+    """
+    Writes n synthetic trips of city to the CSV file path, chunksize rows at a time.
+
+    With workers, the chunks are generated by that many processes into part files that are then concatenated;
+    the file is the same as a sequential one.
+    """
+    chunks = chunk_starts(n, chunksize)
+    if not workers or workers < 2 or len(chunks) < 2:
+        for first, rows in chunks:
+            write_chunk(path, rows, city, seed, first, first == 0, 'w' if first == 0 else 'a')
+        return path
+
+    parts = ['{}.part{}'.format(path, i) for i in range(len(chunks))]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(write_chunk, parts, [rows for _, rows in chunks], repeat(city), repeat(seed), [first for first, _ in chunks],
+                          [first == 0 for first, _ in chunks]))
+        with open(path, 'wb') as out:
+            for part in parts:
+                with open(part, 'rb') as f:
+                    shutil.copyfileobj(f, out, 16 * 2**20)
+    finally:
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
+    return path
+
+
+def write_city_partitions(directory, n, city='chicago', seed=0, chunksize=1000000, workers=None):
+    """
+    Writes n synthetic trips of city as a directory of partition CSV files, one per chunk (see ingest_bikeshare).
+
+    The chunks are the ones of write_city_csv, written by workers processes without a concatenation pass.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith('.csv'):
+            os.remove(os.path.join(directory, name))
+    chunks = chunk_starts(n, chunksize)
+    parts = [os.path.join(directory, 'part-{:05d}.csv'.format(i)) for i in range(len(chunks))]
+    args = (parts, [rows for _, rows in chunks], repeat(city), repeat(seed), [first for first, _ in chunks])
+    if not workers or workers < 2:
+        list(map(write_chunk, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(write_chunk, *args))
+    return directory
+
+
+def read_marker(path):
+    """Contents of a marker file ('' if there is none)."""
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return ''
+
+
+def write_city_data(directory, n, seed=0, cities=None, workers=None, partitioned=False, chunksize=1000000):
+    """
+    Writes n synthetic trips per city into directory (once per size and seed) and returns a CITY_DATA mapping.
+
+    With partitioned, every city is a directory of partition files instead of one CSV file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    city_data = {}
+    for city in sorted(cities or CITY_FILES):
+        path = os.path.join(directory, CITY_FILES[city])
+        if partitioned:
+            path = os.path.splitext(path)[0]
+        marker = path + '.ok'
+        written = '{} {}'.format(n, seed) + (' {} partitioned'.format(chunksize) if partitioned else '')
+        if not os.path.exists(path) or read_marker(marker) != written:
+            if partitioned:
+                write_city_partitions(path, n, city, seed, chunksize, workers)
+            else:
+                write_city_csv(path, n, city, seed, chunksize, workers)
+            with open(marker, 'w') as f:
+                f.write(written)
+        city_data[city] = path
+    return city_data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write seeded synthetic city CSVs (CITY_DATA compatible).')
+    parser.add_argument('directory')
+    parser.add_argument('--rows', default='1e6', help='rows per city, eg. 1e8 (default: 1e6)')
+    parser.add_argument('--cities', nargs='+', choices=sorted(CITY_FILES), help='cities to generate (default: all)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes generating the chunks (default: one per CPU)')
+    parser.add_argument('--chunksize', default='1e6', help='rows generated at a time by one worker')
+    parser.add_argument('--partitioned', action='store_true', help='write every city as a directory of partition files (no concatenation)')
+    args = parser.parse_args(argv)
+
+    n, chunksize = int(float(args.rows)), int(float(args.chunksize))
+    if n < 0 or chunksize < 1:
+        parser.error('--rows and --chunksize need positive numbers of rows')
+    start = time.perf_counter()
+    city_data = write_city_data(args.directory, n, args.seed, args.cities, args.workers, args.partitioned, chunksize)
+    seconds = time.perf_counter() - start
+    rows = n * len(city_data)
+    print(json.dumps({'city_data': city_data, 'rows': rows, 'seconds': seconds, 'rows_per_second': rows / seconds if seconds else None}, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+from cache_bikeshare import concat_frames, memory_footprint
+from aggregate_bikeshare import TripAggregates
+from timeindex_bikeshare import TimeIndex
+
+"""
+Per-city table registry
+
+The cities do not share one schema: Washington has no Gender or Birth Year.
+Concatenating them pads the missing columns of every city with NaN and turns
+their dtypes into the widest common one. TableRegistry keeps every loaded city
+as its own time-sorted frame with its own schema (column -> dtype, recorded
+when the city is added) instead. The statistics are computed per city on the
+native dtypes and merged (TripAggregates are mergeable), and row selections
+are cut from every city's sorted frame. The padded union frame is only built
+when a caller asks for it.
+----------------------------------------
+"""
+
+
+class TableRegistry:
+    """Loaded trips, one time-sorted frame and schema per city."""
+
+    def __init__(self):
+        # city -> DataFrame sorted by Start Time
+        self.tables = {}
+        # city -> {column: dtype name}
+        self.schemas = {}
+
+    def add(self, city, df):
+        """Registers (or replaces) the loaded rows of city, sorting them by Start Time."""
+        if 'Start Time' in df.columns:
+            df = TimeIndex(df).df
+        self.tables[city] = df
+        self.schemas[city] = {column: str(dtype) for column, dtype in df.dtypes.items()}
+        return df
+
+    def cities(self):
+        return sorted(self.tables)
+
+    def rows(self):
+        return sum(len(df) for df in self.tables.values())
+
+    def columns(self):
+        """Columns of any city, in order of first appearance."""
+        columns = {}
+        for city in self.cities():
+            columns.update(dict.fromkeys(self.schemas[city]))
+        return list(columns)
+
+    def has_column(self, column):
+        """Whether any city has column."""
+        return any(column in schema for schema in self.schemas.values())
+
+    def memory_footprint(self):
+        return sum(memory_footprint(df) for df in self.tables.values())
+
+    def aggregate(self, capacity=None):
+        """TripAggregates of every city, computed per city and merged (see TripAggregates.from_frame)."""
+        return TripAggregates.merge_all(TripAggregates.from_frame(self.tables[city], capacity, city) for city in self.cities()
+                                        if len(self.tables[city].columns))
+
+    def select(self, time_filter):
+        """Rows of every city kept by a TimeFilter, as one frame sorted by Start Time (padded like union)."""
+        return self.combine([TimeIndex(self.tables[city], assume_sorted=True).select(time_filter) for city in self.cities()
+                             if 'Start Time' in self.tables[city].columns])
+
+    def union(self):
+        """All the rows as one frame sorted by Start Time (the columns a city lacks are padded with missing values)."""
+        return self.combine([self.tables[city] for city in self.cities()])
+
+    @staticmethod
+    def combine(frames):
+        # shallow copies: concat_frames recodes categorical columns in place
+        df = concat_frames([df.copy(deep=False) for df in frames])
+        return TimeIndex(df).df if 'Start Time' in df.columns else df
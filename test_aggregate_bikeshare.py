@@ -0,0 +1,102 @@
+import unittest as ut
+import pandas as pd
+from aggregate_bikeshare import TripAggregates
+
+def make_trips():
+	"""Small enriched trips frame, shaped like the output of load_data."""
+	df = pd.DataFrame({
+		'Start Time': pd.to_datetime(['2017-01-02 08:00:00', '2017-01-02 08:30:00', '2017-03-04 09:30:00', '2017-06-23 17:15:00', '2017-06-24 17:40:00']),
+		'Trip Duration': [600.0, 400.0, 1200.0, 300.0, 600.0],
+		'Start Station': ['A', 'A', 'B', 'C', 'C'],
+		'End Station': ['B', 'B', 'C', 'A', 'A'],
+		'User Type': ['Subscriber', 'Subscriber', 'Customer', 'Subscriber', 'Subscriber'],
+		'Gender': ['Male', 'Female', None, 'Female', 'Male'],
+		'Birth Year': [1980.0, 1992.0, None, 1992.0, 1992.0],
+	})
+	df['Month'] = df['Start Time'].dt.month
+	df['Day of week'] = df['Start Time'].dt.day_name()
+	df['Age'] = (2017 - df['Birth Year']).astype('Int64')
+	return df
+
+class TestTripAggregates(ut.TestCase):
+	def test_from_frame(self):
+		print('='*24+' Testing TripAggregates.from_frame() ' + '='*24)
+
+		df = make_trips()
+		stats = TripAggregates.from_frame(df)
+
+		self.assertEqual(stats.rows, 5)
+		self.assertEqual(stats.most_common_hour(), df['Start Time'].dt.hour.mode()[0])
+		self.assertEqual(stats.most_common_month(), df['Month'].mode()[0])
+		self.assertEqual(stats.most_common_day(), df['Day of week'].mode()[0])
+		self.assertEqual(stats.most_common_start_station(), df['Start Station'].mode()[0])
+		self.assertEqual(stats.most_common_end_station(), df['End Station'].mode()[0])
+		self.assertEqual(' - '.join(stats.most_common_trip()), (df['Start Station'] + ' - ' + df['End Station']).mode()[0])
+		self.assertEqual(stats.total_duration(), df['Trip Duration'].sum())
+		self.assertEqual(stats.mean_duration(), df['Trip Duration'].mean())
+		self.assertEqual(dict(stats.user_type), {'Customer': 1, 'Subscriber': 4})
+		self.assertEqual(dict(stats.gender), {'Female': 2, 'Male': 2})
+		self.assertEqual(stats.earliest_birth_year(), 1980.0)
+		self.assertEqual(stats.most_recent_birth_year(), 1992.0)
+		self.assertEqual(stats.most_common_birth_year(), df['Birth Year'].mode()[0])
+		pd.testing.assert_series_equal(stats.gender_month_mean(), df.groupby(['Gender', 'Month'])['Trip Duration'].mean(), check_names=False)
+		pd.testing.assert_series_equal(stats.age_month_mean(), df.groupby(['Age', 'Month'])['Trip Duration'].mean(), check_names=False)
+
+		print('='*24+' END Testing TripAggregates.from_frame() ' + '='*24 + '\n')
+
+	def test_missing_columns(self):
+		print('='*24+' Testing TripAggregates without user columns ' + '='*24)
+
+		stats = TripAggregates.from_frame(make_trips().drop(columns=['Gender', 'Birth Year', 'Age']))
+
+		self.assertIsNone(stats.gender)
+		self.assertIsNone(stats.birth_year)
+		self.assertIsNone(stats.gender_month_mean())
+		self.assertIsNone(stats.age_month_mean())
+		self.assertEqual(stats.most_common_hour(), 8)
+
+		print('='*24+' END Testing TripAggregates without user columns ' + '='*24 + '\n')
+
+	def test_trips(self):
+		print('='*24+' Testing top_trips() and od_matrix() ' + '='*24)
+
+		df = make_trips()
+		categories = ['A', 'B', 'C', 'D']
+		df_cat = df.assign(**{col: pd.Categorical(df[col], categories=categories) for col in ('Start Station', 'End Station')})
+
+		for frame in (df, df_cat):
+			stats = TripAggregates.from_frame(frame)
+			self.assertEqual(list(stats.top_trips(2).index), [('A', 'B'), ('C', 'A')])
+			self.assertEqual(list(stats.top_trips(2)), [2, 2])
+			self.assertEqual(stats.top_trips().sum(), 5)
+			self.assertEqual(dict(stats.start_station), {'A': 2, 'B': 1, 'C': 2})
+
+			od = stats.od_matrix()
+			self.assertEqual(list(od.index), ['A', 'B', 'C'])
+			self.assertEqual(od.loc['A', 'B'], 2)
+			self.assertEqual(od.loc['B', 'C'], 1)
+			self.assertEqual(od.loc['B', 'A'], 0)
+			self.assertEqual(od.to_numpy().sum(), 5)
+
+		print('='*24+' END Testing top_trips() and od_matrix() ' + '='*24 + '\n')
+
+	def test_merge(self):
+		print('='*24+' Testing TripAggregates.merge() ' + '='*24)
+
+		df = make_trips()
+		whole = TripAggregates.from_frame(df)
+		merged = TripAggregates.merge_all([TripAggregates.from_frame(df.iloc[:2]), TripAggregates.from_frame(df.iloc[2:3].drop(columns=['Gender', 'Birth Year', 'Age'])), TripAggregates.from_frame(df.iloc[3:])])
+
+		self.assertEqual(merged.rows, whole.rows)
+		for name in ('hour', 'month', 'weekday', 'start_station', 'end_station', 'trip', 'user_type', 'gender', 'birth_year'):
+			pd.testing.assert_series_equal(getattr(merged, name), getattr(whole, name), check_names=False)
+		pd.testing.assert_frame_equal(merged.age_month, whole.age_month)
+		pd.testing.assert_frame_equal(merged.gender_month, whole.gender_month)
+		self.assertEqual(merged.mean_duration(), whole.mean_duration())
+		self.assertEqual(merged.most_common_trip(), whole.most_common_trip())
+
+		print('='*24+' END Testing TripAggregates.merge() ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,111 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest as ut
+from unittest import mock
+import pandas as pd
+from synthetic_bikeshare import make_trips, write_city_data, write_city_csv, CITY_COLUMNS
+from benchmark_bikeshare import run_benchmarks, run_load_test, measure_startup, compare, main, STATS_STAGES, LOAD_MODES, LOAD_TEST_PIPELINES, LOAD_TEST_SOURCES
+
+class TestBenchmark(ut.TestCase):
+	def setUp(self):
+		self.tmp = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp)
+
+	def test_make_trips(self):
+		print('='*24+' Testing make_trips() ' + '='*24)
+
+		for city, columns in CITY_COLUMNS.items():
+			df = make_trips(100, city, seed=1)
+			self.assertEqual(list(df.columns), columns)
+			self.assertEqual(len(df), 100)
+		self.assertNotIn('Gender', make_trips(10, 'washington').columns)
+		pd.testing.assert_frame_equal(make_trips(50, 'chicago', seed=3), make_trips(50, 'chicago', seed=3))
+		# cities with the same seed get different trips
+		self.assertFalse(make_trips(50, 'chicago', seed=3)['Start Time'].equals(make_trips(50, 'new york city', seed=3)['Start Time']))
+
+		city_data = write_city_data(self.tmp, 30, cities=['chicago', 'washington'])
+		self.assertEqual(sorted(city_data), ['chicago', 'washington'])
+		self.assertEqual(len(pd.read_csv(city_data['washington'])), 30)
+
+		# realistic shapes: popular stations, commute peaks, longer customer trips, riders mostly 20 to 60
+		df = make_trips(20000, 'chicago', seed=2)
+		start = pd.to_datetime(df['Start Time'])
+		counts = df['Start Station'].value_counts()
+		self.assertGreater(counts.iloc[0], 20 * counts.iloc[-1])
+		weekday_hours = start[start.dt.weekday < 5].dt.hour.value_counts()
+		self.assertEqual(sorted(weekday_hours.index[:2]), [8, 17])
+		self.assertGreater((start.dt.weekday < 5).mean(), 5 / 7)
+		durations = df.groupby('User Type')['Trip Duration'].median()
+		self.assertGreater(durations['Customer'], 1.5 * durations['Subscriber'])
+		self.assertTrue(df['Trip Duration'].between(60, 86400).all())
+		ages = 2017 - df['Birth Year'].dropna()
+		self.assertTrue(0.8 < ages.between(20, 60).mean() < 1)
+
+		# chunks written by parallel workers give the same file, or one partition file per chunk
+		sequential = write_city_csv(os.path.join(self.tmp, 'sequential.csv'), 350, 'chicago', 4, chunksize=100)
+		parallel = write_city_csv(os.path.join(self.tmp, 'parallel.csv'), 350, 'chicago', 4, chunksize=100, workers=2)
+		with open(sequential, 'rb') as a, open(parallel, 'rb') as b:
+			self.assertEqual(a.read(), b.read())
+		self.assertEqual(sorted(os.listdir(self.tmp)), ['chicago.csv', 'chicago.csv.ok', 'parallel.csv', 'sequential.csv', 'washington.csv', 'washington.csv.ok'])
+		city_data = write_city_data(os.path.join(self.tmp, 'parts'), 350, 4, ['chicago'], workers=2, partitioned=True, chunksize=100)
+		self.assertEqual(len(os.listdir(city_data['chicago'])), 4)
+		partitions = pd.concat([pd.read_csv(os.path.join(city_data['chicago'], name)) for name in sorted(os.listdir(city_data['chicago']))], ignore_index=True)
+		pd.testing.assert_frame_equal(partitions, pd.read_csv(sequential))
+
+		print('='*24+' END Testing make_trips() ' + '='*24 + '\n')
+
+	def test_run_benchmarks(self):
+		print('='*24+' Testing run_benchmarks() ' + '='*24)
+
+		with mock.patch('sys.stderr'):
+			report = run_benchmarks([200], self.tmp, cities=['chicago', 'washington'])
+		self.assertEqual(len(report['results']), len(LOAD_MODES) * (1 + len(STATS_STAGES)))
+		self.assertTrue(all(r['rows'] == 400 and r['seconds'] >= 0 and r['peak_bytes'] >= 0 for r in report['results']))
+		self.assertEqual(set(compare(report, report).values()), {1.0})
+
+		output = os.path.join(self.tmp, 'bench.json')
+		with mock.patch('sys.stderr'):
+			self.assertEqual(main(['--sizes', '1e2', '--cities', 'chicago', '--work-dir', self.tmp, '--no-memory', '--output', output]), 0)
+		with open(output) as f:
+			self.assertIsNone(json.load(f)['results'][0]['peak_bytes'])
+
+		print('='*24+' END Testing run_benchmarks() ' + '='*24 + '\n')
+
+	def test_load_test(self):
+		print('='*24+' Testing run_load_test() ' + '='*24)
+
+		with mock.patch('sys.stderr'):
+			report = run_load_test([300], self.tmp, cities=['chicago', 'washington'], workers=2, partitioned=True)
+		self.assertEqual(len(report['results']), len(LOAD_TEST_SOURCES) * len(LOAD_TEST_PIPELINES))
+		self.assertTrue(all(r['rows'] == 600 and r['rows_per_second'] > 0 for r in report['results']))
+		self.assertEqual(sorted({r['stage'] for r in report['results']}), ['pipeline:load', 'pipeline:parallel', 'pipeline:stream'])
+		self.assertTrue(os.path.isdir(os.path.join(self.tmp, 'rows-300-partitioned', 'chicago')))
+
+		print('='*24+' END Testing run_load_test() ' + '='*24 + '\n')
+
+	def test_measure_startup(self):
+		print('='*24+' Testing measure_startup() ' + '='*24)
+
+		startup = measure_startup(repeat=2)
+		# the prompts and the filter validation do not import pandas, numpy or matplotlib
+		self.assertEqual(startup['heavy_modules'], [])
+		self.assertTrue(0 < startup['import_seconds'] < 5)
+		self.assertTrue(startup['validate_seconds'] >= 0)
+
+		output = os.path.join(self.tmp, 'startup.json')
+		with mock.patch('sys.stderr'):
+			self.assertEqual(main(['--startup', '--output', output]), 0)
+		with open(output) as f:
+			report = json.load(f)
+		self.assertEqual(report['results'], [])
+		self.assertEqual(report['startup']['heavy_modules'], [])
+
+		print('='*24+' END Testing measure_startup() ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,47 @@
+import unittest as ut
+import pandas as pd
+from browse_bikeshare import RowBrowser
+
+class TestRowBrowser(ut.TestCase):
+	def setUp(self):
+		self.reads = 0
+
+	def chunks(self):
+		"""Source of 23 rows in chunks of 10, counting how often it is read from the start."""
+		self.reads += 1
+		for first in range(0, 23, 10):
+			yield pd.DataFrame({'row': range(first, min(first + 10, 23))})
+
+	def test_pages(self):
+		print('='*24+' Testing RowBrowser pages ' + '='*24)
+
+		browser = RowBrowser(self.chunks, page_size=4)
+		pages = list(browser)
+		self.assertEqual([len(page) for page in pages], [4, 4, 4, 4, 4, 3])
+		self.assertEqual([row for page in pages for row in page['row']], list(range(23)))
+		self.assertEqual(list(pages[2].index), [8, 9, 10, 11])
+		self.assertEqual(self.reads, 1)
+		self.assertTrue(browser.next_page().empty)
+
+		print('='*24+' END Testing RowBrowser pages ' + '='*24 + '\n')
+
+	def test_seek(self):
+		print('='*24+' Testing RowBrowser.seek() ' + '='*24)
+
+		browser = RowBrowser(self.chunks, page_size=5)
+		browser.seek(18)
+		self.assertEqual(list(browser.next_page()['row']), [18, 19, 20, 21, 22])
+		self.assertEqual(self.reads, 1)
+
+		browser.seek(3)
+		self.assertEqual(list(browser.page()['row']), [3, 4, 5, 6, 7])
+		self.assertEqual(self.reads, 2)
+		self.assertTrue(browser.page(30).empty)
+		self.assertRaises(ValueError, browser.seek, -1)
+		self.assertRaises(ValueError, RowBrowser, self.chunks, 0)
+
+		print('='*24+' END Testing RowBrowser.seek() ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
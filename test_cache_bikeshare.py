@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import unittest as ut
+from unittest import mock
+import numpy as np
+import pandas as pd
+from cache_bikeshare import ColumnarCache, scan_csv
+
+CSV = """,Start Time,End Time,Trip Duration,Start Station,End Station,User Type,Gender,Birth Year
+0,2017-01-02 08:00:00,2017-01-02 08:10:00,600.0,A,B,Subscriber,Male,1980.0
+1,2017-03-04 09:30:00,2017-03-04 09:50:00,1200.0,B,C,Customer,,
+2,2017-06-23 17:15:00,2017-06-23 17:20:00,300.5,C,A,Subscriber,Female,1992.0
+"""
+
+class TestColumnarCache(ut.TestCase):
+	def setUp(self):
+		self.tmp = tempfile.mkdtemp()
+		self.csv = os.path.join(self.tmp, 'chicago.csv')
+		with open(self.csv, 'w') as f:
+			f.write(CSV)
+		self.cache = ColumnarCache(os.path.join(self.tmp, 'cache'))
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp)
+
+	def test_read(self):
+		print('='*24+' Testing ColumnarCache.read() ' + '='*24)
+
+		df = self.cache.read(self.csv)
+		self.assertEqual(len(df), 3)
+		self.assertEqual(str(df['Month'].dtype), 'int8')
+		self.assertEqual(list(df['Month']), [1, 3, 6])
+		self.assertEqual(list(df['Day of week']), ['Monday', 'Saturday', 'Friday'])
+		self.assertEqual(str(df['Start Station'].dtype), 'category')
+		self.assertEqual(list(df['Start Station'].cat.categories), list(df['End Station'].cat.categories))
+		self.assertEqual(str(df['User Type'].dtype), 'category')
+		self.assertTrue(df['Gender'].isna()[1])
+		self.assertTrue(pd.api.types.is_datetime64_any_dtype(df['Start Time']))
+		self.assertEqual(df['Trip Duration'].sum(), 2100.5)
+
+		print('='*24+' END Testing ColumnarCache.read() ' + '='*24 + '\n')
+
+	def test_hit_skips_parsing(self):
+		print('='*24+' Testing ColumnarCache hit ' + '='*24)
+
+		self.cache.read(self.csv)
+		with mock.patch('cache_bikeshare.pd.read_csv') as mocked_read_csv:
+			df = self.cache.read(self.csv)
+			mocked_read_csv.assert_not_called()
+		self.assertEqual(list(df['End Station']), ['B', 'C', 'A'])
+		self.assertEqual(list(df.columns[:5]), ['Unnamed: 0', 'Start Time', 'End Time', 'Trip Duration', 'Start Station'])
+		self.assertIsInstance(np.load(os.path.join(self.cache.entry_dir(self.csv), 'col0.npy'), mmap_mode='r'), np.memmap)
+
+		print('='*24+' END Testing ColumnarCache hit ' + '='*24 + '\n')
+
+	def test_invalidation(self):
+		print('='*24+' Testing ColumnarCache invalidation ' + '='*24)
+
+		self.cache.read(self.csv)
+		old_entry = self.cache.entry_dir(self.csv)
+		with open(self.csv, 'a') as f:
+			f.write('3,2017-02-01 10:00:00,2017-02-01 10:05:00,300.0,A,C,Subscriber,Male,1970.0\n')
+		# an entry another process is still writing
+		in_flight = self.cache.entry_dir(self.csv) + '.tmp{}'.format(os.getpid() + 1)
+		os.makedirs(in_flight)
+
+		self.assertIsNone(self.cache.load(self.csv))
+		df = self.cache.read(self.csv)
+		self.assertEqual(len(df), 4)
+		self.assertFalse(os.path.exists(old_entry))
+		self.assertTrue(os.path.isdir(in_flight))
+		self.assertEqual(len(os.listdir(self.cache.cache_dir)), 2)
+
+		print('='*24+' END Testing ColumnarCache invalidation ' + '='*24 + '\n')
+
+	def test_scan(self):
+		print('='*24+' Testing scan_csv() and ColumnarCache.scan() ' + '='*24)
+
+		for scan in (scan_csv, self.cache.scan):
+			counts = {}
+			chunks = list(scan(self.csv, {'1', '6'}, {'Monday', 'Friday', 'Sunday'}, chunksize=1, counts=counts))
+			self.assertEqual(counts, {'scanned': 3, 'kept': 2})
+			self.assertEqual(len(chunks), 2)
+			self.assertEqual(list(pd.concat(chunks)['Start Station'].astype(str)), ['A', 'C'])
+			self.assertEqual(list(pd.concat(chunks)['Month']), [1, 6])
+
+		counts = {}
+		self.assertEqual(list(scan_csv(self.csv, {'2'}, {'Monday'}, counts=counts)), [])
+		self.assertEqual(counts, {'scanned': 3, 'kept': 0})
+
+		print('='*24+' END Testing scan_csv() and ColumnarCache.scan() ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,55 @@
+import unittest as ut
+import numpy as np
+import pandas as pd
+from cohort_bikeshare import cohort_partials, cohort_table, age_bands, band_labels, band_month_means
+from aggregate_bikeshare import TripAggregates, add_partials
+from cache_bikeshare import compact_frame
+from test_cube_bikeshare import random_trips
+
+class TestCohorts(ut.TestCase):
+	def test_age_bands(self):
+		print('='*24+' Testing age_bands() ' + '='*24)
+
+		bands = age_bands([18, 29, 30, 59, 60, 90, None])
+		self.assertEqual(list(bands.astype(object)[:6]), ['age < 30', 'age < 30', '30 <= age < 60', '30 <= age < 60', '60 <= age < 90', 'age >= 90'])
+		self.assertTrue(pd.isna(bands.iloc[6]))
+		self.assertEqual(band_labels([20, 40]), ['age < 20', '20 <= age < 40', 'age >= 40'])
+
+		print('='*24+' END Testing age_bands() ' + '='*24 + '\n')
+
+	def test_cohort_table(self):
+		print('='*24+' Testing cohort_table() ' + '='*24)
+
+		df = compact_frame(random_trips(4000, 5))
+		table = cohort_table(cohort_partials(df), [25, 45, 65])
+		self.assertEqual(list(table.columns), ['Age Band', 'Month', 'Gender', 'Trips', 'Total Duration', 'Mean Duration', 'Median Duration'])
+
+		# the same cohorts by brute force on the trips
+		keys = [age_bands(df['Age'], [25, 45, 65]), df['Month'], df['Gender'].astype(object).fillna('Unknown')]
+		expected = df.groupby(keys, observed=True, sort=True)['Trip Duration'].agg(['size', 'mean', lambda d: np.quantile(d, 0.5, method='lower')])
+		self.assertEqual(table['Trips'].tolist(), expected['size'].tolist())
+		self.assertEqual(table['Trips'].sum(), df['Age'].notna().sum())
+		self.assertTrue(np.allclose(table['Mean Duration'], expected['mean']))
+		exact = expected.iloc[:, 2].to_numpy()
+		self.assertTrue((np.abs(table['Median Duration'].to_numpy() - exact) <= 0.01 * exact).all())
+
+		# partials of parts merge into the partials of the whole
+		parts = add_partials(cohort_partials(df.iloc[:1500]), cohort_partials(df.iloc[1500:]))
+		pd.testing.assert_frame_equal(cohort_table(parts), cohort_table(cohort_partials(df)))
+
+		# the plot means over every gender
+		means = band_month_means(table)
+		first = df[(df['Age'] < 25) & (df['Month'] == 1)]['Trip Duration']
+		self.assertAlmostEqual(means['Mean Duration'].iloc[0], first.mean())
+
+		# aggregates without cohort partials (eg. the cube's age partials) have no genders or medians
+		stats = TripAggregates.from_frame(df)
+		stats.cohorts = None
+		self.assertEqual(list(stats.cohort_table().columns), ['Age Band', 'Month', 'Trips', 'Total Duration', 'Mean Duration'])
+		self.assertIsNone(TripAggregates.from_frame(df.drop(columns='Age')).cohort_table())
+
+		print('='*24+' END Testing cohort_table() ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
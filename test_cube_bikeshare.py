@@ -0,0 +1,70 @@
+import unittest as ut
+import numpy as np
+import pandas as pd
+from aggregate_bikeshare import TripAggregates
+from cube_bikeshare import StatsCube, cell_ids
+
+def random_trips(n, seed, user_columns=True):
+	"""Random enriched trips frame, shaped like the output of load_city."""
+	rng = np.random.default_rng(seed)
+	stations = np.array(['A', 'B', 'C', 'D', 'E'], dtype=object)
+	df = pd.DataFrame({
+		'Start Time': pd.Timestamp('2017-01-01') + pd.to_timedelta(rng.integers(0, 181 * 86400, n), unit='s'),
+		'Trip Duration': rng.integers(60, 3600, n).astype(float),
+		'Start Station': stations[rng.integers(0, 5, n)],
+		'End Station': stations[rng.integers(0, 5, n)],
+		'User Type': np.array(['Subscriber', 'Customer'], dtype=object)[rng.integers(0, 2, n)],
+	})
+	df['Month'] = df['Start Time'].dt.month.astype('int8')
+	df['Day of week'] = df['Start Time'].dt.day_name()
+	if user_columns:
+		df['Gender'] = np.array(['Male', 'Female', None], dtype=object)[rng.integers(0, 3, n)]
+		df['Birth Year'] = rng.integers(1940, 2000, n).astype(float)
+		df['Age'] = (2017 - df['Birth Year']).astype('Int64')
+	return df
+
+class TestStatsCube(ut.TestCase):
+	def test_cell_ids(self):
+		print('='*24+' Testing cell_ids() ' + '='*24)
+
+		self.assertEqual(list(cell_ids({'1'}, {'Monday'}, [0, 23])), [0, 23])
+		self.assertEqual(list(cell_ids({'2'}, {'Tuesday'}, [5])), [168 + 24 + 5])
+		self.assertEqual(len(cell_ids({'1', '2', '3'}, {'Monday', 'Sunday'})), 3 * 2 * 24)
+
+		print('='*24+' END Testing cell_ids() ' + '='*24 + '\n')
+
+	def test_query(self):
+		print('='*24+' Testing StatsCube.query() ' + '='*24)
+
+		frames = {'chicago': random_trips(2000, 1), 'washington': random_trips(1000, 2, user_columns=False)}
+		cube = StatsCube()
+		for city, df in frames.items():
+			cube.add_city(city, df)
+
+		specs = [({'chicago'}, {'1', '2', '3', '4', '5', '6'}, {'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'}),
+				 ({'chicago', 'washington'}, {'6'}, {'Saturday', 'Sunday'}),
+				 ({'washington'}, {'2', '3'}, {'Wednesday'})]
+		for cities, months, days in specs:
+			filtered = {city: df[df['Month'].isin([int(m) for m in months]) & df['Day of week'].isin(days)] for city, df in sorted(frames.items()) if city in cities}
+			expected = TripAggregates.merge_all(TripAggregates.from_frame(df, city=city) for city, df in filtered.items())
+			stats = cube.query(cities, months, days)
+
+			self.assertEqual(stats.rows, expected.rows)
+			self.assertAlmostEqual(stats.mean_duration(), expected.mean_duration())
+			for name in ('hour', 'month', 'weekday', 'start_station', 'end_station', 'trip', 'user_type', 'gender', 'birth_year'):
+				if getattr(expected, name) is None:
+					self.assertIsNone(getattr(stats, name))
+				else:
+					self.assertEqual(getattr(stats, name).to_dict(), getattr(expected, name).to_dict())
+			for name in ('age_month_mean', 'gender_month_mean'):
+				if getattr(expected, name)() is None:
+					self.assertIsNone(getattr(stats, name)())
+				else:
+					pd.testing.assert_series_equal(getattr(stats, name)(), getattr(expected, name)(), check_index_type=False)
+			self.assertEqual(stats.to_dict(), expected.to_dict())
+
+		print('='*24+' END Testing StatsCube.query() ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
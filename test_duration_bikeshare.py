@@ -0,0 +1,69 @@
+import unittest as ut
+import numpy as np
+from duration_bikeshare import DurationSketch, duration_buckets, group_sketches, bucket_ids, bucket_values, ALPHA, HISTOGRAM_EDGES
+from aggregate_bikeshare import TripAggregates
+from cube_bikeshare import StatsCube
+from test_cube_bikeshare import random_trips
+
+class TestDurationSketch(ut.TestCase):
+	def test_quantiles(self):
+		print('='*24+' Testing DurationSketch quantiles ' + '='*24)
+
+		rng = np.random.default_rng(0)
+		seconds = rng.lognormal(6.5, 0.8, 100000)
+		# every bucket value is within ALPHA of the durations it holds
+		self.assertTrue((np.abs(bucket_values(bucket_ids(seconds)) - seconds) <= ALPHA * seconds).all())
+
+		sketch = DurationSketch.from_values(seconds)
+		self.assertEqual(sketch.count(), 100000)
+		for q, value in zip([0.5, 0.9, 0.99], sketch.quantiles([0.5, 0.9, 0.99])):
+			exact = np.quantile(seconds, q, method='lower')
+			self.assertLessEqual(abs(value - exact), ALPHA * exact)
+		self.assertEqual(list(sketch.percentiles()), ['p50', 'p90', 'p99'])
+
+		# sketches of parts merge into the sketch of the whole
+		merged = DurationSketch.from_values(seconds[:30000]).merge(DurationSketch.from_values(seconds[30000:]))
+		self.assertTrue(merged.counts.equals(sketch.counts))
+
+		histogram = sketch.histogram()
+		self.assertEqual(len(histogram), len(HISTOGRAM_EDGES))
+		self.assertEqual(histogram.sum(), 100000)
+		exact = np.bincount(np.searchsorted(HISTOGRAM_EDGES, seconds, side='right') - 1, minlength=len(HISTOGRAM_EDGES))
+		# only durations within 1% of a bin edge may land in the neighbouring bin (each one is off in two bins)
+		self.assertLess(np.abs(histogram - exact).sum(), 2 * 0.01 * len(seconds))
+
+		fence = sketch.outlier_fence()
+		self.assertLessEqual(abs(sketch.outliers() - (seconds > fence).sum()), 0.01 * len(seconds))
+		self.assertEqual(DurationSketch.from_values([0.0, np.nan, 600.0]).count(), 2)
+		self.assertEqual(DurationSketch().quantiles([0.5]), [None])
+		self.assertEqual(DurationSketch().outliers(), 0)
+
+		print('='*24+' END Testing DurationSketch quantiles ' + '='*24 + '\n')
+
+	def test_duration_buckets(self):
+		print('='*24+' Testing duration_buckets() ' + '='*24)
+
+		df = random_trips(3000, 3)
+		counts = duration_buckets(df, city='chicago')
+		self.assertEqual(list(counts.index.names), ['Group', 'Value', 'Bucket'])
+		sketches = group_sketches(counts)
+		self.assertEqual(sketches['All'].count(), 3000)
+		self.assertEqual(sorted(sketches), ['All', 'City', 'Gender', 'User Type'])
+		self.assertTrue(sketches['City']['chicago'].counts.equals(sketches['All'].counts))
+		self.assertEqual(sum(s.count() for s in sketches['Gender'].values()), df['Gender'].notna().sum())
+		subscribers = df.loc[df['User Type'] == 'Subscriber', 'Trip Duration']
+		self.assertTrue(sketches['User Type']['Subscriber'].counts.equals(DurationSketch.from_values(subscribers).counts))
+		self.assertIsNone(duration_buckets(df.drop(columns='Trip Duration')))
+
+		# the cube answers the same distribution as a scan of the filtered trips
+		cube = StatsCube()
+		cube.add_city('chicago', df)
+		stats = cube.query({'chicago'}, {'2', '3'}, {'Monday', 'Sunday'}, range(7, 10))
+		filtered = df[df['Month'].isin([2, 3]) & df['Day of week'].isin(['Monday', 'Sunday']) & df['Start Time'].dt.hour.isin([7, 8, 9])]
+		self.assertEqual(stats.duration_distribution(), TripAggregates.from_frame(filtered, city='chicago').duration_distribution())
+
+		print('='*24+' END Testing duration_buckets() ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest as ut
+from ingest_bikeshare import PartitionStore, partition_paths
+
+class TestPartitionStore(ut.TestCase):
+	def setUp(self):
+		self.tmp = tempfile.mkdtemp()
+		self.built = []
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp)
+
+	def write(self, name, text):
+		path = os.path.join(self.tmp, 'data', name)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(path, 'w') as f:
+			f.write(text)
+		return path
+
+	def build(self, path):
+		self.built.append(os.path.basename(path))
+		with open(path) as f:
+			text = f.read()
+		return {'text': text} if text else None
+
+	def test_partition_paths(self):
+		print('='*24+' Testing partition_paths() ' + '='*24)
+
+		b = self.write('2017-02.csv', 'b')
+		a = self.write('2017-01.csv', 'a')
+		self.write('notes.txt', '')
+		self.assertEqual(partition_paths(os.path.dirname(a)), [a, b])
+		self.assertEqual(partition_paths(a), [a])
+		self.assertEqual(partition_paths([b, a]), [b, a])
+
+		print('='*24+' END Testing partition_paths() ' + '='*24 + '\n')
+
+	def test_refresh(self):
+		print('='*24+' Testing PartitionStore.refresh() ' + '='*24)
+
+		store = PartitionStore(os.path.join(self.tmp, 'partials'), '2024')
+		paths = [self.write('2017-01.csv', 'a'), self.write('2017-02.csv', '')]
+		partials, built = store.refresh(paths, self.build)
+		self.assertEqual(partials, [{'text': 'a'}])
+		self.assertEqual(built, paths)
+
+		# only new and changed partitions are built again
+		paths.append(self.write('2017-03.csv', 'c'))
+		partials, built = store.refresh(paths, self.build)
+		self.assertEqual(partials, [{'text': 'a'}, {'text': 'c'}])
+		self.assertEqual(built, paths[2:])
+
+		self.write('2017-01.csv', 'aa')
+		# an entry another process is still writing
+		in_flight = store.entry_path(paths[0]) + '.tmp{}'.format(os.getpid() + 1)
+		with open(in_flight, 'w') as f:
+			f.write('partial')
+		partials, built = store.refresh(paths, self.build)
+		self.assertEqual(partials, [{'text': 'aa'}, {'text': 'c'}])
+		self.assertEqual(built, paths[:1])
+		self.assertTrue(os.path.exists(in_flight))
+		os.remove(in_flight)
+		self.assertEqual(len(os.listdir(store.store_dir)), 3)
+
+		# entries are also keyed by the tag
+		_, built = PartitionStore(store.store_dir, '2025').refresh(paths, self.build)
+		self.assertEqual(built, paths)
+		self.assertEqual(self.built, ['2017-01.csv', '2017-02.csv', '2017-03.csv', '2017-01.csv', '2017-01.csv', '2017-02.csv', '2017-03.csv'])
+
+		print('='*24+' END Testing PartitionStore.refresh() ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
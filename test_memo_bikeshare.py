@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest as ut
+from unittest import mock
+from memo_bikeshare import ResultCache
+from cohort_bikeshare import band_labels
+from test_statistics_bikeshare import write_city_data, CHICAGO_CSV
+from statistics_bikeshare import StatisticsBikeshare, main
+
+class TestResultCache(ut.TestCase):
+	def setUp(self):
+		self.tmp = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp)
+
+	def test_get_put(self):
+		print('='*24+' Testing ResultCache get(), put(), evict() ' + '='*24)
+
+		plot = os.path.join(self.tmp, 'age_groups.png')
+		with open(plot, 'wb') as f:
+			f.write(b'x' * 1000)
+		cache = ResultCache(os.path.join(self.tmp, 'results'), max_bytes=3000)
+		# the key does not depend on the order of the parts
+		self.assertEqual(cache.key(cities=['chicago'], months=['1', '2']), ResultCache.key(months=['1', '2'], cities=['chicago']))
+		self.assertNotEqual(cache.key(cities=['chicago'], months=['1']), cache.key(cities=['chicago'], months=['1', '2']))
+
+		self.assertIsNone(cache.get('a'))
+		cache.put('a', {'rows': 1}, {'age_groups': plot})
+		result = cache.get('a')
+		self.assertEqual(result['rows'], 1)
+		with open(result['plots']['age_groups'], 'rb') as f:
+			self.assertEqual(f.read(), b'x' * 1000)
+
+		# b is added after a, but a is used again: b is the least recently used once c does not fit
+		cache.put('b', {'rows': 2}, {'age_groups': plot})
+		past = time.time() - 60
+		os.utime(cache.entry_dir('b'), (past, past))
+		cache.get('a')
+		cache.put('c', {'rows': 3}, {'age_groups': plot})
+		self.assertIsNone(cache.get('b'))
+		self.assertEqual(cache.get('c')['rows'], 3)
+
+		stats = ResultCache(cache.store_dir).stats()
+		self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['entries']), (3, 2, 1, 2))
+		self.assertLessEqual(stats['bytes'], 3000)
+		cache.clear()
+		self.assertEqual(cache.stats()['entries'], 0)
+
+		print('='*24+' END Testing ResultCache get(), put(), evict() ' + '='*24 + '\n')
+
+	def test_run_batch(self):
+		print('='*24+' Testing StatisticsBikeshare result cache ' + '='*24)
+
+		city_data = write_city_data(self.tmp)
+		bike_stat = StatisticsBikeshare()
+		bike_stat.CITY_DATA = city_data
+		bike_stat.cache_dir = os.path.join(self.tmp, 'cache')
+		bike_stat.plot_dir = os.path.join(self.tmp, 'plots')
+		filters = ({'chicago', 'washington'}, {'1', '2', '3', '6'}, set(bike_stat.week_days.values()))
+		first = bike_stat.run_batch(*filters)
+		self.assertFalse(first['memo']['hit'])
+
+		# another process with the same filters and files: nothing is loaded, the plots are copied
+		bike_stat = StatisticsBikeshare()
+		bike_stat.CITY_DATA = city_data
+		bike_stat.cache_dir = os.path.join(self.tmp, 'cache')
+		bike_stat.plot_dir = os.path.join(self.tmp, 'plots-again')
+		with mock.patch.object(StatisticsBikeshare, 'load_tables') as load_tables:
+			second = bike_stat.run_batch(*filters)
+			load_tables.assert_not_called()
+		self.assertTrue(second['memo']['hit'])
+		self.assertEqual(second['stats'], first['stats'])
+		self.assertEqual(second['scan_counts'], first['scan_counts'])
+		self.assertEqual(sorted(os.listdir(bike_stat.plot_dir)), ['age_groups.png', 'gender_month.png'])
+		self.assertEqual((second['memo']['hits'], second['memo']['misses']), (1, 1))
+
+		# other age bands draw another age plot: a miss, not a copy of the cached one
+		bike_stat.age_bands = [25, 40]
+		bike_stat.plot_dir = os.path.join(self.tmp, 'plots-bands')
+		banded = bike_stat.run_batch(*filters)
+		self.assertFalse(banded['memo']['hit'])
+		self.assertLessEqual({cohort['Age Band'] for cohort in banded['stats']['age_cohorts']}, set(band_labels([25, 40])))
+		with open(os.path.join(self.tmp, 'plots', 'age_groups.png'), 'rb') as f, open(os.path.join(bike_stat.plot_dir, 'age_groups.png'), 'rb') as g:
+			self.assertNotEqual(f.read(), g.read())
+		self.assertTrue(bike_stat.run_batch(*filters)['memo']['hit'])
+		bike_stat.age_bands = None
+
+		# a changed data file is a miss
+		with open(bike_stat.CITY_DATA['chicago'], 'a') as f:
+			f.write(CHICAGO_CSV.splitlines()[1].replace('0,', '4,', 1) + '\n')
+		third = bike_stat.run_batch(*filters)
+		self.assertFalse(third['memo']['hit'])
+		self.assertEqual(third['stats']['rows'], first['stats']['rows'] + 1)
+
+		json_path = os.path.join(self.tmp, 'out.json')
+		self.assertEqual(main(['--data-dir', self.tmp, '--cities', 'c', 'w', '--cache-dir', os.path.join(self.tmp, 'cache'), '--no-memo', '--json', json_path]), 0)
+		with open(json_path) as f:
+			self.assertNotIn('memo', json.load(f))
+
+		print('='*24+' END Testing StatisticsBikeshare result cache ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
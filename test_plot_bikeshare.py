@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest as ut
+import pandas as pd
+from matplotlib.figure import Figure
+from plot_bikeshare import PlotRenderer, draw_age_groups, draw_gender_month
+from cohort_bikeshare import cohort_table
+
+DF_AGE = cohort_table(pd.DataFrame({'sum': [600.0, 500.0, 700.0, 800.0, 900.0], 'count': [1, 1, 1, 1, 1]},
+                                   index=pd.MultiIndex.from_arrays([[25, 30, 45, 60, 90], [1, 1, 2, 3, 6]], names=['Age', 'Month'])))
+
+DF_GENDER = pd.DataFrame({'Gender': ['Female', 'Male', 'Female'], 'Month': [1, 1, 2], 'Trip Duration': [600.0, 500.0, 700.0]})
+
+class TestPlots(ut.TestCase):
+	def test_draw(self):
+		print('='*24+' Testing draw_age_groups() ' + '='*24)
+
+		ax = draw_age_groups(Figure(), DF_AGE).axes[0]
+		# the band bounds belong to the upper band: no age is left out
+		self.assertEqual([line.get_label() for line in ax.lines], ['age < 30', '30 <= age < 60', '60 <= age < 90', 'age >= 90'])
+		self.assertEqual([list(line.get_ydata()) for line in ax.lines], [[600.0], [500.0, 700.0], [800.0], [900.0]])
+
+		ax = draw_gender_month(Figure(), DF_GENDER).axes[0]
+		self.assertEqual([list(line.get_xdata()) for line in ax.lines], [[1, 2], [1]])
+
+		print('='*24+' END Testing draw_age_groups() ' + '='*24 + '\n')
+
+	def test_renderer(self):
+		print('='*24+' Testing PlotRenderer ' + '='*24)
+
+		tmp = tempfile.mkdtemp()
+		try:
+			renderer = PlotRenderer(workers=2)
+			futures = [renderer.submit('age_groups', DF_AGE, os.path.join(tmp, str(i), 'age_groups.png')) for i in range(3)]
+			futures.append(renderer.submit('gender_month', DF_GENDER, os.path.join(tmp, 'gender_month.png')))
+			paths = renderer.wait()
+			self.assertEqual(paths, [future.result() for future in futures])
+			for path in paths:
+				with open(path, 'rb') as f:
+					self.assertEqual(f.read(8), b'\x89PNG\r\n\x1a\n')
+
+			renderer.submit('unknown', DF_AGE, os.path.join(tmp, 'unknown.png'))
+			self.assertRaises(KeyError, renderer.wait)
+			renderer.close()
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing PlotRenderer ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,99 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest as ut
+from unittest import mock
+import numpy as np
+import pandas as pd
+from rollup_bikeshare import StationRollup, main
+from test_cube_bikeshare import random_trips
+from test_statistics_bikeshare import write_city_data
+from statistics_bikeshare import main as statistics_main
+
+class TestStationRollup(ut.TestCase):
+	def test_from_frame(self):
+		print('='*24+' Testing StationRollup.from_frame() ' + '='*24)
+
+		df = random_trips(3000, 1)
+		df['End Time'] = df['Start Time'] + pd.to_timedelta(df['Trip Duration'], unit='s')
+		rollup = StationRollup.from_frame(df)
+		self.assertEqual(list(rollup.stations), ['A', 'B', 'C', 'D', 'E'])
+		self.assertEqual(rollup.departures.shape, (5, 7, 24))
+		self.assertEqual(rollup.departures.dtype, np.int32)
+		self.assertEqual(int(rollup.departures.sum()), 3000)
+
+		# departures of B at 8am on weekdays, by brute force
+		start = df['Start Time']
+		expected = ((df['Start Station'] == 'B') & (start.dt.hour == 8) & (start.dt.weekday < 5)).sum()
+		weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+		self.assertEqual(rollup.counts('departures', weekdays, [8])['B'], expected)
+		# arrivals are counted at the end time
+		end = df['End Time']
+		self.assertEqual(rollup.counts('arrivals', ['Sunday'], [23])['C'], ((df['End Station'] == 'C') & (end.dt.weekday == 6) & (end.dt.hour == 23)).sum())
+
+		profile = rollup.station_profile('A', days=['Saturday'])
+		self.assertEqual(list(profile), [((df['Start Station'] == 'A') & (start.dt.weekday == 5) & (start.dt.hour == h)).sum() for h in range(24)])
+		self.assertEqual(rollup.busiest_hour('A', days=['Saturday']), int(np.argmax(profile.to_numpy())))
+		self.assertEqual(rollup.top_stations(2).index.tolist(), df['Start Station'].value_counts().index[:2].tolist())
+		self.assertEqual(int(rollup.net_flow().sum()), 0)
+		with self.assertRaises(KeyError):
+			rollup.station_profile('Z')
+
+		self.assertEqual(len(StationRollup.from_frame(df.drop(columns='Start Station')).stations), 0)
+
+		print('='*24+' END Testing StationRollup.from_frame() ' + '='*24 + '\n')
+
+	def test_merge_save_load(self):
+		print('='*24+' Testing StationRollup.merge(), save(), load() ' + '='*24)
+
+		df = random_trips(2000, 2)
+		whole = StationRollup.from_frame(df)
+		# chunks with different station sets merge into the rollup of the whole frame
+		merged = StationRollup.merge_all(StationRollup.from_frame(chunk) for chunk in (df[df['Start Station'] < 'C'], df[df['Start Station'] >= 'C']))
+		self.assertTrue(merged.stations.equals(whole.stations))
+		self.assertTrue((merged.departures == whole.departures).all() and (merged.arrivals == whole.arrivals).all())
+
+		tmp = tempfile.mkdtemp()
+		try:
+			path = whole.save(os.path.join(tmp, 'rollups', 'chicago.npz'))
+			loaded = StationRollup.load(path)
+			self.assertEqual(list(loaded.stations), list(whole.stations))
+			self.assertTrue((loaded.arrivals == whole.arrivals).all())
+			self.assertEqual(loaded.top_stations(3).to_dict(), whole.top_stations(3).to_dict())
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing StationRollup.merge(), save(), load() ' + '='*24 + '\n')
+
+	def test_main(self):
+		print('='*24+' Testing rollup main() ' + '='*24)
+
+		tmp = tempfile.mkdtemp()
+		try:
+			write_city_data(tmp)
+			path = os.path.join(tmp, 'rollup.npz')
+			out = os.path.join(tmp, 'out.json')
+			self.assertEqual(statistics_main(['--data-dir', tmp, '--no-cache', '--cities', 'c', 'w', '--quiet', '--rollup', path, '--json', out]), 0)
+			with open(out) as f:
+				self.assertEqual(json.load(f)['rollup'], path)
+
+			with mock.patch('builtins.print') as mocked_print:
+				self.assertEqual(main([path, '--station', 'C', '--days', 'f', 's']), 0)
+			result = json.loads(mocked_print.call_args[0][0])
+			# C: Friday 17:15 and Saturday 17:40 departures
+			self.assertEqual(result['busiest_hour'], 17)
+			self.assertEqual(result['by_hour'][17], 2)
+
+			with mock.patch('builtins.print') as mocked_print:
+				self.assertEqual(main([path, '--top', '2', '--hours', '8', '--days', 'wdays', '--arrivals']), 0)
+			# only the Monday 8:00-8:10 trip arrives on a weekday at 8am
+			self.assertEqual(json.loads(mocked_print.call_args[0][0])['top_stations'], {'B': 1})
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing rollup main() ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,147 @@
+import os
+import shutil
+import tempfile
+import unittest as ut
+from unittest import mock
+import numpy as np
+import pandas as pd
+from sample_bikeshare import Reservoir, MappedUnit, allocate, mode_agreement, estimate, refine
+from aggregate_bikeshare import TripAggregates
+from cache_bikeshare import compact_frame
+from test_cube_bikeshare import random_trips
+from test_statistics_bikeshare import write_city_data
+from statistics_bikeshare import StatisticsBikeshare, main
+
+class TestSample(ut.TestCase):
+	def test_reservoir(self):
+		print('='*24+' Testing Reservoir ' + '='*24)
+
+		rows = pd.DataFrame({'id': np.arange(10000)})
+		reservoir = Reservoir(500, np.random.default_rng(0))
+		for first in range(0, 10000, 700):
+			reservoir.add(rows.iloc[first:first + 700])
+		self.assertEqual(reservoir.population, 10000)
+		self.assertEqual(len(reservoir.draw(500)), 500)
+		self.assertEqual(reservoir.draw(500)['id'].nunique(), 500)
+		# the first rows kept are a sample of their own, from every part of the stream
+		self.assertTrue(reservoir.draw(100)['id'].equals(reservoir.rows['id'].iloc[:100]))
+		self.assertLess(abs(reservoir.draw(500)['id'].mean() - 5000), 500)
+
+		# a reservoir larger than the stream keeps every row
+		reservoir = Reservoir(20000, np.random.default_rng(0))
+		reservoir.add(rows.iloc[:3000])
+		reservoir.add(rows.iloc[3000:])
+		self.assertEqual(sorted(reservoir.draw(20000)['id']), list(range(10000)))
+
+		print('='*24+' END Testing Reservoir ' + '='*24 + '\n')
+
+	def test_allocate(self):
+		print('='*24+' Testing allocate(), MappedUnit ' + '='*24)
+
+		rng = np.random.default_rng(1)
+		populations = [100, 5000, 0, 2500, 2400]
+		sizes = allocate(populations, 1000, rng=rng)
+		self.assertEqual(sizes.sum(), 1000)
+		self.assertTrue((sizes <= populations).all())
+		self.assertEqual(sizes[2], 0)
+
+		# strata get shares proportional to their rows: a 5100 rows, b 4900 rows
+		sizes = allocate(populations, 1000, ['a', 'a', 'b', 'b', 'b'], rng)
+		self.assertEqual((sizes[:2].sum(), sizes[2:].sum()), (510, 490))
+		self.assertEqual(list(allocate(populations, 10**6, ['a', 'a', 'b', 'b', 'b'], rng)), populations)
+		self.assertEqual(list(allocate([], 10, rng=rng)), [])
+
+		df = pd.DataFrame({'id': np.arange(100)})
+		unit = MappedUnit(df, [10, 50, 90], [20, 55, 100], rng)
+		self.assertEqual(unit.population, 25)
+		self.assertEqual(sorted(unit.draw(25)['id']), list(range(10, 20)) + list(range(50, 55)) + list(range(90, 100)))
+		drawn = unit.draw(10)['id']
+		self.assertEqual(drawn.nunique(), 10)
+		self.assertTrue(drawn.is_monotonic_increasing)
+
+		print('='*24+' END Testing allocate(), MappedUnit ' + '='*24 + '\n')
+
+	def test_estimate(self):
+		print('='*24+' Testing estimate(), mode_agreement(), refine() ' + '='*24)
+
+		# a clear mode is the population's almost surely, a tie is a coin flip
+		self.assertGreater(mode_agreement(pd.Series([600, 300, 100])), 0.99)
+		self.assertAlmostEqual(mode_agreement(pd.Series([500, 500])), 0.5)
+		self.assertEqual(mode_agreement(pd.Series([7])), 1.0)
+		self.assertEqual(mode_agreement(pd.Series([600, 400]), fpc=0), 1.0)
+
+		df = compact_frame(random_trips(20000, 3))
+		exact = TripAggregates.from_frame(df)
+		sample = df.sample(2000, random_state=0)
+		summary = estimate(TripAggregates.from_frame(sample), sample['Trip Duration'], len(df))
+		self.assertEqual((summary['population'], summary['sample_rows']), (20000, 2000))
+		self.assertEqual(set(summary['modes']), {'hour', 'month', 'weekday', 'start_station', 'end_station', 'trip', 'birth_year'})
+		refined = refine(summary, exact)
+		self.assertTrue(refined['mean_duration']['covered'])
+		self.assertTrue(refined['total_duration']['covered'])
+		self.assertTrue(all(compared['covered'] for compared in refined['user_types'].values()))
+
+		# a sample of every row is exact: the intervals collapse and every mode agrees
+		summary = estimate(exact, df['Trip Duration'], len(df))
+		self.assertAlmostEqual(summary['mean_duration']['low'], exact.mean_duration(), places=6)
+		self.assertAlmostEqual(summary['mean_duration']['high'], exact.mean_duration(), places=6)
+		refined = refine(summary, exact)
+		self.assertTrue(all(compared['agreed'] for compared in refined['modes'].values()))
+		self.assertTrue(all(compared['covered'] for compared in refined['genders'].values()))
+
+		print('='*24+' END Testing estimate(), mode_agreement(), refine() ' + '='*24 + '\n')
+
+
+class TestQuickLook(ut.TestCase):
+	def setUp(self):
+		self.tmp = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp)
+
+	def test_run_batch(self):
+		print('='*24+' Testing StatisticsBikeshare quick look ' + '='*24)
+
+		city_data = write_city_data(self.tmp)
+		filters = ({'chicago', 'washington'}, {'1', '2', '3', '6'}, set(StatisticsBikeshare.week_days.values()))
+		for cache_dir in (None, os.path.join(self.tmp, 'cache')):
+			bike_stat = StatisticsBikeshare()
+			bike_stat.CITY_DATA = city_data
+			bike_stat.cache_dir = cache_dir
+			exact = bike_stat.run_batch(*filters)
+
+			# a sample larger than the rows holds all of them: the quick look is exact
+			bike_stat.sample_size, bike_stat.stratified, bike_stat.refine = 1000, cache_dir is None, True
+			results = bike_stat.run_batch(*filters)
+			summary = results['sample']
+			self.assertEqual(summary['population'], exact['stats']['rows'])
+			self.assertEqual(summary['sample_rows'], exact['stats']['rows'])
+			self.assertTrue(all(compared['agreed'] for compared in summary['refined']['modes'].values()))
+			self.assertTrue(summary['refined']['mean_duration']['covered'])
+			self.assertEqual(results['stats'], exact['stats'])
+
+			# a smaller sample still estimates the statistics of every row kept
+			bike_stat.sample_size, bike_stat.refine = 4, False
+			bike_stat.run_batch(*filters)
+			self.assertEqual(bike_stat.aggregate().rows, 4)
+			self.assertEqual(bike_stat.sample_estimate['population'], exact['stats']['rows'])
+			self.assertEqual(bike_stat.scan_counts, exact['scan_counts'])
+
+		# files without a cache entry are streamed through reservoirs, not parsed whole into new entries
+		bike_stat.cache_dir = os.path.join(self.tmp, 'cold')
+		with mock.patch('cache_bikeshare.ColumnarCache.store') as store:
+			bike_stat.run_batch(*filters)
+			store.assert_not_called()
+		self.assertEqual(bike_stat.sample_estimate['population'], exact['stats']['rows'])
+		self.assertFalse(os.path.exists(bike_stat.cache_dir))
+
+		with self.assertRaises(SystemExit):
+			main(['--refine'])
+		with self.assertRaises(SystemExit):
+			main(['--sample', '0'])
+
+		print('='*24+' END Testing StatisticsBikeshare quick look ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,69 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest as ut
+from urllib.error import HTTPError
+from urllib.request import urlopen
+from statistics_bikeshare import StatisticsBikeshare
+from server_bikeshare import LRUCache, StatsService, make_server
+from test_statistics_bikeshare import write_city_data
+
+class TestServer(ut.TestCase):
+	def test_lru_cache(self):
+		print('='*24+' Testing LRUCache ' + '='*24)
+
+		cache = LRUCache(2)
+		cache.put('a', 1)
+		cache.put('b', 2)
+		self.assertEqual(cache.get('a'), 1)
+		cache.put('c', 3)
+		self.assertIsNone(cache.get('b'))
+		self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+		self.assertEqual(cache.stats(), {'size': 2, 'maxsize': 2, 'hits': 3, 'misses': 1})
+
+		print('='*24+' END Testing LRUCache ' + '='*24 + '\n')
+
+	def test_server(self):
+		print('='*24+' Testing the query server ' + '='*24)
+
+		tmp = tempfile.mkdtemp()
+		try:
+			bike_stat = StatisticsBikeshare()
+			bike_stat.CITY_DATA = write_city_data(tmp)
+			bike_stat.cache_dir = os.path.join(tmp, 'cache')
+			server = make_server(StatsService(bike_stat, {'chicago', 'washington'}), port=0, quiet=True)
+			threading.Thread(target=server.serve_forever, daemon=True).start()
+			url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+			def get(path):
+				with urlopen(url + path) as response:
+					return json.load(response)
+
+			result = get('/stats?cities=c,w&months=1+6&days=a')
+			batch = StatisticsBikeshare()
+			batch.CITY_DATA = bike_stat.CITY_DATA
+			batch.cache_dir = bike_stat.cache_dir
+			batch.load_data({'chicago', 'washington'}, {'1', '6'}, set(batch.week_days.values()))
+			self.assertEqual(result['stats'], json.loads(json.dumps(batch.aggregate().to_dict())))
+			self.assertEqual(get('/stats?cities=w+c&months=6+1')['stats'], result['stats'])
+			self.assertEqual(get('/health')['cache']['hits'], 1)
+
+			self.assertEqual(get('/stats?hours=17-18&end=2017-06-23')['stats']['rows'], 1)
+			self.assertEqual(get('/stats?dates=2017-06-24')['stats']['rows'], 2)
+
+			for path, status in (('/stats?cities=x', 400), ('/stats?cities=n', 400), ('/stats?hours=9-7', 400), ('/nothing', 404)):
+				with self.assertRaises(HTTPError) as error:
+					get(path)
+				self.assertEqual(error.exception.code, status)
+			server.shutdown()
+			server.server_close()
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing the query server ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,86 @@
+import unittest as ut
+import numpy as np
+import pandas as pd
+from sketch_bikeshare import compact, certain_mode
+from aggregate_bikeshare import TripAggregates, add_partials
+
+def skewed_counts(n, n_values, seed):
+	"""Counts of n Zipf-distributed draws over n_values values."""
+	rng = np.random.default_rng(seed)
+	draws = np.minimum(rng.zipf(1.3, n), n_values) - 1
+	counts = np.bincount(draws, minlength=n_values)
+	return pd.Series(counts, index=['S{:04d}'.format(i) for i in range(n_values)]).loc[lambda s: s > 0]
+
+class TestSketch(ut.TestCase):
+	def test_compact(self):
+		print('='*24+' Testing compact() ' + '='*24)
+
+		true = skewed_counts(50000, 2000, 0)
+		kept, error = compact(true, 50)
+		self.assertLessEqual(len(kept), 50)
+		self.assertLessEqual(error, true.sum() / 51)
+		estimate = kept.reindex(true.index, fill_value=0)
+		self.assertTrue(((estimate <= true) & (true <= estimate + error)).all())
+		self.assertEqual(kept.idxmax(), true.idxmax())
+		self.assertTrue(certain_mode(kept, error))
+
+		# small inputs are kept exactly
+		kept, error = compact(true.head(10), 50)
+		self.assertTrue(kept.equals(true.head(10)))
+		self.assertEqual(error, 0)
+		self.assertTrue(certain_mode(pd.Series([2, 2], index=['a', 'b']), 0))
+		self.assertFalse(certain_mode(pd.Series([5, 4], index=['a', 'b']), 3))
+
+		print('='*24+' END Testing compact() ' + '='*24 + '\n')
+
+	def test_merge(self):
+		print('='*24+' Testing merged summaries ' + '='*24)
+
+		parts = [skewed_counts(20000, 1500, seed) for seed in range(5)]
+		true = parts[0]
+		for part in parts[1:]:
+			true = add_partials(true, part)
+
+		merged, error = None, 0
+		for part in parts:
+			kept, deducted = compact(part, 40)
+			merged, recompacted = compact(add_partials(merged, kept), 40)
+			error += deducted + recompacted
+		self.assertLessEqual(error, true.sum() / 41)
+		estimate = merged.reindex(true.index, fill_value=0)
+		self.assertTrue(((estimate <= true) & (true <= estimate + error)).all())
+
+		print('='*24+' END Testing merged summaries ' + '='*24 + '\n')
+
+	def test_trip_aggregates(self):
+		print('='*24+' Testing TripAggregates.sketch() ' + '='*24)
+
+		rng = np.random.default_rng(1)
+		n = 30000
+		stations = np.array(['S{:03d}'.format(i) for i in range(300)], dtype=object)
+		df = pd.DataFrame({
+			'Start Time': pd.Timestamp('2017-01-01') + pd.to_timedelta(rng.integers(0, 180 * 86400, n), unit='s'),
+			'Start Station': stations[np.minimum(rng.zipf(1.5, n), 300) - 1],
+			'End Station': stations[np.minimum(rng.zipf(1.5, n), 300) - 1],
+		})
+		exact = TripAggregates.from_frame(df)
+		chunks = [TripAggregates.from_frame(df.iloc[i:i + 5000], capacity=20) for i in range(0, n, 5000)]
+		approx = TripAggregates.merge_all(chunks)
+
+		self.assertEqual(approx.capacity, 20)
+		for name in ('start_station', 'end_station', 'trip'):
+			true = getattr(exact, name)
+			estimate = getattr(approx, name).reindex(true.index, fill_value=0)
+			self.assertLessEqual(len(getattr(approx, name)), 20)
+			self.assertTrue(((estimate <= true) & (true <= estimate + approx.errors[name])).all())
+		self.assertEqual(approx.most_common_start_station(), exact.most_common_start_station())
+		self.assertTrue(approx.hour.equals(exact.hour))
+		summary = approx.to_dict()
+		self.assertEqual(summary['approximate']['capacity'], 20)
+		self.assertNotIn('approximate', exact.to_dict())
+
+		print('='*24+' END Testing TripAggregates.sketch() ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
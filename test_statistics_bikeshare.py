@@ -1,7 +1,34 @@
+import os
+import json
+import datetime
+import shutil
+import tempfile
 import unittest as ut
 from unittest import mock
 from statistics_bikeshare import StatisticsBikeshare
 from statistics_bikeshare import InvalidInput
+from statistics_bikeshare import main
+
+CHICAGO_CSV = """,Start Time,End Time,Trip Duration,Start Station,End Station,User Type,Gender,Birth Year
+0,2017-01-02 08:00:00,2017-01-02 08:10:00,600.0,A,B,Subscriber,Male,1980.0
+1,2017-03-04 09:30:00,2017-03-04 09:50:00,1200.0,B,C,Customer,,
+2,2017-06-23 17:15:00,2017-06-23 17:20:00,300.0,C,A,Subscriber,Female,1992.0
+3,2017-06-24 17:40:00,2017-06-24 17:50:00,600.0,C,A,Subscriber,Male,1992.0
+"""
+
+WASHINGTON_CSV = """,Start Time,End Time,Trip Duration,Start Station,End Station,User Type
+0,2017-06-24 08:00:00,2017-06-24 08:20:00,1200.0,X,Y,Subscriber
+1,2017-02-06 12:00:00,2017-02-06 12:05:00,300.0,Y,X,Customer
+"""
+
+def write_city_data(tmp):
+	"""Writes two small city CSVs to tmp and returns a CITY_DATA mapping."""
+	city_data = {}
+	for city, data in (('chicago', CHICAGO_CSV), ('washington', WASHINGTON_CSV)):
+		city_data[city] = os.path.join(tmp, city + '.csv')
+		with open(city_data[city], 'w') as f:
+			f.write(data)
+	return city_data
 
 class TestStatisticsBikeshare(ut.TestCase):
 	@mock.patch('statistics_bikeshare.input', create=True)
@@ -171,6 +198,389 @@ class TestStatisticsBikeshare(ut.TestCase):
 
 		print('='*24+' END Testing secure_input() ' + '='*24)
 
+	def test_load_data(self):
+		print('='*24+' Testing load_data() ' + '='*24)
+
+		tmp = tempfile.mkdtemp()
+		try:
+			bike_stat = StatisticsBikeshare()
+			bike_stat.CITY_DATA = write_city_data(tmp)
+			bike_stat.cache_dir = os.path.join(tmp, 'cache')
+			bike_stat.chunksize = 2
+
+			for _ in range(2):
+				df = bike_stat.load_data({'chicago', 'washington'}, {'6'}, {'Friday', 'Saturday'})
+				self.assertEqual(len(df), 3)
+				self.assertEqual(sorted(df['Trip Duration']), [300.0, 600.0, 1200.0])
+				self.assertEqual(sorted(df['Age'].dropna()), [bike_stat.to_age(1992)] * 2)
+				self.assertEqual(bike_stat.scan_counts, {'chicago': {'scanned': 4, 'kept': 2}, 'washington': {'scanned': 2, 'kept': 1}})
+
+			self.assertEqual(str(df['Month'].dtype), 'int8')
+			self.assertEqual(str(df['Trip Duration'].dtype), 'float32')
+			self.assertEqual(str(df['Age'].dtype), 'Int16')
+			for col in ('Day of week', 'Start Station', 'End Station', 'User Type', 'Gender'):
+				self.assertEqual(str(df[col].dtype), 'category')
+			self.assertTrue(0 < bike_stat.memory_usage['after'])
+
+			bike_stat.cache_dir = None
+			bike_stat.reference_date = datetime.date(2017, 12, 31)
+			df = bike_stat.load_data({'chicago', 'washington'}, {'1', '3', '6'}, {'Monday', 'Saturday'})
+			self.assertEqual(sorted(df['Start Station'].astype(str)), ['A', 'B', 'C', 'X'])
+			self.assertEqual(str(df['Start Station'].dtype), 'category')
+			self.assertEqual(list(df['Start Station'].cat.categories), list(df['End Station'].cat.categories))
+			self.assertEqual(sorted(df['Age'].dropna()), [25, 37])
+			self.assertTrue(bike_stat.memory_usage['after'] < bike_stat.memory_usage['before'])
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing load_data() ' + '='*24 + '\n')
+
+	def test_blank_start_time(self):
+		print('='*24+' Testing rows without a Start Time ' + '='*24)
+
+		tmp = tempfile.mkdtemp()
+		try:
+			bike_stat = StatisticsBikeshare()
+			bike_stat.CITY_DATA = write_city_data(tmp)
+			with open(bike_stat.CITY_DATA['chicago'], 'a') as f:
+				f.write('4,,2017-01-02 08:10:00,600.0,A,B,Subscriber,Male,1980.0\n')
+			filters = ({'chicago', 'washington'}, set(bike_stat.months_num), set(bike_stat.week_days.values()))
+
+			# the row is dropped the same way by every load mode
+			results = []
+			for cache_dir in (None, os.path.join(tmp, 'cache')):
+				bike_stat.cache_dir = cache_dir
+				bike_stat.load_data(*filters)
+				results.append(bike_stat.aggregate().to_dict())
+				results.append(bike_stat.aggregate_streaming(*filters).to_dict())
+				results.append(bike_stat.aggregate_incremental(*filters).to_dict())
+				results.append(bike_stat.batch_stats([filters])[0].to_dict())
+			self.assertEqual(results[0]['rows'], 6)
+			for result in results[1:]:
+				self.assertEqual(result, results[0])
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing rows without a Start Time ' + '='*24 + '\n')
+
+	@mock.patch('matplotlib.pyplot.show')
+	def test_stats(self, mocked_show):
+		print('='*24+' Testing time_stats(), station_stats(), trip_duration_stats(), user_stats() ' + '='*24)
+		from aggregate_bikeshare import TripAggregates
+
+		tmp = tempfile.mkdtemp()
+		try:
+			bike_stat = StatisticsBikeshare()
+			bike_stat.bulk = True
+			bike_stat.CITY_DATA = write_city_data(tmp)
+			bike_stat.cache_dir = os.path.join(tmp, 'cache')
+			bike_stat.load_data({'chicago', 'washington'}, {'1', '2', '3', '4', '5', '6'}, set(bike_stat.week_days.values()))
+
+			with mock.patch('aggregate_bikeshare.TripAggregates.from_frame', wraps=TripAggregates.from_frame) as from_frame:
+				bike_stat.time_stats()
+				bike_stat.station_stats()
+				bike_stat.trip_duration_stats()
+				bike_stat.user_stats()
+				# once per city, for all the stats methods
+				self.assertEqual(from_frame.call_count, 2)
+
+			self.assertEqual(bike_stat.stats.rows, 6)
+			self.assertEqual(bike_stat.stats.most_common_trip(), ('C', 'A'))
+			self.assertEqual(mocked_show.call_count, 2)
+
+			# headless runs without a plot directory draw nothing, so plot_bikeshare (matplotlib) is not imported
+			bike_stat.headless = True
+			with mock.patch.dict('sys.modules', {'plot_bikeshare': None}):
+				self.assertIsNone(bike_stat.show_plot('age_groups', None))
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing stats ' + '='*24 + '\n')
+
+	def test_aggregate_parallel(self):
+		print('='*24+' Testing aggregate_parallel() ' + '='*24)
+
+		tmp = tempfile.mkdtemp()
+		try:
+			bike_stat = StatisticsBikeshare()
+			bike_stat.CITY_DATA = write_city_data(tmp)
+			bike_stat.cache_dir = os.path.join(tmp, 'cache')
+			filters = ({'chicago', 'washington'}, {'1', '2', '6'}, set(bike_stat.week_days.values()))
+
+			bike_stat.load_data(*filters)
+			expected = bike_stat.aggregate()
+			stats = bike_stat.aggregate_parallel(*filters, workers=2)
+
+			self.assertEqual(stats.rows, expected.rows)
+			self.assertEqual(bike_stat.scan_counts, {'chicago': {'scanned': 4, 'kept': 3}, 'washington': {'scanned': 2, 'kept': 2}})
+			self.assertEqual(stats.most_common_trip(), expected.most_common_trip())
+			self.assertEqual(stats.mean_duration(), expected.mean_duration())
+			self.assertEqual(dict(stats.user_type), dict(expected.user_type))
+			self.assertEqual(dict(stats.gender_month_mean()), dict(expected.gender_month_mean()))
+			self.assertEqual(dict(stats.age_month_mean()), dict(expected.age_month_mean()))
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing aggregate_parallel() ' + '='*24 + '\n')
+
+	def test_batch_stats(self):
+		print('='*24+' Testing batch_stats() ' + '='*24)
+
+		tmp = tempfile.mkdtemp()
+		try:
+			bike_stat = StatisticsBikeshare()
+			bike_stat.CITY_DATA = write_city_data(tmp)
+			bike_stat.cache_dir = os.path.join(tmp, 'cache')
+			specs = [({'chicago'}, {'6'}, {'Friday', 'Saturday'}), ({'chicago', 'washington'}, {'1', '2', '6'}, {'Monday', 'Saturday'})]
+
+			with mock.patch.object(bike_stat, 'partition_partials', wraps=bike_stat.partition_partials) as partition_partials:
+				results = bike_stat.batch_stats(specs)
+				self.assertEqual(partition_partials.call_count, 2)
+				# the partials are persisted, so a second batch reads no CSV at all
+				bike_stat.batch_stats(specs)
+				self.assertEqual(partition_partials.call_count, 2)
+
+			for spec, stats in zip(specs, results):
+				bike_stat.load_data(*spec)
+				self.assertEqual(stats.to_dict(), bike_stat.aggregate().to_dict())
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing batch_stats() ' + '='*24 + '\n')
+
+	def test_aggregate_streaming(self):
+		print('='*24+' Testing aggregate_streaming() ' + '='*24)
+
+		tmp = tempfile.mkdtemp()
+		try:
+			bike_stat = StatisticsBikeshare()
+			bike_stat.CITY_DATA = write_city_data(tmp)
+			bike_stat.cache_dir = os.path.join(tmp, 'cache')
+			filters = ({'chicago', 'washington'}, {'1', '2', '6'}, set(bike_stat.week_days.values()))
+			bike_stat.load_data(*filters)
+			expected = bike_stat.aggregate().to_dict()
+
+			for cache_dir in (None, os.path.join(tmp, 'cold'), os.path.join(tmp, 'cache')):
+				bike_stat.cache_dir = cache_dir
+				# at most one row in memory at a time
+				bike_stat.chunksize = 1
+				with mock.patch.object(bike_stat, 'enrich', wraps=bike_stat.enrich) as enrich:
+					stats = bike_stat.aggregate_streaming(*filters)
+					self.assertEqual(enrich.call_count, 5)
+					self.assertTrue(all(len(call.args[0]) <= 1 for call in enrich.call_args_list))
+				self.assertEqual(stats.to_dict(), expected)
+				self.assertTrue(bike_stat.df.empty)
+				self.assertEqual(bike_stat.scan_counts['chicago'], {'scanned': 4, 'kept': 3})
+			# missing cache entries are not built while streaming (that parses whole files at once)
+			self.assertFalse(os.path.exists(os.path.join(tmp, 'cold')))
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing aggregate_streaming() ' + '='*24 + '\n')
+
+	def test_aggregate_incremental(self):
+		print('='*24+' Testing aggregate_incremental() ' + '='*24)
+
+		tmp = tempfile.mkdtemp()
+		try:
+			city_data = write_city_data(tmp)
+			header, *rows = CHICAGO_CSV.splitlines(True)
+			partitions = os.path.join(tmp, 'chicago')
+			os.makedirs(partitions)
+			for name, part in (('2017-01.csv', rows[:1]), ('2017-03.csv', rows[1:2])):
+				with open(os.path.join(partitions, name), 'w') as f:
+					f.write(header + ''.join(part))
+
+			bike_stat = StatisticsBikeshare()
+			bike_stat.CITY_DATA = {'chicago': partitions, 'washington': city_data['washington']}
+			bike_stat.cache_dir = os.path.join(tmp, 'cache')
+			filters = ({'chicago', 'washington'}, {'1', '3', '6'}, set(bike_stat.week_days.values()))
+			bike_stat.aggregate_incremental(*filters)
+			self.assertEqual(bike_stat.refreshed, {'chicago': 2, 'washington': 1})
+			self.assertEqual(bike_stat.stats.rows, 3)
+
+			# a new export is the only partition read; the totals match a full load of all rows
+			with open(os.path.join(partitions, '2017-06.csv'), 'w') as f:
+				f.write(header + ''.join(rows[2:]))
+			stats = bike_stat.aggregate_incremental(*filters)
+			self.assertEqual(bike_stat.refreshed, {'chicago': 1, 'washington': 0})
+			self.assertEqual(bike_stat.scan_counts['chicago'], {'scanned': 4, 'kept': 4})
+
+			bike_stat.CITY_DATA = city_data
+			bike_stat.load_data(*filters)
+			self.assertEqual(stats.to_dict(), bike_stat.aggregate().to_dict())
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing aggregate_incremental() ' + '='*24 + '\n')
+
+	def test_where(self):
+		print('='*24+' Testing time filters (where) ' + '='*24)
+		from timeindex_bikeshare import TimeFilter
+
+		tmp = tempfile.mkdtemp()
+		try:
+			bike_stat = StatisticsBikeshare()
+			bike_stat.CITY_DATA = write_city_data(tmp)
+			bike_stat.cache_dir = os.path.join(tmp, 'cache')
+			filters = ({'chicago', 'washington'}, set(bike_stat.months_num), set(bike_stat.week_days.values()))
+
+			bike_stat.load_data(*filters)
+			self.assertTrue(bike_stat.df['Start Time'].is_monotonic_increasing)
+			evening = bike_stat.select(TimeFilter(hours=[(17, 24)]))
+			self.assertEqual(list(evening['Start Station'].astype(str)), ['C', 'C'])
+
+			# the same filter while scanning, from the CSVs, from the cache and from the persisted partials
+			bike_stat.where = TimeFilter(hours=[(8, 10)])
+			for cache_dir in (None, bike_stat.cache_dir):
+				bike_stat.cache_dir = cache_dir
+				bike_stat.load_data(*filters)
+				self.assertEqual(sorted(bike_stat.df['Start Station'].astype(str)), ['A', 'B', 'X'])
+			stats = bike_stat.aggregate().to_dict()
+			self.assertEqual(bike_stat.aggregate_incremental(*filters).to_dict(), stats)
+			self.assertEqual(bike_stat.batch_stats([filters])[0].to_dict(), stats)
+
+			# the persisted partials hold every trip: a later run without the filter is not narrowed by it
+			bike_stat.where = None
+			unfiltered = bike_stat.aggregate_incremental(*filters).to_dict()
+			bike_stat.load_data(*filters)
+			self.assertEqual(unfiltered, bike_stat.aggregate().to_dict())
+			self.assertEqual(unfiltered['rows'], 6)
+
+			bike_stat.where = TimeFilter('2017-06-01', dates=['2017-06-24', '2017-02-06'])
+			bike_stat.load_data(*filters)
+			self.assertEqual(bike_stat.scan_counts['washington'], {'scanned': 2, 'kept': 1})
+			self.assertEqual(len(bike_stat.df), 2)
+			self.assertRaises(ValueError, bike_stat.aggregate_incremental, *filters)
+			self.assertRaises(ValueError, bike_stat.batch_stats, [filters])
+			with self.assertRaises(SystemExit) as exited:
+				main(['--data-dir', tmp, '--grid', '--start', '2017-06-01'])
+			self.assertEqual(exited.exception.code, 2)
+
+			self.assertEqual(main(['--data-dir', tmp, '--cities', 'c', 'w', '--no-cache', '--quiet', '--hours', '16-18', '--end', '2017-06-23', '--json', os.path.join(tmp, 'out.json')]), 0)
+			with open(os.path.join(tmp, 'out.json')) as f:
+				results = json.load(f)
+			self.assertEqual(results['stats']['rows'], 1)
+			self.assertEqual(results['where']['hours'], [[16, 18]])
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing time filters (where) ' + '='*24 + '\n')
+
+	@mock.patch('statistics_bikeshare.input', create=True)
+	def test_show_five_rows(self, mocked_input):
+		print('='*24+' Testing show_five_rows() ' + '='*24)
+
+		tmp = tempfile.mkdtemp()
+		try:
+			bike_stat = StatisticsBikeshare()
+			bike_stat.CITY_DATA = write_city_data(tmp)
+			bike_stat.cache_dir = os.path.join(tmp, 'cache')
+			bike_stat.page_size = 2
+			bike_stat.aggregate_parallel({'chicago', 'washington'}, set(bike_stat.months_num), set(bike_stat.week_days.values()), workers=1)
+			self.assertTrue(bike_stat.df.empty)
+
+			mocked_input.side_effect = ['y', 'asd', 'y', 'n']
+			with mock.patch('builtins.print') as mocked_print:
+				bike_stat.show_five_rows()
+			pages = [call.args[0] for call in mocked_print.call_args_list if 'rows of dataset' in call.args[0]]
+			self.assertEqual(len(pages), 2)
+			self.assertIn('Saturday', pages[1])
+
+			mocked_input.side_effect = ['y'] * 3 + ['y']
+			with mock.patch('builtins.print') as mocked_print:
+				bike_stat.show_five_rows()
+			self.assertIn('No more rows', mocked_print.call_args_list[-1].args[0])
+			# cached rows are sorted by Start Time
+			self.assertEqual(list(bike_stat.browse(4).page(4)['Start Station'].astype(str)), ['Y', 'X'])
+
+			# files without a cache entry are streamed, not parsed whole into new entries
+			bike_stat.cache_dir = os.path.join(tmp, 'cold')
+			with mock.patch('cache_bikeshare.ColumnarCache.store') as store:
+				self.assertEqual(len(bike_stat.browse(4).page(0)), 4)
+				store.assert_not_called()
+			self.assertFalse(os.path.exists(bike_stat.cache_dir))
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing show_five_rows() ' + '='*24 + '\n')
+
+	def test_main(self):
+		print('='*24+' Testing main() ' + '='*24)
+
+		tmp = tempfile.mkdtemp()
+		try:
+			write_city_data(tmp)
+			json_path = os.path.join(tmp, 'out.json')
+			plot_dir = os.path.join(tmp, 'plots')
+			args = ['--data-dir', tmp, '--cache-dir', os.path.join(tmp, 'cache'), '--cities', 'c', '--months', 'a', '--days', 'wends', '--json', json_path, '--plots', plot_dir]
+
+			with mock.patch('statistics_bikeshare.input', create=True) as mocked_input:
+				self.assertEqual(main(args), 0)
+				mocked_input.assert_not_called()
+			with open(json_path) as f:
+				results = json.load(f)
+			self.assertEqual(results['cities'], ['chicago'])
+			self.assertEqual(results['days'], ['Saturday', 'Sunday'])
+			self.assertEqual(results['scan_counts'], {'chicago': {'scanned': 4, 'kept': 2}})
+			self.assertEqual(results['stats']['rows'], 2)
+			self.assertEqual(results['stats']['most_common_trip'], ['B', 'C'])
+			self.assertEqual(results['stats']['user_types'], {'Customer': 1, 'Subscriber': 1})
+			self.assertEqual(sorted(os.listdir(plot_dir)), ['age_groups.png', 'gender_month.png'])
+
+			trace_path = os.path.join(tmp, 'trace.json')
+			self.assertEqual(main(args + ['--no-cache', '--trace', trace_path]), 0)
+			with open(trace_path) as f:
+				spans = {span['path']: span for span in json.load(f)['spans']}
+			self.assertEqual((spans['load_data']['rows_in'], spans['load_data']['rows_out']), (4, 2))
+			self.assertEqual(spans['load_data/load_city:chicago/filter']['rows_out'], 2)
+			for path in ['time_stats/aggregate', 'station_stats', 'trip_duration_stats', 'user_stats/plot_age_groups', 'user_stats/plot_gender_month']:
+				self.assertIn(path, spans)
+
+			streamed_path = os.path.join(tmp, 'streamed.json')
+			self.assertEqual(main(args[:-4] + ['--stream', '--chunksize', '1', '--no-memo', '--json', streamed_path]), 0)
+			with open(streamed_path) as f:
+				self.assertEqual(json.load(f)['stats'], results['stats'])
+
+			self.assertEqual(main(args[:4] + ['--cities', 'c', 'w', '--grid', '--json', json_path, '--plots', os.path.join(tmp, 'grid')]), 0)
+			with open(json_path) as f:
+				results = json.load(f)
+			self.assertEqual(len(results), 2 * 6 * 7)
+			self.assertEqual(sum(result['stats']['rows'] for result in results), 6)
+			plots = [path for result in results for path in result['plots']]
+			self.assertEqual(len(plots), 6)
+			self.assertIn(os.path.join(tmp, 'grid', 'chicago-6-Friday', 'gender_month.png'), plots)
+			self.assertTrue(all(os.path.exists(path) for path in plots))
+
+			# the grid keeps the approximate counts bounded like the other modes
+			self.assertEqual(main(args[:4] + ['--cities', 'c', '--months', '6', '--grid', '--approximate', '1', '--json', json_path]), 0)
+			with open(json_path) as f:
+				results = json.load(f)
+			self.assertTrue(all(result['stats']['approximate']['capacity'] == 1 for result in results))
+			self.assertEqual(max(len(result['stats']['approximate']['max_error']) for result in results), 3)
+
+			with mock.patch('sys.stderr'):
+				self.assertEqual(main(['--data-dir', os.path.join(tmp, 'missing'), '--no-cache', '--quiet']), 1)
+			# empty, malformed and incomplete files and bad date or duration values are reported in one line, without a traceback
+			for name, data in (('empty', ''), ('malformed', 'a,b\n1,2\n1,2,3,4\n'), ('incomplete', 'Trip Duration\n60\n'),
+			                   ('bad_date', CHICAGO_CSV.replace('2017-01-02 08:00:00', 'yesterday', 1)), ('bad_duration', CHICAGO_CSV.replace('600.0', 'ten minutes', 1))):
+				path = os.path.join(tmp, name + '.csv')
+				with open(path, 'w') as f:
+					f.write(data)
+				with mock.patch('sys.stderr') as stderr:
+					self.assertEqual(main(['--city-data', 'chicago', path, '--cities', 'c', '--no-cache', '--no-memo', '--quiet']), 1)
+				message = ''.join(call.args[0] for call in stderr.write.call_args_list)
+				self.assertTrue(message.startswith('Could not read the bikeshare data: '))
+				self.assertEqual(message.count('\n'), 1)
+			with mock.patch('sys.stderr'):
+				with self.assertRaises(SystemExit) as exit_status:
+					main(['--cities', 'x'])
+			self.assertEqual(exit_status.exception.code, 2)
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing main() ' + '='*24 + '\n')
+
 
 if __name__ == '__main__':
     ut.main()
\ No newline at end of file
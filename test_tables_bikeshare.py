@@ -0,0 +1,57 @@
+import unittest as ut
+from tables_bikeshare import TableRegistry
+from aggregate_bikeshare import TripAggregates
+from cache_bikeshare import compact_frame, memory_footprint
+from timeindex_bikeshare import TimeFilter
+from test_cube_bikeshare import random_trips
+
+class TestTableRegistry(ut.TestCase):
+	def setUp(self):
+		self.tables = TableRegistry()
+		self.tables.add('chicago', compact_frame(random_trips(2000, 1)))
+		self.tables.add('washington', compact_frame(random_trips(1000, 2, user_columns=False)))
+
+	def test_schemas(self):
+		print('='*24+' Testing TableRegistry schemas ' + '='*24)
+
+		tables = self.tables
+		self.assertEqual(tables.cities(), ['chicago', 'washington'])
+		self.assertEqual(tables.rows(), 3000)
+		# every city keeps its own columns and dtypes, nothing is padded
+		self.assertNotIn('Gender', tables.schemas['washington'])
+		self.assertEqual(tables.schemas['chicago']['Gender'], 'category')
+		self.assertEqual(tables.schemas['chicago']['Trip Duration'], 'float32')
+		self.assertTrue(tables.has_column('Birth Year'))
+		self.assertFalse(tables.has_column('Bike Id'))
+		self.assertEqual(tables.columns()[:3], ['Start Time', 'Trip Duration', 'Start Station'])
+		self.assertTrue(all(df['Start Time'].is_monotonic_increasing for df in tables.tables.values()))
+
+		union = tables.union()
+		self.assertEqual(len(union), 3000)
+		self.assertTrue(union['Start Time'].is_monotonic_increasing)
+		self.assertEqual(union['Gender'].isna().sum() - tables.tables['chicago']['Gender'].isna().sum(), 1000)
+		self.assertLess(tables.memory_footprint(), memory_footprint(union))
+
+		print('='*24+' END Testing TableRegistry schemas ' + '='*24 + '\n')
+
+	def test_aggregate(self):
+		print('='*24+' Testing TableRegistry.aggregate(), select() ' + '='*24)
+
+		# the merged per-city statistics equal those of the padded union frame (plus the breakdown by city)
+		stats = self.tables.aggregate().to_dict()
+		expected = TripAggregates.from_frame(self.tables.union()).to_dict()
+		self.assertEqual(sorted(stats['duration_distribution'].pop('City')), ['chicago', 'washington'])
+		self.assertEqual(stats, expected)
+
+		mornings = TimeFilter(hours=[(7, 9)], days=['Monday'])
+		selected = self.tables.select(mornings)
+		union = self.tables.union()
+		self.assertEqual(len(selected), int(mornings.mask(union['Start Time']).sum()))
+		self.assertTrue(selected['Start Time'].is_monotonic_increasing)
+		self.assertEqual(TableRegistry().aggregate().rows, 0)
+
+		print('='*24+' END Testing TableRegistry.aggregate(), select() ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,75 @@
+import unittest as ut
+import numpy as np
+import pandas as pd
+from timeindex_bikeshare import TimeFilter, TimeIndex, ranges_positions
+
+def random_trips(n, seed):
+	rng = np.random.default_rng(seed)
+	start = pd.Timestamp('2017-01-01') + pd.to_timedelta(rng.integers(0, 181 * 86400, n), unit='s')
+	return pd.DataFrame({'Start Time': start, 'row': np.arange(n)})
+
+def expected_mask(times, months=None, days=None, start=None, end=None, dates=None, hours=None):
+	"""The filter evaluated with plain boolean masks."""
+	mask = pd.Series(True, index=times.index)
+	if months is not None:
+		mask &= times.dt.month.isin(months)
+	if days is not None:
+		mask &= times.dt.day_name().isin(days)
+	if start is not None:
+		mask &= times >= pd.Timestamp(start)
+	if end is not None:
+		mask &= times < pd.Timestamp(end)
+	if dates is not None:
+		mask &= times.dt.normalize().isin(pd.to_datetime(dates))
+	if hours is not None:
+		mask &= np.logical_or.reduce([(times.dt.hour >= a) & (times.dt.hour < b) for a, b in hours])
+	return mask.to_numpy()
+
+CASES = [
+	{'months': [1, 6], 'days': ['Monday', 'Saturday']},
+	{'start': '2017-02-14 12:30', 'end': '2017-03-01'},
+	{'dates': ['2017-01-02', '2017-05-29', '2017-07-04']},
+	{'hours': [(7, 9), (16, 19)], 'days': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']},
+	{'months': [3], 'hours': [(0, 1)], 'start': '2017-03-10'},
+	{'months': [8]},
+]
+
+class TestTimeIndex(ut.TestCase):
+	def test_filters(self):
+		print('='*24+' Testing TimeFilter and TimeIndex ' + '='*24)
+
+		df = random_trips(20000, 0)
+		index = TimeIndex(df)
+		self.assertTrue(index.df['Start Time'].is_monotonic_increasing)
+		for case in CASES:
+			expected = np.sort(df['row'].to_numpy()[expected_mask(df['Start Time'], **case)])
+			time_filter = TimeFilter(**case)
+			self.assertTrue((np.sort(df['row'].to_numpy()[time_filter.mask(df['Start Time'])]) == expected).all(), case)
+			self.assertEqual(index.count(time_filter), len(expected), case)
+			self.assertEqual(sorted(index.select(time_filter)['row']), list(expected), case)
+			chunks = list(index.chunks(time_filter, chunksize=700))
+			self.assertTrue(all(len(chunk) <= 700 for chunk in chunks))
+			self.assertEqual(sorted(pd.concat(chunks)['row']) if chunks else [], list(expected), case)
+
+		# one contiguous range is a slice, not a copy
+		self.assertEqual(len(index.ranges(TimeFilter('2017-02-01', '2017-03-01'))[0]), 1)
+		self.assertRaises(ValueError, TimeFilter, hours=[(9, 7)])
+
+		print('='*24+' END Testing TimeFilter and TimeIndex ' + '='*24 + '\n')
+
+	def test_from_filters(self):
+		print('='*24+' Testing TimeFilter.from_filters() ' + '='*24)
+
+		where = TimeFilter(months=[1, 2], hours=[(8, 10), (9, 12)])
+		time_filter = TimeFilter.from_filters({'2', '3'}, {'Monday'}, where)
+		self.assertEqual((time_filter.months, time_filter.days, time_filter.hours), ([2], [0], [(8, 12)]))
+		self.assertEqual(time_filter.hour_list(), [8, 9, 10, 11])
+		self.assertFalse(time_filter.has_dates())
+		self.assertTrue(TimeFilter(dates=['2017-07-04']).has_dates())
+		self.assertEqual(list(ranges_positions(np.array([2, 10]), np.array([4, 13]))), [2, 3, 10, 11, 12])
+
+		print('='*24+' END Testing TimeFilter.from_filters() ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
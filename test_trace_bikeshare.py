@@ -0,0 +1,68 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest as ut
+from trace_bikeshare import Tracer, stage
+
+class TestTracer(ut.TestCase):
+	def test_stages(self):
+		print('='*24+' Testing Tracer.stage() ' + '='*24)
+
+		tracer = Tracer()
+		with tracer.stage('load', rows_in=10) as load:
+			for rows in (4, 3):
+				with tracer.stage('filter', rows_in=5) as filtered:
+					filtered.rows_out = rows
+			with tracer.wait():
+				pass
+			load.rows_out = 7
+		self.assertGreaterEqual(load.seconds, 0)
+
+		self.assertEqual(list(tracer.spans), ['load/filter', 'load'])
+		span = tracer.spans['load/filter']
+		self.assertEqual((span['calls'], span['depth'], span['rows_in'], span['rows_out']), (2, 1, 10, 7))
+		self.assertEqual((tracer.spans['load']['rows_in'], tracer.spans['load']['rows_out']), (10, 7))
+		self.assertGreaterEqual(tracer.spans['load']['waited'], 0)
+		self.assertIn('filter', tracer.report())
+
+		# stages of a failing block are still recorded and the stack is unwound
+		with self.assertRaises(ValueError):
+			with tracer.stage('plot'):
+				raise ValueError
+		self.assertEqual(tracer.stack, [])
+		self.assertEqual(tracer.spans['plot']['calls'], 1)
+
+		with stage(None, 'noop', 3) as noop:
+			noop.rows_out = 1
+		self.assertIsNone(noop.seconds)
+
+		print('='*24+' END Testing Tracer.stage() ' + '='*24 + '\n')
+
+	def test_export(self):
+		print('='*24+' Testing Tracer.export() ' + '='*24)
+
+		tmp = tempfile.mkdtemp()
+		try:
+			tracer = Tracer(memory=True, profile=True).start()
+			with tracer.stage('aggregate') as agg:
+				data = list(range(100000))
+				agg.rows_out = len(data)
+			path = os.path.join(tmp, 'trace.json')
+			tracer.export(path)
+			tracer.stop()
+
+			with open(path) as f:
+				trace = json.load(f)
+			self.assertEqual(trace['memory_source'], 'tracemalloc')
+			self.assertEqual([span['name'] for span in trace['spans']], ['aggregate'])
+			self.assertGreater(trace['spans'][0]['memory_delta'], 0)
+			self.assertTrue(os.path.exists(path + '.prof'))
+		finally:
+			shutil.rmtree(tmp)
+
+		print('='*24+' END Testing Tracer.export() ' + '='*24 + '\n')
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,251 @@
+import numpy as np
+import pandas as pd
+
+"""
+Time filters and the sorted time index
+
+A TimeFilter describes which start times to keep: a date range, months, days
+of the week, specific dates (eg. holidays) and hour-of-day windows (eg. the
+7-9am commute). Over the span of some data it expands into a sorted list of
+disjoint [start, end) time intervals (adjacent kept days and hours joined).
+
+TimeIndex keeps a trips frame sorted by Start Time, so the rows of a filter
+are found by binary search of the interval bounds and cut out as slices,
+instead of evaluating boolean masks over whole columns. Unsorted data (eg. a
+CSV chunk) can still be filtered with TimeFilter.mask.
+----------------------------------------
+"""
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+HOUR = np.int64(3600 * 10**9)
+
+# int64 value of NaT (missing times sort first)
+NAT = np.iinfo('int64').min
+
+
+def as_nanoseconds(times):
+    """Start times (datetime Series or array) as int64 nanoseconds since the epoch (NaT becomes the int64 minimum)."""
+    return np.asarray(times, dtype='datetime64[ns]').view('int64')
+
+
+class TimeFilter:
+    """
+    Start time filter. Every criterion left as None keeps everything.
+
+    Parameters:
+        start, end          - first kept time and first time after the range (anything pd.Timestamp accepts),
+
+        months              - month numbers (ints or strings) to keep,
+
+        days                - names of the days of the week to keep,
+
+        dates               - dates to keep (eg. holidays),
+
+        (list) hours        - (first hour, end hour) windows, eg. [(7, 9), (16, 19)] for the commutes
+    """
+
+    def __init__(self, start=None, end=None, months=None, days=None, dates=None, hours=None):
+        self.start = None if start is None else pd.Timestamp(start)
+        self.end = None if end is None else pd.Timestamp(end)
+        self.months = None if months is None else sorted({int(m) for m in months})
+        self.days = None if days is None else sorted({WEEKDAYS.index(d) for d in days})
+        self.dates = None if dates is None else np.unique(np.array([pd.Timestamp(d).date() for d in dates], dtype='datetime64[D]'))
+        self.hours = None if hours is None else self.merge_windows(hours)
+
+    @staticmethod
+    def merge_windows(hours):
+        """Sorted, disjoint version of the (first hour, end hour) windows."""
+        windows = []
+        for first, end in sorted((int(first), int(end)) for first, end in hours):
+            if not 0 <= first < end <= 24:
+                raise ValueError('invalid hour window: {}-{}'.format(first, end))
+            if windows and first <= windows[-1][1]:
+                windows[-1] = (windows[-1][0], max(end, windows[-1][1]))
+            else:
+                windows.append((first, end))
+        return windows
+
+    @classmethod
+    def from_args(cls, start=None, end=None, dates=None, hours=None):
+        """
+        TimeFilter of command line style arguments (raises ValueError on invalid ones).
+
+        Parameters:
+            (str) start, end    - first and last date of the range (end is inclusive),
+
+            (list) dates        - dates to keep,
+
+            (list) hours        - 'first-end' hour windows, eg. ['7-9', '16-19']
+        """
+        return cls(start, None if end is None else pd.Timestamp(end).normalize() + pd.Timedelta(days=1), dates=dates,
+                   hours=None if hours is None else [window.split('-') for window in hours])
+
+    @classmethod
+    def from_filters(cls, months=None, days=None, where=None):
+        """The month and day filters of get_filters (narrowed by the TimeFilter where, if given) as one TimeFilter."""
+        if where is None:
+            return cls(months=months, days=days)
+        time_filter = cls(where.start, where.end, hours=where.hours)
+        time_filter.dates = where.dates
+        time_filter.months = cls.intersect(where.months, None if months is None else sorted({int(m) for m in months}))
+        time_filter.days = cls.intersect(where.days, None if days is None else sorted({WEEKDAYS.index(d) for d in days}))
+        return time_filter
+
+    @staticmethod
+    def intersect(a, b):
+        if a is None or b is None:
+            return b if a is None else a
+        return sorted(set(a) & set(b))
+
+    def to_dict(self):
+        """The criteria as a JSON-serializable dict (None where everything is kept)."""
+        return {'start': None if self.start is None else self.start.isoformat(), 'end': None if self.end is None else self.end.isoformat(),
+                'months': self.months, 'days': None if self.days is None else [WEEKDAYS[d] for d in self.days],
+                'dates': None if self.dates is None else [str(d) for d in self.dates], 'hours': self.hours}
+
+    def has_dates(self):
+        """Whether the filter restricts calendar dates (a range or specific dates), which the (month, weekday, hour) cube cannot answer."""
+        return self.start is not None or self.end is not None or self.dates is not None
+
+    def hour_list(self):
+        """Hours of the day covered by the hour windows."""
+        return list(range(24)) if self.hours is None else [h for first, end in self.hours for h in range(first, end)]
+
+    def intervals(self, first, last):
+        """
+        The kept [start, end) intervals between the times first and last (inclusive).
+
+        Returns:
+            (ndarray) starts, ends  - int64 nanosecond bounds, sorted and disjoint
+        """
+        lo = np.datetime64(pd.Timestamp(first).date(), 'D')
+        hi = np.datetime64(pd.Timestamp(last).date(), 'D')
+        if self.start is not None:
+            lo = max(lo, np.datetime64(self.start.date(), 'D'))
+        if self.end is not None:
+            hi = min(hi, np.datetime64(self.end.date(), 'D'))
+        days = np.arange(lo, hi + 1, dtype='datetime64[D]') if lo <= hi else np.array([], dtype='datetime64[D]')
+
+        keep = np.ones(len(days), dtype=bool)
+        if self.months is not None:
+            keep &= np.isin(days.astype('datetime64[M]').astype('int64') % 12 + 1, self.months)
+        if self.days is not None:
+            # 1970-01-01 was a Thursday
+            keep &= np.isin((days.astype('int64') + 3) % 7, self.days)
+        if self.dates is not None:
+            keep &= np.isin(days, self.dates)
+        days = days[keep].astype('datetime64[ns]').view('int64')
+
+        windows = np.array(self.hours or [(0, 24)], dtype='int64')
+        starts = (days[:, None] + windows[None, :, 0] * HOUR).ravel()
+        ends = (days[:, None] + windows[None, :, 1] * HOUR).ravel()
+        if self.start is not None:
+            starts = np.maximum(starts, self.start.value)
+        if self.end is not None:
+            ends = np.minimum(ends, self.end.value)
+        valid = starts < ends
+        starts, ends = starts[valid], ends[valid]
+
+        if not len(starts):
+            return starts, ends
+        # join adjacent intervals (eg. the days of a range), so they are cut out as one slice
+        breaks = starts[1:] != ends[:-1]
+        return starts[np.concatenate([[True], breaks])], ends[np.concatenate([breaks, [True]])]
+
+    def mask(self, times):
+        """Boolean mask of the kept times (unsorted datetimes are fine)."""
+        times = as_nanoseconds(times)
+        valid = times != NAT
+        if not valid.any():
+            return np.zeros(len(times), dtype=bool)
+        starts, ends = self.intervals(pd.Timestamp(times[valid].min()), pd.Timestamp(times[valid].max()))
+        if not len(starts):
+            return np.zeros(len(times), dtype=bool)
+        i = np.searchsorted(starts, times, side='right') - 1
+        return valid & (i >= 0) & (times < ends[np.maximum(i, 0)])
+
+
+class TimeIndex:
+    """
+    A trips frame sorted by its start times.
+
+    Parameters:
+        (DataFrame) df          - trips frame (sorted by column here unless it already is),
+
+        (str) column            - datetime column the rows are sorted by,
+
+        (bool) assume_sorted    - skip the check (eg. for cache entries, which are stored sorted)
+    """
+
+    def __init__(self, df, column='Start Time', assume_sorted=False):
+        times = as_nanoseconds(df[column])
+        if not assume_sorted and len(times) and not (times[1:] >= times[:-1]).all():
+            order = np.argsort(times, kind='stable')
+            df = df.take(order).reset_index(drop=True)
+            times = times[order]
+        self.df = df
+        self.times = times
+
+    def ranges(self, time_filter):
+        """
+        Row ranges of the kept rows, found by binary search.
+
+        Returns:
+            (ndarray) first, stop   - row positions; the rows first[i]:stop[i] are kept
+        """
+        first_valid = np.searchsorted(self.times, NAT, side='right')
+        if first_valid == len(self.times):
+            return np.array([], dtype='int64'), np.array([], dtype='int64')
+        starts, ends = time_filter.intervals(pd.Timestamp(self.times[first_valid]), pd.Timestamp(self.times[-1]))
+        first = np.searchsorted(self.times, starts, side='left')
+        stop = np.searchsorted(self.times, ends, side='left')
+        keep = first < stop
+        return first[keep], stop[keep]
+
+    def count(self, time_filter):
+        """Number of kept rows (nothing is copied)."""
+        first, stop = self.ranges(time_filter)
+        return int((stop - first).sum())
+
+    def positions(self, time_filter):
+        """Positions of the kept rows, in time order."""
+        first, stop = self.ranges(time_filter)
+        return ranges_positions(first, stop)
+
+    def select(self, time_filter):
+        """The kept rows (a slice of df when they form one range)."""
+        first, stop = self.ranges(time_filter)
+        if len(first) == 1:
+            return self.df.iloc[first[0]:stop[0]]
+        return self.df.take(ranges_positions(first, stop))
+
+    def chunks(self, time_filter, chunksize=100000):
+        """Yields the kept rows in time order, at most chunksize rows at a time (slices wherever possible)."""
+        first, stop = self.ranges(time_filter)
+        pending, size = [], 0
+        for a, b in zip(first.tolist(), stop.tolist()):
+            while a < b:
+                take = min(b - a, chunksize - size)
+                pending.append((a, a + take))
+                size += take
+                a += take
+                if size == chunksize:
+                    yield self.cut(pending)
+                    pending, size = [], 0
+        if pending:
+            yield self.cut(pending)
+
+    def cut(self, ranges):
+        if len(ranges) == 1:
+            return self.df.iloc[ranges[0][0]:ranges[0][1]]
+        return self.df.take(ranges_positions(*np.array(ranges, dtype='int64').T))
+
+
+def ranges_positions(first, stop):
+    """Concatenated np.arange(first[i], stop[i]) of every range, without a Python loop."""
+    lengths = stop - first
+    if not len(lengths):
+        return np.array([], dtype='int64')
+    offsets = np.repeat(first - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(lengths.sum(), dtype='int64') + offsets
@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import time
+import contextlib
+import tracemalloc
+from datetime import datetime
+
+"""
+Pipeline instrumentation
+
+A Tracer records every stage of a run (reading, parsing, filtering, each
+aggregation and plotting) with its monotonic duration, rows in and out and
+memory delta. Stages nest; repeated stages under the same parent (eg. one per
+CSV chunk) are accumulated into one span with a call count. Time spent waiting
+for the user (input() prompts, plot windows) is excluded with Tracer.wait().
+
+Memory deltas come from tracemalloc when the tracer is created with
+memory=True, otherwise from the process RSS where the OS exposes it. With
+profile=True the run is also profiled with cProfile. export() writes the spans
+as a JSON trace file (plus a .prof file with the cProfile stats).
+----------------------------------------
+"""
+
+
+def rss_bytes():
+    """Resident set size of this process, or None where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Stage:
+    """One call of a stage; set rows_out inside the with block, read seconds after it."""
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.seconds = None
+        self.waited = 0.0
+
+
+class Tracer:
+    """Records the stages of one run. See the module docstring."""
+
+    def __init__(self, memory=False, profile=False):
+        self.memory = memory
+        self.profile = None
+        if profile:
+            # imported here: profiling is rare and cProfile is slow to import
+            import cProfile
+            self.profile = cProfile.Profile()
+        self.started = datetime.now()
+        self.origin = time.perf_counter()
+        # path -> span dict, in order of first call
+        self.spans = {}
+        self.stack = []
+        self.running = False
+
+    def start(self):
+        """Starts memory tracing and profiling (if enabled)."""
+        if self.running:
+            return self
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.profile is not None:
+            self.profile.enable()
+        self.running = True
+        return self
+
+    def stop(self):
+        """Stops memory tracing and profiling."""
+        if not self.running:
+            return self
+        if self.profile is not None:
+            self.profile.disable()
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.running = False
+        return self
+
+    def memory_now(self):
+        if self.memory and tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[0]
+        return rss_bytes()
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None):
+        """
+        Times the with block as stage name (nested under the stages that are open).
+
+        Yields the Stage of this call; its seconds exclude the time spent in wait() blocks.
+        """
+        stage = Stage(name, rows_in)
+        path = '/'.join([s.name for s in self.stack] + [name])
+        memory_before = self.memory_now()
+        self.stack.append(stage)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds = time.perf_counter() - start - stage.waited
+            self.stack.pop()
+            memory_after = self.memory_now()
+
+            span = self.spans.get(path)
+            if span is None:
+                span = self.spans[path] = {'path': path, 'name': name, 'depth': len(self.stack), 'start': start - self.origin,
+                                           'calls': 0, 'seconds': 0.0, 'waited': 0.0, 'rows_in': None, 'rows_out': None, 'memory_delta': None}
+            span['calls'] += 1
+            span['seconds'] += stage.seconds
+            span['waited'] += stage.waited
+            for key, value in (('rows_in', stage.rows_in), ('rows_out', stage.rows_out)):
+                if value is not None:
+                    span[key] = (span[key] or 0) + int(value)
+            if memory_before is not None and memory_after is not None:
+                span['memory_delta'] = (span['memory_delta'] or 0) + memory_after - memory_before
+
+    @contextlib.contextmanager
+    def wait(self):
+        """Excludes the with block (eg. a prompt or a plot window) from the durations of the open stages."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            waited = time.perf_counter() - start
+            for stage in self.stack:
+                stage.waited += waited
+
+    def to_dict(self):
+        """The trace as a JSON-serializable dict."""
+        trace = {'started': self.started.isoformat(timespec='seconds'), 'pid': os.getpid(), 'argv': sys.argv,
+                 'memory_source': 'tracemalloc' if self.memory else 'rss', 'spans': list(self.spans.values())}
+        if self.memory and tracemalloc.is_tracing():
+            trace['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+        return trace
+
+    def export(self, path):
+        """Writes the trace to path as JSON, and the cProfile stats (if profiling) to path + '.prof'."""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        if self.profile is not None:
+            self.profile.dump_stats(path + '.prof')
+
+    def report(self):
+        """The spans as a printable table."""
+        lines = ['{:<44} {:>6} {:>10} {:>12} {:>12} {:>10}'.format('stage', 'calls', 'seconds', 'rows in', 'rows out', 'mem MB')]
+        for span in self.spans.values():
+            lines.append('{:<44} {:>6} {:>10.4f} {:>12} {:>12} {:>10}'.format(
+                '  ' * span['depth'] + span['name'], span['calls'], span['seconds'],
+                '' if span['rows_in'] is None else span['rows_in'], '' if span['rows_out'] is None else span['rows_out'],
+                '' if span['memory_delta'] is None else '{:.1f}'.format(span['memory_delta'] / 2**20)))
+        return '\n'.join(lines)
+
+
+def stage(tracer, name, rows_in=None):
+    """tracer.stage(name, rows_in), or a no-op context yielding a bare Stage when tracer is None."""
+    if tracer is None:
+        return contextlib.nullcontext(Stage(name, rows_in))
+    return tracer.stage(name, rows_in)